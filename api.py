@@ -0,0 +1,101 @@
+# api.py
+# Headless async HTTP API over the shared question-answering flow (utils/orchestrator.py), for
+# other channels and services that should not need a Streamlit process per user.
+#
+#   python api.py [--host 0.0.0.0] [--port 8080] [--skip-ingest]
+#
+#   POST /v1/answer  {"question": "...", "chat_mode": "insurance", "mode": "concise", "session_id": "abc"}
+#        -> {"question", "query", "answer", "source", "ok", "timings", "total_seconds"}
+#   GET  /healthz
+#   GET  /metrics    (Prometheus text format)
+#
+# A session_id keeps a rolling conversation so follow-up questions are rewritten to stand alone.
+
+import os
+import asyncio
+import argparse
+from collections import OrderedDict
+from dotenv import load_dotenv
+from aiohttp import web
+from utils.orchestrator import aanswer_question, prepare_corpus
+from utils.conversation import ConversationState
+from utils.tracing import render_prometheus
+from config.clients import aclose_async_clients
+
+load_dotenv()
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "64"))  # questions answered at once
+API_MAX_SESSIONS = int(os.getenv("API_MAX_SESSIONS", "1000"))  # least recently used conversations are dropped
+
+
+class Sessions:
+    """Bounded LRU of session_id -> ConversationState."""
+
+    def __init__(self, max_sessions=API_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.conversations = OrderedDict()
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        conversation = self.conversations.pop(session_id, None) or ConversationState()
+        self.conversations[session_id] = conversation
+        while len(self.conversations) > self.max_sessions:
+            self.conversations.popitem(last=False)
+        return conversation
+
+
+async def answer(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.json_response({"error": "request body must be JSON"}, status=400)
+    question = (body.get("question") or "").strip() if isinstance(body, dict) else ""
+    if not question:
+        return web.json_response({"error": "question is required"}, status=400)
+
+    conversation = request.app["sessions"].get(body.get("session_id"))
+    try:
+        async with request.app["semaphore"]:
+            result = await aanswer_question(question, body.get("chat_mode", "insurance"),
+                                            body.get("mode", "concise"), conversation)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response(result)
+
+
+async def healthz(request):
+    return web.json_response({"status": "ok"})
+
+
+async def metrics(request):
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+def create_app(max_concurrency=API_MAX_CONCURRENCY):
+    app = web.Application()
+    app["semaphore"] = asyncio.Semaphore(max_concurrency)
+    app["sessions"] = Sessions()
+    app.router.add_post("/v1/answer", answer)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+    app.on_cleanup.append(lambda app: aclose_async_clients())
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API for the insurance chatbot.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--max-concurrency", type=int, default=API_MAX_CONCURRENCY)
+    parser.add_argument("--skip-ingest", action="store_true", help="don't sync the embedding index on start")
+    args = parser.parse_args()
+
+    if not args.skip_ingest:
+        prepare_corpus()
+    web.run_app(create_app(args.max_concurrency), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import streamlit as st
-from utils.rag_tool import answer_with_knowledge_base
-from utils.web_search_tool import answer_with_web_search
-import markdown
-from rapidfuzz import fuzz
-from models.llm import classify_response_and_relevance
-from utils.azure_speech_to_text import transcribe_speech_from_mic
+import time
+from utils.speech import transcribe_voice_query
+from utils.tracing import start_trace, span, start_metrics_server
+from utils.chat_history import ChatHistory
+from utils.chat_render import chat_bubble_html, cached_bubble_html
+from utils.conversation import ConversationState
+from utils.orchestrator import prepare_corpus, resolve_answer, generate_answer, stream_answer, record_answer
 import os
 from dotenv import load_dotenv
 
@@ -12,14 +13,20 @@ from dotenv import load_dotenv
 load_dotenv()
 AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
 AZURE_REGION = os.getenv("AZURE_REGION")
+# Render answers token by token instead of waiting for the full completion
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "true").lower() in ("1", "true", "yes")
+# Only the newest CHAT_WINDOW_TURNS turns are rendered; "Load earlier" pages back by the same amount
+CHAT_WINDOW_TURNS = int(os.getenv("CHAT_WINDOW_TURNS", "10"))
+# Voice questions via st.audio_input, transcribed by utils/speech.py (SPEECH_BACKEND)
+VOICE_INPUT = os.getenv("VOICE_INPUT", "true").lower() in ("1", "true", "yes")
 
-from models.embeddings import create_index_if_not_exists, upload_chunks_to_search
+# --- Prometheus-style /metrics endpoint (only when METRICS_PORT is set) ---
+start_metrics_server()
 
-# --- Initialize embedding index only once per session ---
+# --- Sync embedding index once per process (skips unchanged PDFs via the manifest) ---
 if "embedding_index_created" not in st.session_state:
-    print("Creating embedding index...")
-    create_index_if_not_exists()
-    upload_chunks_to_search()
+    # FAQ answers are rebuilt in the background when the corpus changed
+    prepare_corpus()
     st.session_state.embedding_index_created = True
 
 # ---- Styling ----
@@ -51,7 +58,11 @@ st.markdown("""
 
 # --- Session State ---
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = ChatHistory()
+if "conversation" not in st.session_state:
+    st.session_state.conversation = ConversationState()  # rolling summary + recent turns for follow-ups
+if "history_window" not in st.session_state:
+    st.session_state.history_window = CHAT_WINDOW_TURNS * 2  # messages (user + bot per turn)
 if "chat_mode" not in st.session_state:
     st.session_state.chat_mode = "insurance"
 
@@ -76,34 +87,44 @@ with st.sidebar:
     )
     st.session_state.chat_mode = "insurance" if mode == "💼 Insurance Assistant" else "general"
 
-# --- Preprocess ---
-def preprocess(text):
-    return " ".join(text.strip().lower().split())
-
-def is_acknowledgment_message(user_input):
-    user_input_clean = preprocess(user_input)
-    acknowledgments = [
-        "thank you", "thanks", "got it", "ok", "okay", "sure", "noted", "understood",
-        "cool", "great", "awesome", "hi", "hello", "hey", "hi there", "hello there",
-        "hi!", "hello!", "hey!", "hi there!", "hello there!"
-    ]
-    for phrase in acknowledgments:
-        if fuzz.ratio(user_input_clean, phrase) > 85:
-            return True
-    return False
+    # Per-stage timings of the latest answer
+    if st.checkbox("⏱️ Show timing breakdown", key="show_timings"):
+        last_bot = st.session_state.chat_history.last("bot")
+        if last_bot and last_bot.get("timings"):
+            st.markdown(f"**Total:** {last_bot['total_seconds'] * 1000:.0f} ms")
+            st.markdown("\n".join(f"- {stage}: {seconds * 1000:.0f} ms" for stage, seconds in last_bot["timings"].items()))
+            if last_bot.get("prompt_tokens_saved"):
+                st.markdown(f"**Prompt tokens saved by merging and de-duplication:** {last_bot['prompt_tokens_saved']}")
+            if last_bot.get("prompt_tokens_truncated"):
+                st.markdown(f"**Prompt tokens cut by the context budget:** {last_bot['prompt_tokens_truncated']}")
+        else:
+            st.caption("Send a message to see where its time goes.")
+
+def render_stream(stream, source, min_interval=0.05):
+    """Render text deltas into one bot bubble as they arrive; returns the full text."""
+    placeholder = st.empty()
+    placeholder.markdown(chat_bubble_html({"role": "bot", "text": "▌", "source": source}), unsafe_allow_html=True)
+    text, last_render = "", 0.0
+    for delta in stream:
+        text += delta
+        if time.perf_counter() - last_render >= min_interval:
+            placeholder.markdown(chat_bubble_html({"role": "bot", "text": text + " ▌", "source": source}), unsafe_allow_html=True)
+            last_render = time.perf_counter()
+    placeholder.markdown(chat_bubble_html({"role": "bot", "text": text, "source": source}), unsafe_allow_html=True)
+    return text.strip()
 
 # --- Chat Output ---
 st.markdown('<div class="scrollable-chat"><div class="chat-list-container">', unsafe_allow_html=True)
-for msg in st.session_state.chat_history:
-    role_class = 'user' if msg["role"] == "user" else 'bot'
-    icon = "🧑‍💻" if msg["role"] == "user" else "🤖"
-    rendered_text = markdown.markdown(msg["text"]) if msg["role"] == "bot" else msg["text"]
-    st.markdown(f"""
-        <div class="chat-bubble {role_class}">
-            <b>{icon} {msg["role"].capitalize()} <span style="color:#1cb3e0;font-weight:500;">({msg['source']})</span></b><br>
-            <div>{rendered_text}</div>
-        </div>
-    """, unsafe_allow_html=True)
+chat_history = st.session_state.chat_history
+if len(chat_history) > st.session_state.history_window:
+    if st.button(f"⬆️ Load earlier messages ({len(chat_history) - st.session_state.history_window} hidden)"):
+        st.session_state.history_window += CHAT_WINDOW_TURNS * 2
+        st.rerun()
+with span("render_history", messages=len(chat_history), window=st.session_state.history_window):
+    # One markdown block for the whole visible window instead of one per bubble
+    bubbles = "".join(cached_bubble_html(msg) for msg in chat_history.window(st.session_state.history_window))
+    if bubbles:
+        st.markdown(bubbles, unsafe_allow_html=True)
 
 st.markdown('</div></div>', unsafe_allow_html=True)
 
@@ -152,43 +173,57 @@ response_mode = st.radio("Response Mode", ["Concise", "Detailed"], horizontal=Tr
 # --- Chat Input + Mic Button ---
 st.markdown('<div class="chat-input-container">', unsafe_allow_html=True)
 user_input = st.chat_input("Type your message here...")
-
+input_source = "User Input"
+voice_input = st.audio_input("Ask by voice", label_visibility="collapsed") if VOICE_INPUT else None
 
 st.markdown('</div>', unsafe_allow_html=True)
 
+# A recording stays in the widget across reruns; transcribe each one once. KB retrieval
+# starts from stable partial transcripts, so it overlaps the rest of the recognition.
+if voice_input is not None and not user_input and st.session_state.get("voice_input_id") != voice_input.file_id:
+    st.session_state.voice_input_id = voice_input.file_id
+    with st.spinner("🎙️ Transcribing..."):
+        user_input = transcribe_voice_query(voice_input.getvalue(),
+                                            prefetch=st.session_state.chat_mode == "insurance",
+                                            conversation=st.session_state.conversation) or None
+    input_source = "Voice Input"
+
 # --- Chat Logic ---
 if user_input:
-    st.session_state.chat_history.append({
+    user_message = st.session_state.chat_history.append({
         "role": "user",
         "text": user_input,
         "mode": response_mode,
-        "source": "User Input"
+        "source": input_source
     })
 
-    with st.spinner("🤖 Generating response..."):
-        if is_acknowledgment_message(user_input):
-            bot_reply = "Welcome! 😊 I'm your assistant. Feel free to ask your question."
-            response_source = "System"
-        else:
-            if st.session_state.chat_mode == "general":
-                bot_reply = answer_with_web_search(user_input,mode=response_mode.lower()) or "Sorry, couldn't find information on the web."
-                response_source = "Web Search"
+    with start_trace("chat_message", chat_mode=st.session_state.chat_mode, response_mode=response_mode.lower()) as trace:
+        chat_mode, mode = st.session_state.chat_mode, response_mode.lower()
+        resolved = resolve_answer(user_input, chat_mode, mode, st.session_state.conversation)
+        bot_reply, response_source = resolved["answer"], resolved["source"]
+        if bot_reply is None:
+            if STREAM_ANSWERS:
+                # Show the question right away, then stream the answer into its bubble
+                st.markdown(cached_bubble_html(user_message), unsafe_allow_html=True)
+                stream = stream_answer(resolved["query"], chat_mode, mode)
+                with st.spinner("🤖 Generating response..."):
+                    response_source = next(stream)
+                with span("render", stream=True):
+                    bot_reply = render_stream(stream, response_source)
             else:
-                kb_result = answer_with_knowledge_base(user_input, mode=response_mode.lower())
-                kb_response = kb_result if isinstance(kb_result, str) else str(kb_result)
-                classification = classify_response_and_relevance(kb_response, user_input)
-
-                if classification["response_class"] == "negative" and classification["is_relevant"] == "yes":
-                    bot_reply = answer_with_web_search(user_input,mode= response_mode.lower()) or "Sorry, couldn't find anything in policy documents or web."
-                    response_source = "Web Search"
-                else:
-                    bot_reply = kb_response
-                    response_source = "Knowledge Base"
+                with st.spinner("🤖 Generating response..."):
+                    bot_reply, response_source = generate_answer(resolved["query"], chat_mode, mode)
+        record_answer(user_input, resolved, chat_mode, mode, bot_reply, response_source, st.session_state.conversation)
 
+    # Only the finished answer is committed to the history
     st.session_state.chat_history.append({
         "role": "bot",
         "text": bot_reply,
         "mode": response_mode,
-        "source": response_source
+        "source": response_source,
+        "timings": trace.breakdown(),
+        "total_seconds": trace.duration,
+        "prompt_tokens_saved": trace.total("prompt_tokens_saved"),
+        "prompt_tokens_truncated": trace.total("prompt_tokens_truncated")
     })
     st.rerun()
@@ -0,0 +1,123 @@
+# batch.py
+# Answer a file of questions offline, e.g. to pre-answer FAQ sets overnight (answers land in
+# the answer cache too, so the app serves them instantly the next day).
+#
+#   python batch.py questions.jsonl [-o answers.jsonl] [--concurrency 16] [--chat-mode insurance] [--mode concise]
+#
+# Each input line is a JSON object ({"id", "question", "chat_mode", "mode"}; only "question" is
+# required) or a bare JSON string. Output lines are written in input order and carry "id",
+# "answer", "source", "ok", "timings" and "total_seconds", or "error" when a line failed.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from utils.orchestrator import aanswer_question, prepare_corpus
+from config.clients import aclose_async_clients
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+
+
+def parse_line(line, defaults):
+    """Returns the request dict for one input line (raises ValueError when it has no question)."""
+    item = json.loads(line)
+    if isinstance(item, str):
+        item = {"question": item}
+    if not isinstance(item, dict) or not str(item.get("question") or "").strip():
+        raise ValueError("line has no question")
+    return {**defaults, **item}
+
+
+async def answer_line(index, line, defaults):
+    try:
+        item = parse_line(line, defaults)
+    except ValueError as e:  # includes json.JSONDecodeError
+        return {"id": index, "ok": False, "error": f"invalid input: {e}"}
+    record = {"id": item.get("id", index), "chat_mode": item["chat_mode"], "mode": item["mode"]}
+    try:
+        result = await aanswer_question(item["question"].strip(), item["chat_mode"], item["mode"])
+    except Exception as e:
+        return {**record, "question": item["question"], "ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {**record, **result}
+
+
+async def run_batch(lines, out, concurrency=BATCH_CONCURRENCY, defaults=None):
+    """
+    Answer lines with at most `concurrency` in flight, writing each result as soon as every
+    earlier one is written. Returns the list of results in input order.
+    """
+    defaults = defaults or {"chat_mode": "insurance", "mode": "concise"}
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = {}
+    results = []
+
+    async def worker(index, line):
+        try:
+            return await answer_line(index, line, defaults)
+        finally:
+            semaphore.release()
+
+    def write(task):
+        result = task.result()
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        results.append(result)
+
+    def flush(block=False):
+        # Write finished results in input order, stopping at the first one still running
+        while len(results) in pending and (block or pending[len(results)].done()):
+            write(pending.pop(len(results)))
+
+    position = 0
+    for index, line in enumerate(lines):
+        if not line.strip():
+            continue
+        await semaphore.acquire()
+        pending[position] = asyncio.create_task(worker(index, line))
+        position += 1
+        flush()
+    if pending:
+        await asyncio.wait(pending.values())
+        flush(block=True)
+    return results
+
+
+async def run_batch_and_close(*args, **kwargs):
+    try:
+        return await run_batch(*args, **kwargs)
+    finally:
+        await aclose_async_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions.")
+    parser.add_argument("input", help="questions, one JSON object or string per line")
+    parser.add_argument("-o", "--output", help="answers JSONL (default: <input>.answers.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--chat-mode", default="insurance", choices=("insurance", "general"))
+    parser.add_argument("--mode", default="concise", choices=("concise", "detailed"))
+    parser.add_argument("--skip-ingest", action="store_true", help="don't sync the embedding index first")
+    args = parser.parse_args()
+    output = args.output or f"{os.path.splitext(args.input)[0]}.answers.jsonl"
+
+    started = time.perf_counter()
+    with open(args.input, encoding="utf-8") as src, open(output, "w", encoding="utf-8") as out:
+        if not args.skip_ingest:
+            prepare_corpus()
+        results = asyncio.run(run_batch_and_close(src, out, args.concurrency,
+                                                  {"chat_mode": args.chat_mode, "mode": args.mode}))
+    elapsed = time.perf_counter() - started
+
+    failed = sum(1 for result in results if not result.get("ok"))
+    sources = Counter(result.get("source") for result in results if result.get("ok"))
+    print(f"Answered {len(results) - failed}/{len(results)} questions in {elapsed:.1f}s "
+          f"({len(results) / elapsed:.1f}/s) -> {output}")
+    print("Sources: " + ", ".join(f"{source}={count}" for source, count in sources.most_common()))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
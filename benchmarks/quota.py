@@ -0,0 +1,97 @@
+# quota.py
+# Exercises utils/llm_scheduler.py against the local stubs (benchmarks/stubs.py): a burst of
+# interactive answers and classifications runs alongside an ingestion-priority embedding load
+# while the stub answers a share of requests with 429 + Retry-After.
+#
+#   python benchmarks/quota.py [--error-rate 0.3] [--tpm 20000] [--rpm 600] [--deadline 5]
+#
+# Exits with status 1 if any interactive answer surfaced an error.
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.stubs import ServiceProfile, StubServer
+from benchmarks.run import QUERIES, configure_environment, percentiles
+
+CHUNKS = [{"policy": "MediShield Health Protect", "content": "Adults aged 18 to 65 are eligible for cover.",
+           "label": "eligibility", "score": 1.0, "id": "health_protect.pdf_0_stub", "page": 1}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM scheduler behaviour under 429s and a TPM/RPM quota.")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent interactive sessions")
+    parser.add_argument("--requests", type=int, default=60, help="interactive answers (plus as many classifications)")
+    parser.add_argument("--ingest-batches", type=int, default=20, help="ingestion embedding batches run meanwhile")
+    parser.add_argument("--error-rate", type=float, default=0.3, help="fraction of stub requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="Retry-After sent with injected 429s (s)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens-per-minute quota for every deployment (0 = off)")
+    parser.add_argument("--rpm", type=int, default=0, help="requests-per-minute quota for every deployment (0 = off)")
+    parser.add_argument("--deadline", type=float, default=10.0, help="interactive deadline (s)")
+    args = parser.parse_args()
+
+    profile = ServiceProfile(latency=0.05, error_rate=args.error_rate, retry_after=args.retry_after)
+    profiles = {"llm": profile, "embedding": profile,
+                "search": ServiceProfile(0.01), "tavily": ServiceProfile(0.05)}
+    workdir = tempfile.mkdtemp(prefix="chatbot_quota_")
+    try:
+        with StubServer(profiles) as stub:
+            configure_environment(stub.url, workdir)
+            quota = {key: value for key, value in (("tpm", args.tpm), ("rpm", args.rpm)) if value}
+            os.environ.update({
+                "LLM_QUOTAS": json.dumps({name: quota for name in
+                                          ("stub-deployment", "gpt-35-turbo", "text-embedding-3-large")}),
+                "LLM_INTERACTIVE_DEADLINE": str(args.deadline),
+            })
+
+            from utils.rag_tool import answer_with_knowledge_base
+            from models.llm import classify_response_and_relevance, is_failed_reply
+            from models.embedder import embed_texts
+            from utils.llm_scheduler import get_llm_scheduler, llm_priority, PRIORITY_INGESTION
+
+            def ingest(i):
+                with llm_priority(PRIORITY_INGESTION):
+                    embed_texts([f"Policy clause {i}-{j}: cover applies to members." * 5 for j in range(16)])
+
+            def interactive(i):
+                started = time.perf_counter()
+                answer = answer_with_knowledge_base(QUERIES[i % len(QUERIES)], "concise", chunks=CHUNKS)
+                classify_response_and_relevance(answer, QUERIES[i % len(QUERIES)])
+                return time.perf_counter() - started, is_failed_reply(answer)
+
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=4) as ingest_pool, \
+                    ThreadPoolExecutor(max_workers=args.sessions) as pool:
+                ingestion = [ingest_pool.submit(ingest, i) for i in range(args.ingest_batches)]
+                outcomes = list(pool.map(interactive, range(args.requests)))
+                elapsed = time.perf_counter() - started
+                ingest_done = sum(1 for future in ingestion if future.done())
+                ingest_errors = sum(1 for future in ingestion if future.exception() is not None)
+            ingest_elapsed = time.perf_counter() - started
+
+            latencies = [latency for latency, _ in outcomes]
+            errors = sum(1 for _, failed in outcomes if failed)
+            stats = {key: round(value * 1000, 1) for key, value in percentiles(latencies).items()}
+            print(f"interactive: {args.requests} answers in {elapsed:.2f}s  p50={stats['p50']}ms "
+                  f"p95={stats['p95']}ms p99={stats['p99']}ms  errors={errors}")
+            print(f"ingestion: {ingest_done}/{args.ingest_batches} embedding batches done when the answers finished, "
+                  f"all done in {ingest_elapsed:.2f}s, errors={ingest_errors}")
+            print(f"scheduler: {get_llm_scheduler().snapshot()}")
+            print(f"stub requests: {stub.state.requests}  injected 429s: {stub.state.errors}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+# run.py
+# Offline benchmark: drives the real RAG, web-search, classification and ingestion code
+# against local stand-ins for Azure OpenAI, Azure Search and Tavily (benchmarks/stubs.py),
+# then compares the numbers with benchmarks/baseline.json.
+#
+#   python benchmarks/run.py [--sessions 8] [--requests 40] [--llm-latency 0.05] [--error-rate 0.0]
+#   python benchmarks/run.py --save-baseline      # record the current numbers as the baseline
+#
+# Exits with status 1 when a metric regresses by more than --tolerance against the baseline, and
+# with status 2 (without running) when the settings differ from the ones the baseline recorded.
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.stubs import ServiceProfile, StubServer
+
+QUERIES = [
+    "What is the entry age for MediShield Health Protect?",
+    "Does the accident guard policy cover permanent disability?",
+    "What are the exclusions in the Insurewell life shield policy?",
+    "How is the premium calculated for health protect?",
+    "Is maternity covered under the health policy?",
+    "What is the waiting period for pre-existing diseases?",
+]
+# Metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = ("throughput_rps", "chunks_per_sec")
+
+
+def configure_environment(stub_url, workdir):
+    """Point every client at the stubs. Must run before any app module is imported."""
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": stub_url,
+        "AZURE_ENDPOINT": stub_url,
+        "AZURE_EMBEDDING_ENDPOINT": stub_url,
+        "AZURE_SEARCH_ENDPOINT": stub_url,
+        "TAVILY_API_BASE_URL": stub_url,
+        "AZURE_OPENAI_API_KEY": "stub",
+        "AZURE_EMBEDDING_API_KEY": "stub",
+        "AZURE_SEARCH_KEY": "stub",
+        "TAVILY_KEY": "tvly-stub",
+        "AZURE_OPENAI_DEPLOYMENT_NAME": "stub-deployment",
+        "RETRIEVER_BACKEND": "azure",
+        "EMBEDDER": "azure",
+        "INGEST_MANIFEST_PATH": os.path.join(workdir, "ingest_manifest.json"),
+        "ANSWER_CACHE_PATH": os.path.join(workdir, "answer_cache.json"),
+        "WEB_CACHE_PATH": os.path.join(workdir, "tavily_cache.json"),
+        "TRACE_LOG_PATH": os.path.join(workdir, "traces.jsonl"),
+        "METRICS_PORT": "0",
+        # QUERIES repeat, so caches would turn most requests into hits and hide the real path
+        "WEB_CACHE_ENABLED": "false",
+        "EMBEDDING_MEMO_SIZE": "0",
+    })
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def run_load(name, call, sessions, requests):
+    """Run `requests` calls spread over `sessions` concurrent workers; returns latency/throughput stats."""
+    from models.llm import is_failed_reply
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            result = call(QUERIES[i % len(QUERIES)])
+            failed = isinstance(result, str) and is_failed_reply(result)
+        except Exception:
+            failed = True
+        return time.perf_counter() - started, failed
+
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=sessions) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in outcomes]
+    errors = sum(1 for _, failed in outcomes if failed)
+    stats = {name: {
+        **{key: round(value * 1000, 2) for key, value in percentiles(latencies).items()},
+        "throughput_rps": round(requests / elapsed, 2),
+        "errors": errors,
+    }}
+    print(f"{name:<16} p50={stats[name]['p50']:>8.2f}ms p95={stats[name]['p95']:>8.2f}ms "
+          f"p99={stats[name]['p99']:>8.2f}ms  {stats[name]['throughput_rps']:>7.2f} req/s  errors={errors}")
+    return stats
+
+
+def run_ingestion():
+    from models.embeddings import create_index_if_not_exists, upload_chunks_to_search, load_manifest
+
+    create_index_if_not_exists()
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        upload_chunks_to_search(force=True)
+    elapsed = time.perf_counter() - started
+    chunks = sum(len(entry.get("chunk_ids", [])) for entry in load_manifest().get("files", {}).values())
+    stats = {"ingestion": {"chunks": chunks, "seconds": round(elapsed, 3),
+                           "chunks_per_sec": round(chunks / elapsed, 2) if elapsed else None}}
+    print(f"{'ingestion':<16} {chunks} chunks in {elapsed:.2f}s ({stats['ingestion']['chunks_per_sec']} chunks/s)")
+    return stats
+
+
+def run_benchmarks(sessions, requests):
+    from utils.rag_tool import answer_with_knowledge_base
+    from utils.web_search_tool import answer_with_web_search
+    from models.llm import classify_response_and_relevance
+
+    results = run_ingestion()
+    results.update(run_load("kb_answer", lambda q: answer_with_knowledge_base(q, "concise"), sessions, requests))
+    results.update(run_load("web_answer", lambda q: answer_with_web_search(q, "concise"), sessions, requests))
+    results.update(run_load(
+        "classification",
+        lambda q: classify_response_and_relevance("The policy covers adults aged 18 to 65.", q),
+        sessions, requests,
+    ))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of human-readable regressions (empty when everything is within tolerance)."""
+    regressions = []
+    for name, metrics in baseline.get("results", {}).items():
+        for metric, expected in metrics.items():
+            actual = results.get(name, {}).get(metric)
+            if expected is None or actual is None or metric in ("errors", "chunks", "seconds"):
+                continue
+            if metric in HIGHER_IS_BETTER:
+                regressed = actual < expected * (1 - tolerance)
+            else:
+                regressed = actual > expected * (1 + tolerance)
+            if regressed:
+                regressions.append(f"{name}.{metric}: {actual} vs baseline {expected}")
+        if results.get(name, {}).get("errors", 0) > metrics.get("errors", 0):
+            regressions.append(f"{name}.errors: {results[name]['errors']} vs baseline {metrics.get('errors', 0)}")
+    return regressions
+
+
+def config_mismatch(config, baseline):
+    """Settings that differ from the ones the baseline was recorded with, as readable lines."""
+    recorded = baseline.get("config", {})
+    return [f"{key}: {config.get(key)} vs baseline {recorded.get(key)}"
+            for key in sorted(set(config) | set(recorded)) if config.get(key) != recorded.get(key)]
+
+
+def load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency / throughput benchmark against stubbed services.")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub chat/completions latency (s)")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="stub embeddings latency (s)")
+    parser.add_argument("--search-latency", type=float, default=0.01, help="stub Azure Search latency (s)")
+    parser.add_argument("--tavily-latency", type=float, default=0.05, help="stub Tavily latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- latency jitter for every service (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests answered with 429")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs the baseline (0.2 = 20%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("baseline", "save_baseline", "tolerance")}
+    baseline = None if args.save_baseline else load_baseline(args.baseline)
+    if baseline is not None and (mismatch := config_mismatch(config, baseline)):
+        # Numbers from different sessions, latencies or error rates can't be compared
+        print("Config mismatch: these settings differ from the baseline's, so it cannot be compared:")
+        for line in mismatch:
+            print(f"  {line}")
+        print("Rerun with the baseline's settings, or record a new baseline with --save-baseline.")
+        return 2
+
+    profiles = {
+        "llm": ServiceProfile(args.llm_latency, args.jitter, args.error_rate),
+        "embedding": ServiceProfile(args.embedding_latency, args.jitter, args.error_rate),
+        "search": ServiceProfile(args.search_latency, args.jitter, args.error_rate),
+        "tavily": ServiceProfile(args.tavily_latency, args.jitter, args.error_rate),
+    }
+    workdir = tempfile.mkdtemp(prefix="chatbot_bench_")
+    os.chdir(REPO_ROOT)  # ingestion reads data/ relative to the repo
+    try:
+        with StubServer(profiles) as stub:
+            configure_environment(stub.url, workdir)
+            results = run_benchmarks(args.sessions, args.requests)
+            print(f"stub requests: {stub.state.requests}  injected errors: {stub.state.errors}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print("No baseline found; run with --save-baseline to create one.")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# startup.py
+# Cold-start benchmark: imports everything app.py imports at module level (without running the
+# Streamlit script) under `python -X importtime`, reports the slowest top-level imports and
+# compares the total with a baseline tree, so the before and after are printed side by side.
+#
+#   python benchmarks/startup.py [--runs 5] [--top 15]                 # vs benchmarks/startup_baseline.json
+#   python benchmarks/startup.py --ref f12e09d~1                       # vs another commit, measured now
+#   python benchmarks/startup.py --ref f12e09d~1 --save-baseline       # record that commit as the baseline
+
+import os
+import re
+import ast
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "startup_baseline.json")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def app_imports(root):
+    """Modules app.py imports at module level, in order (the script's cold-start import graph)."""
+    with open(os.path.join(root, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        names = [alias.name for alias in node.names] if isinstance(node, ast.Import) else \
+            [node.module] if isinstance(node, ast.ImportFrom) and node.module else []
+        modules.extend(name for name in names if name not in modules)
+    return modules
+
+
+def measure_once(modules, root=REPO_ROOT):
+    """Returns {top-level module: cumulative microseconds} for one fresh interpreter."""
+    code = "; ".join(f"import {module}" for module in modules)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=root,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    timings = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) == 1:  # top-level imports only
+            timings[match.group(4)] = int(match.group(2))
+    return timings
+
+
+def measure(root, runs, top):
+    """{"median_ms", "min_ms", "max_ms", "runs", "slowest": {module: median ms}} for the tree at root."""
+    modules = app_imports(root)
+    samples = [measure_once(modules, root) for _ in range(runs)]
+    totals = [sum(sample.values()) / 1000 for sample in samples]
+    names = {name for sample in samples for name in sample}
+    medians = {name: statistics.median(sample.get(name, 0) for sample in samples) / 1000 for name in names}
+    slowest = sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {"median_ms": round(statistics.median(totals), 1), "min_ms": round(min(totals), 1),
+            "max_ms": round(max(totals), 1), "runs": runs,
+            "slowest": {name: round(elapsed, 1) for name, elapsed in slowest}}
+
+
+def measure_ref(ref, runs, top):
+    """Measure another commit from a temporary git worktree."""
+    workdir = tempfile.mkdtemp(prefix="startup_ref_")
+    subprocess.run(["git", "worktree", "add", "--detach", workdir, ref], cwd=REPO_ROOT, check=True,
+                   capture_output=True)
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", ref], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        return {"ref": ref, "commit": commit, **measure(workdir, runs, top)}
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", workdir], cwd=REPO_ROOT, capture_output=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(label, result):
+    print(f"{label}: median {result['median_ms']:.0f} ms over {result['runs']} runs "
+          f"(min {result['min_ms']:.0f} ms, max {result['max_ms']:.0f} ms)")
+    for name, elapsed in result["slowest"].items():
+        print(f"  {elapsed:8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the app's cold-start import time against a baseline.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--ref", help="git commit to compare against, measured now in a temporary worktree")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the --ref measurement as the baseline")
+    args = parser.parse_args()
+
+    if args.ref:
+        before = measure_ref(args.ref, args.runs, args.top)
+        if args.save_baseline:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(before, f, indent=2)
+                f.write("\n")
+            print(f"Saved {before['commit']} as the baseline in {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            before = json.load(f)
+    else:
+        before = None
+        print(f"No baseline at {args.baseline}; pass --ref <commit> to compare against one.")
+
+    after = measure(REPO_ROOT, args.runs, args.top)
+    if before:
+        report(f"Before ({before['ref']}, {before['commit']})", before)
+        print()
+    report("After (working tree)", after)
+    if before:
+        change = (after["median_ms"] - before["median_ms"]) / before["median_ms"]
+        print(f"\nApp import graph: {before['median_ms']:.0f} ms -> {after['median_ms']:.0f} ms ({change:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
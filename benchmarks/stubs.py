@@ -0,0 +1,261 @@
+# stubs.py
+# Local stand-ins for Azure OpenAI, Azure Cognitive Search and Tavily, with configurable
+# latency and error injection, so the real client code can be benchmarked offline.
+
+import re
+import json
+import time
+import random
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from models.embedder import HashEmbedder
+
+
+class ServiceProfile:
+    """Latency / failure profile for one stubbed service."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=0.05, token_delay=0.0):
+        self.latency = latency          # seconds before the response starts
+        self.jitter = jitter            # +/- uniform jitter in seconds
+        self.error_rate = error_rate    # fraction of requests answered with 429
+        self.retry_after = retry_after  # Retry-After sent with injected 429s
+        self.token_delay = token_delay  # seconds between streamed tokens
+
+    def delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+class StubState:
+    def __init__(self, profiles, embedding_dimensions=3072):
+        from utils.local_index import LocalRetriever
+
+        self.profiles = profiles
+        self.embedder = HashEmbedder(embedding_dimensions)
+        self.lock = threading.Lock()
+        self.requests = {name: 0 for name in profiles}
+        self.errors = {name: 0 for name in profiles}
+        # Uploaded documents are served from an in-memory BM25 + vector index (never flushed)
+        self.index = LocalRetriever(index_dir=tempfile.mkdtemp(prefix="stub_index_"), mmap=False)
+
+
+ANSWER_TEXT = (
+    "MediShield Health Protect covers adults aged 18 to 65 with hospitalisation, day-care and "
+    "domiciliary treatment benefits. Premiums depend on age and sum insured."
+)
+
+
+def completion_text(messages):
+    prompt = " ".join(str(message.get("content", "")) for message in messages)
+    if "strict classifier" in prompt:
+        return '{"response_class": "positive", "is_relevant": "yes"}'
+    if "STATUS:" in prompt:
+        return "STATUS: positive; RELEVANT: yes\n" + ANSWER_TEXT
+    return ANSWER_TEXT
+
+
+def parse_odata_filter(odata):
+    """The subset of OData the app sends: "field eq 'value' and field eq 3"."""
+    if not odata:
+        return None
+    filters = {}
+    for field, quoted, number in re.findall(r"(\w+) eq (?:'((?:[^']|'')*)'|(-?\d+))", odata):
+        filters[field] = quoted.replace("''", "'") if not number else int(number)
+    return filters
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        # --- helpers ---
+        def read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def enter(self, service):
+            """Apply latency / error injection. Returns False if an error was sent."""
+            profile = state.profiles[service]
+            with state.lock:
+                state.requests[service] += 1
+            time.sleep(profile.delay())
+            if profile.error_rate and random.random() < profile.error_rate:
+                with state.lock:
+                    state.errors[service] += 1
+                self.send_json(429, {"error": {"code": "429", "message": "Rate limit is exceeded (stub)."}},
+                               {"Retry-After": str(profile.retry_after),
+                                "retry-after-ms": str(int(profile.retry_after * 1000))})
+                return False
+            return True
+
+        # --- routing ---
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if re.fullmatch(r"/indexes\('[^']+'\)", path):
+                if self.enter("search"):
+                    name = re.search(r"'([^']+)'", path).group(1)
+                    self.send_json(200, {"name": name, "fields": [{"name": "id", "type": "Edm.String", "key": True}]})
+                return
+            self.send_json(404, {"error": {"message": f"no stub for GET {path}"}})
+
+        def do_PUT(self):
+            path = urlparse(self.path).path
+            payload = self.read_json()
+            if re.fullmatch(r"/indexes\('[^']+'\)", path):
+                if self.enter("search"):
+                    self.send_json(200, payload)
+                return
+            self.send_json(404, {"error": {"message": f"no stub for PUT {path}"}})
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            payload = self.read_json()
+            if path.endswith("/chat/completions"):
+                return self.chat_completions(payload)
+            if path.endswith("/embeddings"):
+                return self.embeddings(payload)
+            if path.endswith("/docs/search.post.search"):
+                return self.search(payload)
+            if path.endswith("/docs/search.index"):
+                return self.index_documents(payload)
+            if path == "/search":
+                return self.tavily_search(payload)
+            if path == "/indexes":
+                if self.enter("search"):
+                    self.send_json(201, payload)
+                return
+            self.send_json(404, {"error": {"message": f"no stub for POST {path}"}})
+
+        # --- Azure OpenAI ---
+        def chat_completions(self, payload):
+            if not self.enter("llm"):
+                return
+            text = completion_text(payload.get("messages", []))
+            model = payload.get("model", "stub")
+            if not payload.get("stream"):
+                self.send_json(200, {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                    "usage": {"prompt_tokens": len(str(payload)) // 4, "completion_tokens": len(text) // 4,
+                              "total_tokens": len(str(payload)) // 4 + len(text) // 4},
+                })
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for token in re.findall(r"\S+\s*", text):
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(state.profiles["llm"].token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def embeddings(self, payload):
+            if not self.enter("embedding"):
+                return
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            vectors = state.embedder.embed(inputs)
+            self.send_json(200, {
+                "object": "list", "model": payload.get("model", "stub"),
+                "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+                "usage": {"prompt_tokens": sum(len(t) // 4 for t in inputs), "total_tokens": sum(len(t) // 4 for t in inputs)},
+            })
+
+        # --- Azure Cognitive Search ---
+        def search(self, payload):
+            if not self.enter("search"):
+                return
+            top = payload.get("top") or 50
+            index = state.index
+            filters = parse_odata_filter(payload.get("filter"))
+            vector_queries = payload.get("vectorQueries") or []
+            if payload.get("search") == "*" and not vector_queries:
+                # Match-all listing (e.g. every id); one page, so no nextPageParameters
+                top = payload.get("top") or len(index.docs)
+                results = [dict(doc) for doc in index.docs]
+            elif vector_queries:
+                results = index.vector_search(vector_queries[0]["vector"], vector_queries[0].get("k") or top, filters)
+            elif payload.get("search"):
+                results = index.keyword_search(payload["search"], top, filters)
+            else:
+                results = []
+            self.send_json(200, {"value": results[:top]})
+
+        def index_documents(self, payload):
+            if not self.enter("search"):
+                return
+            actions = payload.get("value", [])
+            deletes = [a["id"] for a in actions if a.get("@search.action") == "delete"]
+            upserts = [{k: v for k, v in a.items() if k != "@search.action"}
+                       for a in actions if a.get("@search.action") != "delete" and a.get("content_vector")]
+            if deletes:
+                state.index.delete(deletes)
+            if upserts:
+                state.index.upsert(upserts)
+            statuses = [{"key": a["id"], "status": True, "errorMessage": None, "statusCode": 200} for a in actions]
+            self.send_json(200, {"value": statuses})
+
+        # --- Tavily ---
+        def tavily_search(self, payload):
+            if not self.enter("tavily"):
+                return
+            query = payload.get("query", "")
+            results = [{
+                "title": f"Result {i} for {query}",
+                "url": f"https://example.com/{i}",
+                "content": f"Web result {i}: {ANSWER_TEXT}",
+                "score": 1.0 - i * 0.1,
+            } for i in range(payload.get("max_results", 5))]
+            self.send_json(200, {"query": query, "answer": ANSWER_TEXT, "results": results, "response_time": 0.0})
+
+    return StubHandler
+
+
+class StubServer:
+    """Runs all stand-in services on one local port: `with StubServer(profiles) as stub: stub.url`."""
+
+    def __init__(self, profiles=None, port=0):
+        profiles = profiles or {}
+        for service in ("llm", "embedding", "search", "tavily"):
+            profiles.setdefault(service, ServiceProfile())
+        self.state = StubState(profiles)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self.state))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-services", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,266 @@
+# clients.py
+# Process-wide client registry: every Search / OpenAI / Tavily client is built lazily, once,
+# on top of shared, tuned HTTP connection pools.
+
+import os
+import asyncio
+import threading
+import weakref
+from dotenv import load_dotenv
+
+load_dotenv()
+INDEX_NAME = "index_field_1"
+CHAT_API_VERSION = "2025-01-01-preview"
+RAG_API_VERSION = "2024-02-15-preview"
+EMBEDDING_API_VERSION = "2023-05-15"
+
+# HTTP pool tuning
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+
+_lock = threading.RLock()
+_clients = {}
+# Async clients are bound to the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _memoize(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _memoize_async(name, factory):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if name not in clients:
+            clients[name] = factory()
+        return clients[name]
+
+
+# --- Shared HTTP pools ---
+def _httpx_settings():
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    return limits, timeout
+
+
+def get_http_client():
+    """Shared sync httpx pool used by the OpenAI clients."""
+    def build():
+        import httpx
+
+        limits, timeout = _httpx_settings()
+        return httpx.Client(limits=limits, timeout=timeout)
+    return _memoize("http", build)
+
+
+def get_async_http_client():
+    """Shared async httpx pool for the current event loop."""
+    def build():
+        import httpx
+
+        limits, timeout = _httpx_settings()
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+    return _memoize_async("http", build)
+
+
+def get_requests_session():
+    """Shared requests session used as the Azure Search sync transport."""
+    def build():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_MAX_KEEPALIVE, pool_maxsize=HTTP_MAX_CONNECTIONS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return _memoize("requests", build)
+
+
+# --- Azure OpenAI ---
+def _openai_kwargs(endpoint_env, key_env, api_version):
+    return {
+        "api_key": os.getenv(key_env),
+        "api_version": api_version,
+        "azure_endpoint": os.getenv(endpoint_env),
+    }
+
+
+# Retries (and Retry-After) are handled by utils.llm_scheduler, so the SDK clients never retry on their own
+def get_openai_client(api_version=CHAT_API_VERSION, endpoint_env="AZURE_OPENAI_ENDPOINT",
+                      key_env="AZURE_OPENAI_API_KEY"):
+    def build():
+        from openai import AzureOpenAI
+
+        return AzureOpenAI(http_client=get_http_client(), max_retries=0,
+                           **_openai_kwargs(endpoint_env, key_env, api_version))
+    return _memoize(("openai", api_version, endpoint_env, key_env), build)
+
+
+def get_async_openai_client(api_version=CHAT_API_VERSION, endpoint_env="AZURE_OPENAI_ENDPOINT",
+                            key_env="AZURE_OPENAI_API_KEY"):
+    def build():
+        from openai import AsyncAzureOpenAI
+
+        return AsyncAzureOpenAI(http_client=get_async_http_client(), max_retries=0,
+                                **_openai_kwargs(endpoint_env, key_env, api_version))
+    return _memoize_async(("openai", api_version, endpoint_env, key_env), build)
+
+
+def get_rag_openai_client():
+    return get_openai_client(api_version=RAG_API_VERSION)
+
+
+def get_async_rag_openai_client():
+    return get_async_openai_client(api_version=RAG_API_VERSION)
+
+
+def get_embedding_client():
+    def build():
+        from openai import AzureOpenAI
+
+        return AzureOpenAI(
+            http_client=get_http_client(),
+            max_retries=0,
+            **_openai_kwargs("AZURE_EMBEDDING_ENDPOINT", "AZURE_EMBEDDING_API_KEY", EMBEDDING_API_VERSION)
+        )
+    return _memoize("embedding", build)
+
+
+def get_async_embedding_client():
+    def build():
+        from openai import AsyncAzureOpenAI
+
+        return AsyncAzureOpenAI(
+            http_client=get_async_http_client(),
+            max_retries=0,
+            **_openai_kwargs("AZURE_EMBEDDING_ENDPOINT", "AZURE_EMBEDDING_API_KEY", EMBEDDING_API_VERSION)
+        )
+    return _memoize_async("embedding", build)
+
+
+def get_chat_llm(model="gpt-4o"):
+    """LangChain chat model used for classification (sync pool; ainvoke runs on the caller's loop)."""
+    def build():
+        from langchain_openai import AzureChatOpenAI
+
+        return AzureChatOpenAI(
+            model=model,
+            temperature=0,
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+            api_version=CHAT_API_VERSION,
+            http_client=get_http_client(),
+            max_retries=0,
+        )
+    return _memoize(("chat_llm", model), build)
+
+
+# --- Azure Cognitive Search ---
+def _search_credential():
+    from azure.core.credentials import AzureKeyCredential
+
+    return AzureKeyCredential(os.getenv("AZURE_SEARCH_KEY"))
+
+
+def get_search_client(index_name=INDEX_NAME):
+    def build():
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.search.documents import SearchClient
+
+        return SearchClient(
+            endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
+            index_name=index_name,
+            credential=_search_credential(),
+            transport=RequestsTransport(session=get_requests_session(), session_owner=False,
+                                        connection_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT),
+        )
+    return _memoize(("search", index_name), build)
+
+
+def get_async_search_client(index_name=INDEX_NAME):
+    def build():
+        from azure.search.documents.aio import SearchClient
+
+        return SearchClient(
+            endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
+            index_name=index_name,
+            credential=_search_credential(),
+            connection_timeout=HTTP_CONNECT_TIMEOUT,
+            read_timeout=HTTP_READ_TIMEOUT,
+        )
+    return _memoize_async(("search", index_name), build)
+
+
+def get_search_index_client():
+    def build():
+        from azure.search.documents.indexes import SearchIndexClient
+
+        return SearchIndexClient(endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"), credential=_search_credential())
+    return _memoize("search_index", build)
+
+
+# --- Tavily ---
+def get_tavily_client():
+    def build():
+        from tavily import TavilyClient
+
+        kwargs = {"api_base_url": os.getenv("TAVILY_API_BASE_URL")} if os.getenv("TAVILY_API_BASE_URL") else {}
+        return TavilyClient(api_key=os.getenv("TAVILY_KEY"), **kwargs)
+    return _memoize("tavily", build)
+
+
+def get_async_tavily_client():
+    def build():
+        from tavily import AsyncTavilyClient
+
+        kwargs = {"api_base_url": os.getenv("TAVILY_API_BASE_URL")} if os.getenv("TAVILY_API_BASE_URL") else {}
+        return AsyncTavilyClient(api_key=os.getenv("TAVILY_KEY"), **kwargs)
+    return _memoize_async("tavily", build)
+
+
+# --- Shared event loop ---
+def get_event_loop():
+    """A process-wide background event loop, so async clients and their pools are shared by all sessions."""
+    def build():
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="client-registry-loop", daemon=True).start()
+        return loop
+    return _memoize("event_loop", build)
+
+
+def run_async(coro, timeout=None):
+    """Run a coroutine on the shared loop from synchronous code (e.g. the Streamlit script thread)."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result(timeout)
+
+
+async def aclose_async_clients():
+    """Close the current loop's async clients (call before a short-lived loop, e.g. asyncio.run, ends)."""
+    import inspect
+
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for name, client in clients.items():
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        try:
+            result = close() if close else None
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"Closing async client {name} failed: {e}")
@@ -1,35 +1,60 @@
-from tavily import TavilyClient
-from dotenv import load_dotenv
 import os
-from langchain_openai import AzureChatOpenAI
-from langchain_openai import AzureOpenAIEmbeddings
-from openai import AzureOpenAI
+from dotenv import load_dotenv
+import threading
+from collections import OrderedDict
+from config.clients import get_tavily_client, get_chat_llm, get_openai_client
+from utils.tracing import span
 
 load_dotenv()
-client = TavilyClient(api_key=os.getenv("TAVILY_KEY"))# Replace with your actual Tavily API key
+EMBEDDING_MEMO_SIZE = int(os.getenv("EMBEDDING_MEMO_SIZE", "1024"))
+
+# Clients are built lazily by config.clients; these names are kept for existing importers
+_LAZY_CLIENTS = {
+    "client": get_tavily_client,
+    "llm": get_chat_llm,
+    "openai_client": get_openai_client,
+}
 
+def __getattr__(name):
+    if name in _LAZY_CLIENTS:
+        return _LAZY_CLIENTS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-llm = AzureChatOpenAI(
-    model="gpt-4o",
-    temperature=0,
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    azure_endpoint=os.getenv("AZURE_ENDPOINT"),
-    api_version="2025-01-01-preview"
-)
+# Repeated queries (retrieval + answer cache, sync or async) share one embedding call
+_embedding_memo = OrderedDict()
+_embedding_memo_lock = threading.Lock()
 
-openai_client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version="2025-01-01-preview",
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-)
+def _memo_get(text):
+    with _embedding_memo_lock:
+        vector = _embedding_memo.get(text)
+        if vector is not None:
+            _embedding_memo.move_to_end(text)
+        return vector
+
+def _memo_put(text, vector):
+    with _embedding_memo_lock:
+        _embedding_memo[text] = vector
+        while len(_embedding_memo) > EMBEDDING_MEMO_SIZE:
+            _embedding_memo.popitem(last=False)
+    return vector
 
 def get_embeddings_vector(text):
+    # Reuses the process-wide embedder instead of building a client per call. Do not mutate the result.
+    from models.embedder import get_embedder, with_retry
+
+    with span("query_embedding") as record:
+        vector = _memo_get(text)
+        record["cache_hit"] = vector is not None
+        if vector is None:
+            vector = _memo_put(text, with_retry(get_embedder().embed, [text])[0])
+    return vector
+
+async def aget_embeddings_vector(text):
+    from models.embedder import get_embedder, awith_retry
 
-    embeddings = AzureOpenAIEmbeddings(
-    model="text-embedding-3-large",
-    azure_endpoint=os.getenv("AZURE_EMBEDDING_ENDPOINT"),
-    api_key=os.getenv("AZURE_EMBEDDING_API_KEY"),
-    openai_api_version="2023-05-15",
-    )
-    single_vector = embeddings.embed_query(text)
-    return single_vector
+    with span("query_embedding") as record:
+        vector = _memo_get(text)
+        record["cache_hit"] = vector is not None
+        if vector is None:
+            vector = _memo_put(text, (await awith_retry(get_embedder().aembed, [text]))[0])
+    return vector
@@ -0,0 +1,141 @@
+# embedder.py
+import os
+import re
+import math
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_DIMENSIONS = 3072  # Must match content_vector in the search index
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "16"))
+EMBED_BATCH_MAX_CHARS = int(os.getenv("EMBED_BATCH_MAX_CHARS", "24000"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+
+class AzureEmbedder:
+    """Embeds batches of texts with the process-wide Azure OpenAI embedding client (config.clients)."""
+
+    def __init__(self):
+        self.dimensions = EMBEDDING_DIMENSIONS
+
+    def embed(self, texts):
+        from config.clients import get_embedding_client
+
+        response = get_embedding_client().embeddings.create(model=EMBEDDING_MODEL, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aembed(self, texts):
+        from config.clients import get_async_embedding_client
+
+        response = await get_async_embedding_client().embeddings.create(model=EMBEDDING_MODEL, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class HashEmbedder:
+    """
+    Deterministic offline embedder for tests and benchmarks.
+
+    Hashes word tokens into a fixed-size vector (the "hashing trick"), so texts that share
+    words get similar vectors without any network calls.
+    """
+
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def embed_one(self, text):
+        vector = [0.0] * self.dimensions
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            position = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[position] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed(self, texts):
+        return [self.embed_one(text) for text in texts]
+
+    async def aembed(self, texts):
+        return self.embed(texts)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    """Process-wide embedder; EMBEDDER=hash selects the offline fake."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = HashEmbedder() if os.getenv("EMBEDDER", "azure").lower() == "hash" else AzureEmbedder()
+        return _embedder
+
+def set_embedder(embedder):
+    """Swap the process-wide embedder (e.g. HashEmbedder() in offline runs)."""
+    global _embedder
+    with _embedder_lock:
+        _embedder = embedder
+
+
+# --- Retry ---
+def with_retry(fn, texts, priority=None):
+    """Call fn(texts) through the LLM scheduler: embedding budget, Retry-After and jittered retries."""
+    from utils.llm_scheduler import get_llm_scheduler, estimate_tokens
+
+    return get_llm_scheduler().call(EMBEDDING_MODEL, lambda: fn(texts), tokens=estimate_tokens(texts=texts),
+                                    priority=priority, max_retries=EMBED_MAX_RETRIES)
+
+async def awith_retry(fn, texts, priority=None):
+    """Async with_retry for coroutine functions."""
+    from utils.llm_scheduler import get_llm_scheduler, estimate_tokens
+
+    return await get_llm_scheduler().acall(EMBEDDING_MODEL, lambda: fn(texts), tokens=estimate_tokens(texts=texts),
+                                           priority=priority, max_retries=EMBED_MAX_RETRIES)
+
+
+# --- Batching ---
+def make_batches(texts, max_batch_size=EMBED_BATCH_SIZE, max_batch_chars=EMBED_BATCH_MAX_CHARS):
+    """Split texts into (start, end) ranges bounded by item count and total characters."""
+    batches = []
+    start, chars = 0, 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= max_batch_size or chars + len(text) > max_batch_chars):
+            batches.append((start, i))
+            start, chars = i, 0
+        chars += len(text)
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+def embed_texts(texts, embedder=None, max_workers=EMBED_MAX_WORKERS):
+    """Embed texts in size-bounded batches, running the batches concurrently. Order is preserved."""
+    embedder = embedder or get_embedder()
+    texts = list(texts)
+    batches = make_batches(texts)
+    if not batches:
+        return []
+    if len(batches) == 1 or max_workers <= 1:
+        results = [with_retry(embedder.embed, texts[start:end]) for start, end in batches]
+    else:
+        from utils.tracing import traced
+
+        # traced: pool threads keep the caller's trace and LLM priority
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            results = list(pool.map(traced(lambda b: with_retry(embedder.embed, texts[b[0]:b[1]])), batches))
+    return [vector for batch in results for vector in batch]
+
+
+if __name__ == "__main__":
+    # Local throughput check: python -m models.embedder [num_texts]
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sample = [f"Policy clause {i}: members aged {18 + i % 60} are eligible for cover." * 5 for i in range(count)]
+    started = time.perf_counter()
+    vectors = embed_texts(sample, embedder=HashEmbedder())
+    elapsed = time.perf_counter() - started
+    print(f"Embedded {len(vectors)} texts in {elapsed:.2f}s ({len(vectors) / elapsed:.0f} texts/s)")
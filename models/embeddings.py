@@ -1,32 +1,22 @@
 import os
-import uuid
+import json
+import time
+import hashlib
+import threading
 from dotenv import load_dotenv
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents.indexes.models import (
-    SearchIndex,
-    SimpleField,
-    SearchableField,
-    SearchFieldDataType,
-    VectorSearch,
-    HnswAlgorithmConfiguration,
-    VectorSearchProfile,
-    SearchField
-)
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from utils.retrievers import get_retriever, RETRIEVER_BACKEND
+from utils.answer_cache import get_answer_cache
+from config.clients import get_search_index_client
 
 # Load environment variables
 load_dotenv()
-azure_search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
-azure_search_key = os.getenv("AZURE_SEARCH_KEY")
 index_name = "index_field_1"
-
-# Azure clients
-credential = AzureKeyCredential(azure_search_key)
-index_client = SearchIndexClient(endpoint=azure_search_endpoint, credential=credential)
-search_client = SearchClient(endpoint=azure_search_endpoint, index_name=index_name, credential=credential)
+data_dir = "data"
+manifest_path = os.getenv("INGEST_MANIFEST_PATH", os.path.join(".cache", "ingest_manifest.json"))
+MANIFEST_VERSION = 3  # v2: chunks carry content_vector; v3: chunk_type / policy_name / page fields
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", "100"))
+# The local index is persisted (and finished files recorded in the manifest) at most this often
+INGEST_CHECKPOINT_SECONDS = float(os.getenv("INGEST_CHECKPOINT_SECONDS", "30"))
 
 import re
 
@@ -34,14 +24,44 @@ def clean_document_key(key):
     return re.sub(r'[^a-zA-Z0-9_\-=]', '_', key)
 
 def create_index_if_not_exists():
+    from azure.search.documents.indexes.models import (
+        SearchIndex,
+        SimpleField,
+        SearchableField,
+        SearchFieldDataType,
+        VectorSearch,
+        HnswAlgorithmConfiguration,
+        VectorSearchProfile,
+        SearchField
+    )
+
+    # Precomputed at ingestion so queries can filter (and facet) on them before top-k
+    metadata_fields = [
+        SimpleField(name="chunk_type", type=SearchFieldDataType.String, filterable=True, facetable=True),
+        SimpleField(name="policy_name", type=SearchFieldDataType.String, filterable=True, facetable=True),
+        SimpleField(name="page", type=SearchFieldDataType.Int32, filterable=True, facetable=True, sortable=True),
+    ]
+
+    index_client = get_search_index_client()
     try:
-        index_client.get_index(name=index_name)
-        print("Index already exists.")
+        index = index_client.get_index(name=index_name)
     except:
+        index = None
+    if index is not None:
+        print("Index already exists.")
+        existing = {field.name for field in index.fields}
+        missing = [field for field in metadata_fields if field.name not in existing]
+        if missing:
+            # Adding fields is an in-place index update; existing documents get them on re-ingestion
+            index.fields.extend(missing)
+            index_client.create_or_update_index(index)
+            print(f"Added index fields: {', '.join(field.name for field in missing)}")
+    else:
         fields = [
             SimpleField(name="id", type=SearchFieldDataType.String, key=True),
             SearchableField(name="content", type=SearchFieldDataType.String, analyzer_name="en.lucene"),
             SimpleField(name="source", type=SearchFieldDataType.String),
+            *metadata_fields,
             SearchField(
                 name="content_vector",
                 type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
@@ -66,34 +86,216 @@ def create_index_if_not_exists():
 
 # Chunk PDFs using LangChain
 def extract_chunks_with_langchain(file_path, chunk_size=500, chunk_overlap=50):
+    # The PDF stack is only needed when a file actually has to be (re)ingested
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     loader = PyPDFLoader(file_path)
     documents = loader.load()  # returns LangChain Document objects
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     chunks = splitter.split_documents(documents)
     return chunks
 
-# Upload chunks to Azure Search
-def upload_chunks_to_search():
-    data_dir = "data"
-    for filename in os.listdir(data_dir):
-        if filename.endswith(".pdf"):
-            file_path = os.path.join(data_dir, filename)
-            print(f"Processing {filename}")
-            chunks = extract_chunks_with_langchain(file_path)
-            docs = []
-
-            for i, chunk in enumerate(chunks):
-                raw_id = f"{filename}_{i}_{str(uuid.uuid4())}"
-                doc = {
-                    "id": clean_document_key(raw_id),
-                    "content": chunk.page_content,
-                    "source": filename
-                }
-                docs.append(doc)
-            if docs:
-                result = search_client.upload_documents(documents=docs)
-                print(f"Uploaded {len(result)} chunks from {filename}")
-
-# Run
-create_index_if_not_exists()
-upload_chunks_to_search()
+# --- Ingestion manifest ---
+def load_manifest():
+    """
+    Load the ingestion manifest. A missing manifest, or one for another index or backend, gives
+    an empty one. A manifest from an older MANIFEST_VERSION keeps each file's chunk_ids but
+    not its hashes: every file is re-ingested and its old chunks are deleted as stale.
+    Both cases also purge, once, index documents that no manifest entry references (e.g. the
+    uuid-keyed chunks of ingestion runs before the manifest existed).
+    """
+    fresh = {"version": MANIFEST_VERSION, "index_name": index_name, "backend": RETRIEVER_BACKEND,
+             "index_created": False, "files": {}, "purge_orphans": True}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return fresh
+    # Manifests before the pluggable backends were always Azure Search
+    if manifest.get("index_name") != index_name or manifest.get("backend", "azure") != RETRIEVER_BACKEND:
+        return fresh
+    if manifest.get("version") != MANIFEST_VERSION:
+        files = {filename: {"sha256": None, "size": None, "mtime": None, "chunk_ids": entry.get("chunk_ids", [])}
+                 for filename, entry in manifest.get("files", {}).items()}
+        return {**fresh, "index_created": manifest.get("index_created", False), "files": files}
+    return manifest
+
+def save_manifest(manifest):
+    """Atomically write the manifest so an interrupted run never leaves it half-written."""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def corpus_version(manifest):
+    """Fingerprint of the ingested corpus; changes whenever any file is added, changed or removed."""
+    digest = hashlib.sha256()
+    for filename in sorted(manifest["files"]):
+        digest.update(f"{filename}:{manifest['files'][filename]['sha256']};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def make_chunk_id(filename, position, content):
+    """Deterministic chunk id: the same chunk of the same file always maps to the same key."""
+    content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+    return clean_document_key(f"{filename}_{position}_{content_hash}")
+
+def delete_chunks(chunk_ids):
+    retriever = get_retriever()
+    for start in range(0, len(chunk_ids), UPLOAD_BATCH_SIZE):
+        retriever.delete(chunk_ids[start:start + UPLOAD_BATCH_SIZE])
+
+def discard_partial_upload(known_files, filename, ids):
+    """
+    Delete the chunks a failed file already uploaded. If that fails too they stay recorded in its
+    manifest entry (which matches no file hash), so the next run removes them as stale, or
+    purges them if the file is deleted in the meantime.
+    """
+    entry = known_files.setdefault(filename, {"sha256": None, "size": None, "mtime": None, "chunk_ids": []})
+    previous = set(entry["chunk_ids"])
+    new_ids = sorted(set(ids) - previous)  # ids the entry already has were in the index before this run
+    try:
+        delete_chunks(new_ids)
+        print(f"Removed {len(new_ids)} chunks uploaded before {filename} failed")
+    except Exception as e:
+        print(f"Could not remove the chunks uploaded before {filename} failed, retrying next run: {e}")
+        entry["chunk_ids"] = entry["chunk_ids"] + new_ids
+
+def purge_orphans(manifest):
+    """Delete index documents no manifest entry references (once, after a manifest migration)."""
+    known_ids = {chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunk_ids"]}
+    orphans = sorted(set(get_retriever().ids()) - known_ids)
+    delete_chunks(orphans)
+    if orphans:
+        print(f"Purged {len(orphans)} chunks not referenced by the manifest")
+    manifest.pop("purge_orphans", None)
+
+def upload_documents_in_batches(docs):
+    """Upload in bounded batches so one large file never becomes one giant request."""
+    retriever = get_retriever()
+    uploaded = 0
+    for start in range(0, len(docs), UPLOAD_BATCH_SIZE):
+        uploaded += retriever.upsert(docs[start:start + UPLOAD_BATCH_SIZE])
+    return uploaded
+
+# Upload chunks to the configured retriever backend (Azure Search or the local index)
+def upload_chunks_to_search(force=False, pipeline_options=None):
+    """
+    Incrementally sync the PDFs in data/ with the search index.
+
+    Unchanged files (same size/mtime, or same content hash) are skipped, changed files
+    replace only their own chunks and files removed from data/ have their chunks purged.
+    Changed files go through models.ingest_pipeline (parallel parse, overlapped embedding
+    and upload); `pipeline_options` are passed to IngestPipeline. Returns a summary dict.
+    """
+    manifest = load_manifest()
+    known_files = manifest["files"]
+    summary = {"skipped": [], "ingested": [], "deleted": [], "failed": {}}
+
+    pdf_files = sorted(f for f in os.listdir(data_dir) if f.endswith(".pdf"))
+    pending = {}  # filename -> (stat, sha256) of files that need (re)ingesting
+    for filename in pdf_files:
+        file_path = os.path.join(data_dir, filename)
+        stat = os.stat(file_path)
+        entry = known_files.get(filename)
+
+        # Fast path: size and mtime unchanged, no need to even hash the file
+        if not force and entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            summary["skipped"].append(filename)
+            continue
+
+        sha256 = file_sha256(file_path)
+        if not force and entry and entry["sha256"] == sha256:
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            save_manifest(manifest)
+            summary["skipped"].append(filename)
+            continue
+
+        if entry:
+            # Checkpoint: until the file is re-ingested its entry matches nothing, so an
+            # interrupted (even forced) run picks it up again next time
+            entry["sha256"], entry["size"], entry["mtime"] = None, None, None
+        pending[filename] = (stat, sha256)
+
+    last_checkpoint = [time.monotonic()]
+
+    def checkpoint():
+        # The manifest is only saved right after the index is persisted, so files recorded as
+        # ingested are always on disk; an interrupted run redoes the files since the last one
+        get_retriever().flush()
+        save_manifest(manifest)
+        last_checkpoint[0] = time.monotonic()
+
+    def on_file_done(filename, new_ids):
+        """Called by the pipeline once every chunk of a file is uploaded."""
+        stat, sha256 = pending[filename]
+        entry = known_files.get(filename)
+        stale_ids = sorted(set(entry["chunk_ids"]) - set(new_ids)) if entry else []
+        delete_chunks(stale_ids)
+        if stale_ids:
+            print(f"Removed {len(stale_ids)} stale chunks from {filename}")
+        known_files[filename] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunk_ids": new_ids,
+        }
+        if time.monotonic() - last_checkpoint[0] >= INGEST_CHECKPOINT_SECONDS:
+            checkpoint()
+
+    if pending:
+        from models.ingest_pipeline import IngestPipeline
+
+        save_manifest(manifest)
+        print(f"Ingesting {len(pending)} file(s)")
+        result = IngestPipeline(on_file_done, **(pipeline_options or {})).run(
+            [os.path.join(data_dir, filename) for filename in pending]
+        )
+        summary["ingested"], summary["failed"] = result["ingested"], result["failed"]
+        for filename, ids in result["partial"].items():
+            discard_partial_upload(known_files, filename, ids)
+
+    for filename in sorted(set(known_files) - set(pdf_files)):
+        delete_chunks(known_files[filename]["chunk_ids"])
+        print(f"Purged {len(known_files[filename]['chunk_ids'])} chunks of deleted file {filename}")
+        del known_files[filename]
+        summary["deleted"].append(filename)
+    # Orphans are only knowable once every file's chunk ids are recorded, so a failed file defers it
+    purged = bool(manifest.get("purge_orphans")) and not summary["failed"]
+    if purged:
+        purge_orphans(manifest)
+    if pending or summary["deleted"] or purged:
+        checkpoint()
+
+    # Cached answers built from older documents are no longer valid
+    get_answer_cache().set_corpus_version(corpus_version(manifest))
+    return summary
+
+_ingest_lock = threading.Lock()
+_ingested = False
+
+def ensure_corpus_ingested(force=False, pipeline_options=None):
+    """Create the index and sync data/ at most once per process (cheap when nothing changed)."""
+    global _ingested
+    with _ingest_lock:
+        if _ingested and not force:
+            return None
+        manifest = load_manifest()
+        if RETRIEVER_BACKEND == "azure" and (force or not manifest["index_created"]):
+            create_index_if_not_exists()
+            manifest["index_created"] = True
+            save_manifest(manifest)
+        summary = upload_chunks_to_search(force=force, pipeline_options=pipeline_options)
+        _ingested = True
+        return summary
+
+if __name__ == "__main__":
+    print(ensure_corpus_ingested(force=False))
@@ -0,0 +1,281 @@
+# ingest_pipeline.py
+# Streaming ingestion for large corpora: PDFs are parsed in a process pool, page by page, and
+# batches of chunks stream through bounded queues to an embedding stage and an upload stage so
+# all three overlap and memory holds a few batches rather than whole files.
+#
+#   python -m models.ingest_pipeline [--force] [--workers 4] [--batch-size 64]
+#
+# The ingestion manifest is the checkpoint: a file is recorded only once all of its chunks are
+# uploaded, so an interrupted run resumes with the files that were not finished.
+
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+load_dotenv()
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_POOL_MIN_FILES = int(os.getenv("INGEST_POOL_MIN_FILES", "8"))  # below this, parse in-process
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))          # chunks per embed / upload batch
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))           # batches buffered between stages
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "5"))
+
+_END = object()
+
+
+def iter_pdf_chunks(file_path, chunk_size=500, chunk_overlap=50):
+    """Yield (position, text, page) for each chunk, loading and splitting one page at a time."""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    position = 0
+    for page in PyPDFLoader(file_path).lazy_load():
+        for chunk in splitter.split_documents([page]):
+            yield position, chunk.page_content, chunk.metadata.get("page")
+            position += 1
+
+
+def chunk_document(filename, position, text, page):
+    from models.embeddings import make_chunk_id
+    from utils.chunk_labels import chunk_metadata
+
+    return {
+        "id": make_chunk_id(filename, position, text),
+        "content": text,
+        "source": filename,
+        **chunk_metadata(filename, text, page),
+    }
+
+
+def parse_pdf_batches(file_path, batch_size=INGEST_BATCH_SIZE):
+    """Yield lists of at most batch_size chunk documents (without vectors), page by page."""
+    filename = os.path.basename(file_path)
+    batch = []
+    for position, text, page in iter_pdf_chunks(file_path):
+        batch.append(chunk_document(filename, position, text, page))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_pdf_file(file_path, batch_size, results):
+    """
+    Pool worker: put ("batch", filename, docs) on `results` as pages are parsed, then
+    ("done", filename, chunk_ids) or ("failed", filename, error). `results` is bounded, so a
+    worker blocks instead of holding more than one batch when embedding falls behind.
+    """
+    filename = os.path.basename(file_path)
+    ids = []
+    try:
+        for batch in parse_pdf_batches(file_path, batch_size):
+            ids.extend(doc["id"] for doc in batch)
+            results.put(("batch", filename, batch))
+    except Exception as e:
+        results.put(("failed", filename, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("done", filename, ids))
+
+
+class IngestProgress:
+    def __init__(self, files_total, interval=INGEST_PROGRESS_INTERVAL):
+        self.files_total = files_total
+        self.interval = interval
+        self.counts = {"files_done": 0, "files_failed": 0, "parsed": 0, "embedded": 0, "uploaded": 0}
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.lock = threading.Lock()
+
+    def add(self, key, value=1):
+        with self.lock:
+            self.counts[key] += value
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        with self.lock:
+            if not force and now - self.last_report < self.interval:
+                return
+            self.last_report = now
+            counts = dict(self.counts)
+        elapsed = now - self.started
+        print(f"[ingest] files {counts['files_done']}/{self.files_total} ({counts['files_failed']} failed), "
+              f"chunks parsed {counts['parsed']}, embedded {counts['embedded']}, uploaded {counts['uploaded']} "
+              f"({counts['uploaded'] / elapsed if elapsed else 0:.1f} chunks/s)")
+
+
+class IngestPipeline:
+    """
+    parse (process pool) -> embed queue -> embedding thread -> upload queue -> upload thread.
+
+    `on_file_done(filename, chunk_ids)` is called from the upload thread once every chunk of a
+    file is in the index; it is where the caller checkpoints the manifest.
+    """
+
+    def __init__(self, on_file_done, workers=INGEST_PARSE_WORKERS, batch_size=INGEST_BATCH_SIZE,
+                 queue_size=INGEST_QUEUE_SIZE, progress_interval=INGEST_PROGRESS_INTERVAL):
+        self.on_file_done = on_file_done
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.embed_queue = queue.Queue(maxsize=queue_size)
+        self.upload_queue = queue.Queue(maxsize=queue_size)
+        self.progress_interval = progress_interval
+        self.failed = {}  # filename -> error message
+        self.ingested = []
+        self.uploaded = {}  # filename -> chunk ids in the index, until the file is done
+
+    def _fail(self, filename, error):
+        if filename not in self.failed:
+            print(f"Ingestion of {filename} failed: {error}")
+            self.failed[filename] = str(error)
+            self.progress.add("files_failed")
+
+    # --- stage 1: parse (feeds the embed queue one batch at a time) ---
+    def _enqueue_batch(self, filename, docs):
+        self.progress.add("parsed", len(docs))
+        self.embed_queue.put((filename, docs, None))  # blocks when embedding lags
+
+    def _finish_file(self, filename, ids):
+        self.embed_queue.put((filename, [], ids))  # after the file's last batch: checkpoint it
+
+    def _parse_all(self, file_paths):
+        if self.workers == 1 or len(file_paths) < INGEST_POOL_MIN_FILES:
+            for file_path in file_paths:
+                filename = os.path.basename(file_path)
+                ids = []
+                try:
+                    for batch in parse_pdf_batches(file_path, self.batch_size):
+                        ids.extend(doc["id"] for doc in batch)
+                        self._enqueue_batch(filename, batch)
+                except Exception as e:
+                    self._fail(filename, e)
+                    continue
+                self._finish_file(filename, ids)
+            return
+
+        # spawn: the host process (Streamlit, the client event loop) is multi-threaded
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager, \
+                ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            # Workers stream page batches through a bounded queue, so memory holds a few
+            # batches rather than whole files
+            results = manager.Queue(maxsize=self.workers * 2)
+            futures = {pool.submit(stream_pdf_file, path, self.batch_size, results): os.path.basename(path)
+                       for path in file_paths}
+            remaining = set(futures.values())
+            while remaining:
+                try:
+                    kind, filename, payload = results.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker that crashed never reports; its future carries the error
+                    for future, filename in futures.items():
+                        if filename in remaining and future.done() and future.exception() is not None:
+                            self._fail(filename, future.exception())
+                            remaining.discard(filename)
+                    continue
+                if kind == "batch":
+                    if filename not in self.failed:
+                        self._enqueue_batch(filename, payload)
+                    continue
+                remaining.discard(filename)
+                if kind == "failed":
+                    self._fail(filename, payload)
+                else:
+                    self._finish_file(filename, payload)
+
+    # --- stage 2: embed ---
+    def _embed_loop(self):
+        from models.embedder import embed_texts
+        from utils.llm_scheduler import llm_priority, PRIORITY_INGESTION
+
+        with llm_priority(PRIORITY_INGESTION):
+            self._embed_batches(embed_texts)
+
+    def _embed_batches(self, embed_texts):
+        while True:
+            item = self.embed_queue.get()
+            if item is _END:
+                self.upload_queue.put(_END)
+                return
+            filename, docs, ids = item
+            if docs and filename not in self.failed:
+                try:
+                    vectors = embed_texts([doc["content"] for doc in docs])
+                    for doc, vector in zip(docs, vectors):
+                        doc["content_vector"] = vector
+                    self.progress.add("embedded", len(docs))
+                except Exception as e:
+                    self._fail(filename, e)
+            self.upload_queue.put((filename, docs, ids))
+
+    # --- stage 3: upload + checkpoint ---
+    def _upload_loop(self):
+        from models.embeddings import upload_documents_in_batches
+
+        while True:
+            item = self.upload_queue.get()
+            if item is _END:
+                return
+            filename, docs, ids = item
+            if filename in self.failed:
+                continue
+            try:
+                if docs:
+                    self.uploaded.setdefault(filename, []).extend(doc["id"] for doc in docs)
+                    self.progress.add("uploaded", upload_documents_in_batches(docs))
+                if ids is not None:
+                    self.on_file_done(filename, ids)
+                    self.uploaded.pop(filename, None)
+                    self.ingested.append(filename)
+                    self.progress.add("files_done")
+                    self.progress.report(force=True)
+            except Exception as e:
+                self._fail(filename, e)
+            self.progress.report()
+
+    def run(self, file_paths):
+        """
+        Ingest the given PDFs; returns {"ingested": [...], "failed": {filename: error},
+        "partial": {filename: chunk ids}}, where "partial" lists the chunks failed files had
+        already uploaded (possibly including the batch whose upload failed).
+        """
+        self.progress = IngestProgress(len(file_paths), self.progress_interval)
+        embedder = threading.Thread(target=self._embed_loop, name="ingest-embed", daemon=True)
+        uploader = threading.Thread(target=self._upload_loop, name="ingest-upload", daemon=True)
+        embedder.start()
+        uploader.start()
+        try:
+            self._parse_all(file_paths)
+        finally:
+            self.embed_queue.put(_END)
+            embedder.join()
+            uploader.join()
+        partial = {filename: ids for filename, ids in self.uploaded.items() if filename in self.failed}
+        return {"ingested": self.ingested, "failed": self.failed, "partial": partial}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest the PDFs in data/ into the configured search index.")
+    parser.add_argument("--force", action="store_true", help="re-ingest every file (resumable if interrupted)")
+    parser.add_argument("--workers", type=int, default=INGEST_PARSE_WORKERS, help="PDF parsing processes")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="chunks per embed/upload batch")
+    parser.add_argument("--progress-interval", type=float, default=2.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    from models.embeddings import ensure_corpus_ingested
+
+    summary = ensure_corpus_ingested(force=args.force, pipeline_options={
+        "workers": args.workers, "batch_size": args.batch_size, "progress_interval": args.progress_interval,
+    })
+    print(summary)
+    return 1 if summary.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
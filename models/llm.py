@@ -1,18 +1,108 @@
 # LLM.py
 import os
-from langchain_openai import AzureChatOpenAI
+import math
+import time
 from dotenv import load_dotenv
+from config.clients import get_chat_llm
+from utils.tracing import span, record_usage
+from utils.llm_scheduler import get_llm_scheduler, estimate_tokens, PRIORITY_CLASSIFICATION, LLMBusyError
+from utils.model_tiers import select_model
 
 load_dotenv()
-llm = AzureChatOpenAI(
-    model="gpt-4o",
-    temperature=0,
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    azure_endpoint=os.getenv("AZURE_ENDPOINT"),
-    api_version="2025-01-01-preview"
-)
+import re
 import json
-def classify_response_and_relevance(bot_response: str, user_query: str) -> dict:
+
+# --- Single-pass classification ---
+# The RAG answer call is asked to prefix its answer with this status line, so no second
+# classification round-trip is needed.
+STATUS_LINE_INSTRUCTIONS = """
+Before the answer, write exactly one status line in this format and nothing else on that line:
+STATUS: <positive|negative>; RELEVANT: <yes|no>
+- STATUS is "negative" if the context does not contain the information needed to answer, otherwise "positive".
+- RELEVANT is "yes" if the question is about banking, finance, loans, accounts, cards, claims, insurance, premiums or policies, otherwise "no".
+Then write the answer on the following lines."""
+
+STATUS_LINE_PATTERN = re.compile(
+    r"^\s*STATUS:\s*(positive|negative)\s*;\s*RELEVANT:\s*(yes|no)\s*$", re.IGNORECASE | re.MULTILINE
+)
+
+NEGATIVE_PHRASES = [
+    "i do not know", "i don't know", "not available", "i am not sure", "not found",
+    "cannot answer", "can't answer", "no information", "does not include any information",
+    "does not contain", "does not provide", "not mentioned",
+]
+
+RELEVANT_TERMS = [
+    "bank", "financ", "loan", "account", "card", "claim", "insur", "premium", "polic",
+    "cover", "eligib", "medishield", "insurewell", "hospital", "sum insured", "deductible",
+    "benefit", "rider", "renew", "accident", "health", "life shield", "senior", "dependent",
+]
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "for", "of", "to", "in", "on", "and", "or", "my", "me",
+    "i", "what", "which", "who", "how", "can", "do", "does", "it", "this", "that", "with", "about",
+    "please", "tell", "any", "there", "be", "you", "your", "give", "list", "all",
+}
+PRECHECK_MIN_COVERAGE = float(os.getenv("PRECHECK_MIN_COVERAGE", "0.3"))
+PRECHECK_MIN_SCORE = float(os.getenv("PRECHECK_MIN_SCORE", "0"))
+
+
+def is_query_relevant(user_query: str) -> bool:
+    """Cheap local stand-in for the classifier's banking/insurance relevance check."""
+    text = user_query.lower()
+    return any(term in text for term in RELEVANT_TERMS)
+
+
+def heuristic_classification(bot_response: str, user_query: str) -> dict:
+    text = bot_response.lower()
+    negative = not text.strip() or any(phrase in text for phrase in NEGATIVE_PHRASES)
+    return {
+        "response_class": "negative" if negative else "positive",
+        "is_relevant": "yes" if is_query_relevant(user_query) else "no",
+    }
+
+
+def split_status_line(text: str, user_query: str) -> tuple:
+    """Split a single-pass answer into (classification, answer). Falls back to heuristics."""
+    match = STATUS_LINE_PATTERN.search(text[:200])
+    if not match:
+        return heuristic_classification(text, user_query), text.strip()
+    classification = {"response_class": match.group(1).lower(), "is_relevant": match.group(2).lower()}
+    answer = (text[:match.start()] + text[match.end():]).strip()
+    return classification, answer
+
+
+def retrieval_coverage(user_query: str, chunks: list) -> float:
+    """Best fraction of the query's content words found in any single retrieved chunk."""
+    terms = {t for t in re.findall(r"[a-z0-9]+", user_query.lower()) if t not in STOPWORDS}
+    if not terms:
+        return 1.0
+    best = 0.0
+    for chunk in chunks:
+        content_terms = set(re.findall(r"[a-z0-9]+", chunk["content"].lower()))
+        best = max(best, len(terms & content_terms) / len(terms))
+    return best
+
+
+def precheck_route(user_query: str, chunks: list) -> str:
+    """
+    Decide KB vs web before any generation, from retrieval results and local heuristics.
+
+    Returns "web" when the query is banking/insurance related but retrieval clearly has
+    nothing to work with (the case that used to end in a negative KB answer plus a
+    fallback), otherwise "kb".
+    """
+    if not is_query_relevant(user_query):
+        return "kb"
+    if not chunks:
+        return "web"
+    top_score = max(chunk.get("score", 0.0) for chunk in chunks)
+    if top_score < PRECHECK_MIN_SCORE or retrieval_coverage(user_query, chunks) < PRECHECK_MIN_COVERAGE:
+        return "web"
+    return "kb"
+
+
+def build_classification_messages(bot_response: str, user_query: str) -> list:
     prompt = f"""
 You are a strict classifier.
 
@@ -48,23 +138,134 @@ Bot Response:
 User Query:
 \"\"\"{user_query}\"\"\"
 """
-    ...
+    return [
+        {"role": "system", "content": "You are a helpful assistant trained to classify responses and queries."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def parse_classification(content: str) -> dict:
+    content = content.strip()
+
+    # In case LLM wrapped response in triple quotes or backticks
+    content = content.replace("```json", "").replace("```", "").strip()
+
+    classification = json.loads(content)
+    print(f"Classification result: {classification}")
+    return classification
 
-    try:
-        response = llm.invoke([
-            {"role": "system", "content": "You are a helpful assistant trained to classify responses and queries."},
-            {"role": "user", "content": prompt}
-        ])
 
-        content = response.content.strip()
+def _classification_call(bot_response: str, user_query: str, method: str) -> tuple:
+    """(model, fn, tokens) for one classification request; method is "invoke" or "ainvoke"."""
+    model = select_model("classification")
+    messages = build_classification_messages(bot_response, user_query)
+    llm = get_chat_llm(model["deployment"])
+    return (model, lambda: getattr(llm, method)(messages, max_tokens=model["max_tokens"]),
+            estimate_tokens(messages, max_tokens=model["max_tokens"]))
 
-        # In case LLM wrapped response in triple quotes or backticks
-        content = content.replace("```json", "").replace("```", "").strip()
 
-        classification = json.loads(content)
-        print(f"Classification result: {classification}")
-        return classification
+def _classification_result(record, response) -> dict:
+    usage = getattr(response, "usage_metadata", None) or {}
+    record["prompt_tokens"] = usage.get("input_tokens")
+    record["completion_tokens"] = usage.get("output_tokens")
+    return parse_classification(response.content)
 
+
+def _classification_failed(error) -> dict:
+    print("Error in classification:", error)
+    return {"response_class": "positive", "is_relevant": "no"}  # safe fallback
+
+
+def classify_response_and_relevance(bot_response: str, user_query: str) -> dict:
+    try:
+        model, fn, tokens = _classification_call(bot_response, user_query, "invoke")
+        with span("classification", model=model["deployment"], tier=model["tier"]) as record:
+            response = get_llm_scheduler().call(model["deployment"], fn, tokens=tokens, priority=PRIORITY_CLASSIFICATION)
+            return _classification_result(record, response)
     except Exception as e:
-        print("Error in classification:", e)
-        return {"response_class": "positive", "is_relevant": "no"}  # safe fallback
+        return _classification_failed(e)
+
+
+async def aclassify_response_and_relevance(bot_response: str, user_query: str) -> dict:
+    """Coroutine version of classify_response_and_relevance."""
+    try:
+        model, fn, tokens = _classification_call(bot_response, user_query, "ainvoke")
+        with span("classification", model=model["deployment"], tier=model["tier"]) as record:
+            response = await get_llm_scheduler().acall(model["deployment"], fn, tokens=tokens,
+                                                       priority=PRIORITY_CLASSIFICATION)
+            return _classification_result(record, response)
+    except Exception as e:
+        return _classification_failed(e)
+
+
+# --- Answer completions ---
+# The KB and web answer paths share these; only the transport (sync, async, streamed) differs.
+BUSY_REPLY = "The assistant is busy right now. Please try again in {seconds} seconds."
+FAILED_REPLY_PREFIXES = ("Error", BUSY_REPLY.split(".")[0])
+
+
+def failure_reply(error, prefix: str) -> str:
+    """Reply text for a failed answer: a busy notice with its retry time for quota errors, else prefix + error."""
+    if isinstance(error, LLMBusyError):
+        return BUSY_REPLY.format(seconds=max(1, math.ceil(error.retry_after or 0)))
+    return f"{prefix}{error}"
+
+
+def is_failed_reply(answer: str) -> bool:
+    """True for error and busy replies, which must never be cached or precomputed."""
+    return answer.startswith(FAILED_REPLY_PREFIXES)
+
+
+def _completion_call(task: str, mode: str, messages: list, get_client, **params) -> tuple:
+    """(model, fn, tokens) for one chat completion on the task's model tier."""
+    model = select_model(task, mode)
+    return (model, lambda: get_client().chat.completions.create(
+        model=model["deployment"],
+        messages=messages,
+        temperature=0.7,
+        max_tokens=model["max_tokens"],
+        **params,
+    ), estimate_tokens(messages, max_tokens=model["max_tokens"]))
+
+
+def chat_completion(task: str, mode: str, messages: list, get_client) -> str:
+    """Run one scheduled, traced completion with get_client()'s client; returns the answer text."""
+    model, fn, tokens = _completion_call(task, mode, messages, get_client)
+    with span("llm_completion", task=task, model=model["deployment"], tier=model["tier"]) as record:
+        completion = get_llm_scheduler().call(model["deployment"], fn, tokens=tokens)
+        record_usage(record, completion)
+    return completion.choices[0].message.content.strip()
+
+
+async def achat_completion(task: str, mode: str, messages: list, get_client) -> str:
+    """Coroutine version of chat_completion; get_client returns an async client."""
+    model, fn, tokens = _completion_call(task, mode, messages, get_client)
+    with span("llm_completion", task=task, model=model["deployment"], tier=model["tier"]) as record:
+        completion = await get_llm_scheduler().acall(model["deployment"], fn, tokens=tokens)
+        record_usage(record, completion)
+    return completion.choices[0].message.content.strip()
+
+
+def stream_chat_completion(task: str, mode: str, messages: list, get_client):
+    """Streaming chat_completion: yields the answer's text deltas."""
+    started, sent = time.perf_counter(), []
+    model, fn, tokens = _completion_call(task, mode, messages, get_client, stream=True)
+    scheduler = get_llm_scheduler()
+    completion = scheduler.call(model["deployment"], lambda: sent.append(time.monotonic()) or fn(),
+                                tokens=tokens, stream=True)
+    yield from stream_completion_text(completion, task, model["deployment"], started)
+    # The p95 behind model downgrades must include generation, not just the time to the response headers
+    scheduler.record_latency(model["deployment"], time.monotonic() - sent[-1])
+
+
+def stream_completion_text(completion, task: str = "kb_answer", model: str = None, started: float = None):
+    """Yield the text deltas of a streamed chat completion, tracing time to first token."""
+    with span("llm_completion", task=task, model=model, stream=True) as record:
+        started, deltas = started or time.perf_counter(), 0
+        for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                if not deltas:
+                    record["time_to_first_token"] = time.perf_counter() - started
+                deltas += 1
+                yield chunk.choices[0].delta.content
+        record["deltas"] = deltas
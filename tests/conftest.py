@@ -0,0 +1,7 @@
+# conftest.py
+# Tests run offline: the repo root goes on sys.path so `utils`, `models` and `benchmarks` import.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+# test_answer_cache.py
+import pytest
+
+from config.config import get_embeddings_vector
+from models.embedder import HashEmbedder, get_embedder, set_embedder
+from utils.answer_cache import AnswerCache
+
+# Queries that mean the same thing share a vector; the semantic lookup only sees these
+VECTORS = {"what is the entry age": [1.0, 0.0, 0.0], "how old must i be to join": [0.99, 0.1, 0.0],
+           "what is the waiting period": [0.0, 1.0, 0.0]}
+
+
+class CountingEmbedder(HashEmbedder):
+    def __init__(self):
+        super().__init__(dimensions=64)
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return super().embed(texts)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(path=str(tmp_path / "answers.json"), max_entries=3, ttl_seconds=3600, similarity=0.9,
+                       semantic=True, embed_fn=lambda query: VECTORS[query.lower().rstrip("?")])
+
+
+def test_cache_miss_embedding_is_reused_by_retrieval(tmp_path):
+    embedder, previous = CountingEmbedder(), get_embedder()
+    set_embedder(embedder)
+    try:
+        cache = AnswerCache(path=str(tmp_path / "answers.json"))
+        cache.put("What is the entry age?", "concise", "insurance", "18 to 65", "Knowledge Base")
+        question = "Does Health Protect cover day-care treatment?"
+        assert cache.get(question, "concise", "insurance") is None
+        get_embeddings_vector(question)  # what hybrid_search embeds after the miss
+        assert embedder.texts == ["What is the entry age?", question]
+    finally:
+        set_embedder(previous)
+
+
+def test_lookups_match_normalized_queries_then_similar_ones(cache):
+    cache.put("What is the entry age?", "concise", "insurance", "18 to 65", "Knowledge Base")
+
+    assert cache.get("  what is the ENTRY age ", "concise", "insurance")["answer"] == "18 to 65"
+    assert cache.get("How old must I be to join?", "concise", "insurance")["answer"] == "18 to 65"
+    assert cache.get("What is the waiting period?", "concise", "insurance") is None
+    assert cache.get("What is the entry age?", "detailed", "insurance") is None  # other response mode
+    assert cache.stats == {"exact_hits": 1, "semantic_hits": 1, "misses": 2}
+
+
+def test_corpus_change_drops_only_document_answers(cache):
+    cache.set_corpus_version("v1")
+    cache.put("What is the entry age?", "concise", "insurance", "18 to 65", "Knowledge Base")
+    cache.put("What is the waiting period?", "concise", "general", "Usually 30 days", "Web Search")
+
+    cache.set_corpus_version("v2")
+    assert cache.get("What is the entry age?", "concise", "insurance") is None
+    assert cache.get("What is the waiting period?", "concise", "general")["answer"] == "Usually 30 days"
+
+
+def test_entries_expire_and_are_evicted_least_recently_used_first(cache):
+    cache.semantic = False
+    for n in range(3):
+        cache.put(f"question {n}", "concise", "general", f"answer {n}", "Web Search")
+    cache.get("question 0", "concise", "general")
+    cache.put("question 3", "concise", "general", "answer 3", "Web Search")
+    assert [entry["query"] for entry in cache.entries.values()] == ["question 2", "question 0", "question 3"]
+
+    cache.ttl_seconds = -1
+    assert cache.get("question 3", "concise", "general") is None
+
+
+def test_a_restart_loads_the_saved_entries(cache, tmp_path):
+    cache.set_corpus_version("v1")
+    cache.put("What is the entry age?", "concise", "insurance", "18 to 65", "Knowledge Base")
+    cache.save()
+
+    restarted = AnswerCache(path=cache.path, semantic=True, similarity=0.9,
+                            embed_fn=lambda query: VECTORS[query.lower().rstrip("?")])
+    assert restarted.corpus_version == "v1"
+    assert restarted.get("How old must I be to join?", "concise", "insurance")["answer"] == "18 to 65"
@@ -0,0 +1,20 @@
+# test_benchmark_config.py
+from benchmarks.run import config_mismatch, compare
+
+CONFIG = {"sessions": 8, "requests": 40, "llm_latency": 0.05, "error_rate": 0.0}
+
+
+def test_differing_settings_are_reported_before_comparing():
+    baseline = {"config": CONFIG, "results": {}}
+    assert config_mismatch(CONFIG, baseline) == []
+    assert config_mismatch({**CONFIG, "sessions": 4, "error_rate": 0.1}, baseline) == [
+        "error_rate: 0.1 vs baseline 0.0", "sessions: 4 vs baseline 8"]
+    assert config_mismatch(CONFIG, {"results": {}}) != []  # baselines without a config never match
+
+
+def test_regressions_respect_direction_and_tolerance():
+    baseline = {"results": {"kb_answer": {"p50": 100.0, "throughput_rps": 10.0, "errors": 0}}}
+    assert compare({"kb_answer": {"p50": 115.0, "throughput_rps": 9.0, "errors": 0}}, baseline, 0.2) == []
+    assert compare({"kb_answer": {"p50": 130.0, "throughput_rps": 7.0, "errors": 1}}, baseline, 0.2) == [
+        "kb_answer.p50: 130.0 vs baseline 100.0", "kb_answer.throughput_rps: 7.0 vs baseline 10.0",
+        "kb_answer.errors: 1 vs baseline 0"]
@@ -0,0 +1,20 @@
+# test_chat_render.py
+import importlib
+
+import utils.chat_render as chat_render
+
+
+def test_bubble_html_is_memoized_per_message_across_module_users():
+    message = {"id": "m-1", "role": "bot", "text": "**Covered** up to 65.", "source": "Knowledge Base"}
+    first = chat_render.cached_bubble_html(message)
+    hits = chat_render._cached_bubble_html.cache_info().hits
+    # A Streamlit rerun re-imports the app script, not utils modules, so the memo survives it
+    assert importlib.import_module("utils.chat_render").cached_bubble_html(dict(message)) is first
+    assert chat_render._cached_bubble_html.cache_info().hits == hits + 1
+    assert "<strong>Covered</strong>" in first
+
+
+def test_edited_text_is_rendered_again():
+    message = {"id": "m-2", "role": "bot", "text": "old", "source": "Web Search"}
+    assert "old" in chat_render.cached_bubble_html(message)
+    assert "new" in chat_render.cached_bubble_html({**message, "text": "new"})
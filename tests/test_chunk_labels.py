@@ -0,0 +1,67 @@
+# test_chunk_labels.py
+import asyncio
+import importlib
+
+import pytest
+
+import utils.chunk_labels as chunk_labels
+import utils.rag_tool as rag_tool
+from utils.chunk_labels import query_chunk_filter
+
+
+# Which queries get the eligibility intent. "policy" alone no longer triggers it (it did before
+# the whole-word change); the age / availability / member-type words still do.
+@pytest.mark.parametrize("query, eligibility", [
+    ("What is the entry age for Health Protect?", True),
+    ("Is this plan available for senior citizens?", True),
+    ("Can children be added to the policy?", True),
+    ("Who is eligible for the Accident Guard policy?", True),
+    ("Up to what age can adults renew?", True),
+    ("What does the Insurewell Life Shield policy cover?", False),
+    ("Tell me about the policy", False),
+    ("What is the coverage for hospitalisation?", False),
+    ("What percentage of the premium is refunded?", False),
+    ("How do I manage my policy renewal?", False),
+    ("What is the monthly premium of this policy?", False),
+])
+def test_which_queries_get_the_eligibility_filter(query, eligibility):
+    assert query_chunk_filter(query) == ({"chunk_type": "eligibility"} if eligibility else None)
+
+
+def test_policy_can_be_restored_as_a_trigger(monkeypatch):
+    monkeypatch.setenv("ELIGIBILITY_QUERY_EXTRA_TERMS", "policy")
+    labels = importlib.reload(chunk_labels)
+    try:
+        assert labels.query_chunk_filter("Tell me about the policy") == {"chunk_type": "eligibility"}
+    finally:
+        monkeypatch.delenv("ELIGIBILITY_QUERY_EXTRA_TERMS")
+        importlib.reload(chunk_labels)
+
+
+def test_sparse_intent_is_filled_from_the_same_single_search(monkeypatch):
+    eligibility = [{"id": "e1", "content": "Adults aged 18 to 65.", "chunk_type": "eligibility"}]
+    premium = [{"id": f"p{i}", "content": f"Premium table {i}.", "chunk_type": "premium"} for i in range(5)]
+    unlabelled = [{"id": "old", "content": "Who can avail this cover: adults and their children."}]
+    calls = []
+
+    def keyword_search(query, k, filters=None):
+        calls.append((k, filters))
+        return (premium[:2] + eligibility + premium[2:] + unlabelled)[:k]
+
+    monkeypatch.setattr(rag_tool, "keyword_search", keyword_search)
+    chunks = rag_tool.get_relevant_chunks("What is the entry age?", k=4, mode="keyword")
+    assert [chunk["id"] for chunk in chunks] == ["e1", "old", "p0", "p1"]
+    assert calls == [(4 * rag_tool.RETRIEVAL_FILTER_CANDIDATES_FACTOR, None)]
+
+
+def test_asearch_without_intent_fetches_k(monkeypatch):
+    calls = []
+
+    class Retriever:
+        async def akeyword_search(self, query, k, filters=None):
+            calls.append((k, filters))
+            return [{"id": "p0", "content": "Premium table.", "chunk_type": "premium"}]
+
+    monkeypatch.setattr(rag_tool, "get_retriever", Retriever)
+    chunks = asyncio.run(rag_tool.aget_relevant_chunks("What is the monthly premium?", k=3, mode="keyword"))
+    assert [chunk["id"] for chunk in chunks] == ["p0"] and calls == [(3, None)]
@@ -0,0 +1,47 @@
+# test_context_packer.py
+from utils.context_packer import count_tokens, naive_context, pack_context
+
+CLAUSE = "Adults aged 18 to 65 can apply for cover under this plan without a medical examination."
+
+
+def chunk(position, content, policy="Health Protect", score=1.0):
+    return {"id": f"health.pdf_{position}_{position:016x}", "policy": policy, "content": content, "score": score}
+
+
+def test_adjacent_chunks_merge_on_their_overlap():
+    left = "The entry age for this plan is 18 to 65 years, and cover renews yearly"
+    right = "and cover renews yearly until the insured turns 99."
+    context, stats = pack_context([chunk(3, left), chunk(4, right)])
+
+    assert context == f"Policy: Health Protect\nContent:\n{left} until the insured turns 99.\n\n"
+    assert stats["chunks_used"] == 2 and stats["prompt_tokens_truncated"] == 0
+    assert stats["prompt_tokens_saved"] > 0
+
+
+def test_near_duplicates_are_dropped_only_within_a_policy():
+    chunks = [chunk(1, CLAUSE), chunk(7, CLAUSE + " Terms apply.", score=0.5),
+              chunk(2, CLAUSE, policy="Family Shield")]
+    context, stats = pack_context(chunks)
+
+    assert stats["duplicates_dropped"] == 1
+    assert "Policy: Health Protect" in context and "Policy: Family Shield" in context
+    assert "Terms apply." not in context
+
+
+def test_collapsed_whitespace_is_not_counted_as_saved():
+    spaced = chunk(1, "  Adults   aged 18\n\n to 65  can   apply.  ")
+    _, stats = pack_context([spaced])
+    # One chunk has nothing to merge or share, so packing saves (close to) nothing
+    assert stats["prompt_tokens_saved"] <= 2 and stats["prompt_tokens_truncated"] == 0
+
+
+def test_budget_cuts_are_reported_apart_from_packing_savings():
+    chunks = [chunk(position * 10, f"Clause {position}: " + CLAUSE.replace("18", str(18 + position)),
+                    score=1.0 - position / 10) for position in range(6)]
+    full_context, full = pack_context(chunks, budget=10_000)
+    context, stats = pack_context(chunks, budget=count_tokens(full_context) // 2)
+
+    assert stats["chunks_truncated"] == 6 - stats["chunks_used"] > 0
+    assert stats["prompt_tokens_truncated"] == full["context_tokens"] - stats["context_tokens"]
+    assert stats["prompt_tokens_saved"] == full["prompt_tokens_saved"]
+    assert stats["prompt_tokens_saved"] < count_tokens(naive_context(chunks)) - stats["context_tokens"]
@@ -0,0 +1,46 @@
+# test_conversation.py
+import pytest
+
+import utils.conversation as conversation
+from utils.conversation import ConversationState
+
+
+@pytest.fixture
+def rewrites(monkeypatch):
+    """Messages sent to the rewrite LLM call."""
+    sent = []
+
+    def fake_chat(messages, max_tokens, task, priority=None):
+        sent.append(messages[-1]["content"])
+        return "What is the waiting period for MediShield Health Protect?"
+
+    monkeypatch.setattr(conversation, "_chat", fake_chat)
+    return sent
+
+
+@pytest.fixture
+def chat(rewrites):
+    state = ConversationState()
+    state.add_turn("Tell me about MediShield Health Protect", "It covers adults aged 18 to 65.")
+    return state
+
+
+@pytest.mark.parametrize("question", ["list all policies", "maternity cover?", "Accident Guard exclusions",
+                                      "What is the entry age for Insurewell Life Shield?"])
+def test_short_standalone_questions_are_not_rewritten(chat, rewrites, question):
+    assert not chat.is_follow_up(question)
+    assert chat.standalone_query(question) == question
+    assert rewrites == []
+
+
+@pytest.mark.parametrize("question", ["why?", "tell me more", "what about the waiting period?",
+                                      "Is it available for seniors?", "and for children"])
+def test_follow_ups_are_rewritten_once_per_turn(chat, rewrites, question):
+    assert chat.is_follow_up(question)
+    assert chat.standalone_query(question) == "What is the waiting period for MediShield Health Protect?"
+    chat.standalone_query(question)
+    assert len(rewrites) == 1
+
+
+def test_first_message_is_never_a_follow_up():
+    assert not ConversationState().is_follow_up("why?")
@@ -0,0 +1,103 @@
+# test_embedder.py
+import math
+import time
+
+import pytest
+
+import utils.llm_scheduler as llm_scheduler
+from models.embedder import EMBED_BATCH_SIZE, HashEmbedder, embed_texts, make_batches, with_retry
+from utils.llm_scheduler import LLMScheduler
+
+
+class SlowHashEmbedder(HashEmbedder):
+    """HashEmbedder that holds each batch long enough for pool threads to overlap."""
+
+    def embed(self, texts):
+        time.sleep(0.02)
+        return super().embed(texts)
+
+
+class RateLimited(Exception):
+    """Stands in for openai.RateLimitError: a 429 whose response carries retry-after-ms."""
+
+    status_code = 429
+
+    def __init__(self, retry_after_ms):
+        super().__init__("Rate limit is exceeded.")
+        self.response = type("Response", (), {"headers": {"retry-after-ms": str(retry_after_ms)}})()
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = LLMScheduler(quotas={})
+    monkeypatch.setattr(llm_scheduler, "_scheduler", scheduler)
+    return scheduler
+
+
+def test_embed_texts_runs_batches_concurrently_in_order():
+    texts = [f"Policy clause {i}: members aged {18 + i} are covered." for i in range(100)]
+    embedder = SlowHashEmbedder(dimensions=64)
+    vectors = embed_texts(texts, embedder=embedder, max_workers=4)
+    assert vectors == embedder.embed(texts)
+
+
+def test_hash_embedder_is_deterministic_and_normalized():
+    embedder = HashEmbedder(dimensions=64)
+    first, again, other = embedder.embed(["Entry age is 18 to 65", "Entry age is 18 to 65", "Waiting period"])
+    assert first == again and first != other
+    assert math.isclose(sum(v * v for v in first), 1.0)
+    assert embedder.embed_one("") == [0.0] * 64
+
+
+def test_make_batches_respects_size_and_character_limits():
+    texts = ["a" * 10] * 7
+    assert make_batches(texts, max_batch_size=3, max_batch_chars=1000) == [(0, 3), (3, 6), (6, 7)]
+    assert make_batches(texts, max_batch_size=16, max_batch_chars=25) == [(0, 2), (2, 4), (4, 6), (6, 7)]
+    # A single text longer than the character limit still gets a batch of its own
+    assert make_batches(["a" * 50, "b", "c"], max_batch_size=16, max_batch_chars=20) == [(0, 1), (1, 3)]
+    assert make_batches([]) == []
+
+
+def test_embed_texts_keeps_input_order_across_batches():
+    texts = [f"clause {i}" for i in range(EMBED_BATCH_SIZE * 2 + 3)]
+    seen = []
+
+    class RecordingEmbedder(HashEmbedder):
+        def embed(self, batch):
+            seen.append(list(batch))
+            return [[float(text.split()[1])] for text in batch]
+
+    vectors = embed_texts(texts, embedder=RecordingEmbedder(dimensions=1), max_workers=1)
+    assert vectors == [[float(i)] for i in range(len(texts))]
+    assert seen == [texts[start:end] for start, end in make_batches(texts)]
+    assert len(seen) == 3
+
+
+def test_with_retry_waits_out_retry_after_and_retries(scheduler):
+    calls = []
+
+    def embed(texts):
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise RateLimited(retry_after_ms=50)
+        return [[1.0] for _ in texts]
+
+    assert with_retry(embed, ["entry age", "waiting period"]) == [[1.0], [1.0]]
+    assert len(calls) == 3
+    assert all(later - earlier >= 0.045 for earlier, later in zip(calls, calls[1:]))
+    assert scheduler.stats["retries"] == 2 and scheduler.stats["throttled"] == 2
+
+
+def test_with_retry_does_not_retry_client_errors(scheduler):
+    calls = []
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    def embed(texts):
+        calls.append(texts)
+        raise BadRequest("input is too long")
+
+    with pytest.raises(BadRequest):
+        with_retry(embed, ["x" * 10])
+    assert len(calls) == 1 and scheduler.stats["retries"] == 0
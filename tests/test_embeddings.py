@@ -0,0 +1,120 @@
+# test_embeddings.py
+# Incremental ingestion (models/embeddings.py) into a local index with the offline HashEmbedder.
+import json
+import os
+import shutil
+
+import pytest
+
+import models.embeddings as embeddings
+from models.embedder import HashEmbedder, get_embedder, set_embedder
+from utils.local_index import LocalRetriever
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+PDF = "Medishield accident guard policy.pdf"
+
+
+class Cache:
+    def set_corpus_version(self, version):
+        pass
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    shutil.copy(os.path.join(DATA_DIR, PDF), data_dir / PDF)
+    retriever = LocalRetriever(index_dir=str(tmp_path / "index"))
+    monkeypatch.setattr(embeddings, "data_dir", str(data_dir))
+    monkeypatch.setattr(embeddings, "manifest_path", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(embeddings, "RETRIEVER_BACKEND", "local")
+    monkeypatch.setattr(embeddings, "get_retriever", lambda: retriever)
+    monkeypatch.setattr(embeddings, "get_answer_cache", Cache)
+    previous = get_embedder()
+    set_embedder(HashEmbedder(dimensions=8))
+    yield retriever
+    set_embedder(previous)
+
+
+def chunk(chunk_id, text):
+    return {"id": chunk_id, "content": text, "source": PDF, "content_vector": [1.0] + [0.0] * 7}
+
+
+def ingest():
+    return embeddings.upload_chunks_to_search(pipeline_options={"workers": 1})
+
+
+def test_version_migration_deletes_old_chunks_and_unreferenced_duplicates(corpus):
+    # Chunks of an older manifest version, plus uuid-keyed duplicates no manifest ever recorded
+    corpus.upsert([chunk("old_v2_chunk", "Accident cover, old layout."),
+                   chunk("Medishield_accident_guard_policy_pdf_0_1b2c", "Duplicate from an early run.")])
+    with open(embeddings.manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"version": embeddings.MANIFEST_VERSION - 1, "index_name": embeddings.index_name,
+                   "backend": "local", "index_created": True,
+                   "files": {PDF: {"sha256": "abc", "size": 1, "mtime": 1, "chunk_ids": ["old_v2_chunk"]}}}, f)
+
+    summary = ingest()
+    manifest = embeddings.load_manifest()
+    new_ids = manifest["files"][PDF]["chunk_ids"]
+    assert summary["ingested"] == [PDF] and new_ids
+    assert sorted(corpus.ids()) == sorted(new_ids)
+    assert "purge_orphans" not in manifest
+
+    # Later runs neither re-ingest nor list the index again
+    corpus.upsert([chunk("added_by_someone_else", "Not ours.")])
+    assert ingest()["skipped"] == [PDF]
+    assert "added_by_someone_else" in corpus.ids()
+
+
+def test_manifest_for_another_backend_starts_empty(corpus):
+    with open(embeddings.manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"version": embeddings.MANIFEST_VERSION, "index_name": embeddings.index_name,
+                   "files": {PDF: {"sha256": "abc", "size": 1, "mtime": 1, "chunk_ids": ["azure_chunk"]}}}, f)
+    manifest = embeddings.load_manifest()
+    assert manifest["files"] == {} and manifest["purge_orphans"]
+
+
+@pytest.fixture
+def upload_fails_after_first_batch(corpus, monkeypatch):
+    calls = []
+
+    def upload_documents_in_batches(docs):
+        calls.append(docs)
+        if len(calls) > 1:
+            raise ConnectionError("search unavailable")
+        return corpus.upsert(docs)
+
+    monkeypatch.setattr(embeddings, "upload_documents_in_batches", upload_documents_in_batches)
+    return calls
+
+
+def ingest_in_small_batches():
+    return embeddings.upload_chunks_to_search(pipeline_options={"workers": 1, "batch_size": 2})
+
+
+def test_failed_file_has_its_uploaded_chunks_removed(corpus, upload_fails_after_first_batch):
+    summary = ingest_in_small_batches()
+    assert PDF in summary["failed"] and len(upload_fails_after_first_batch) > 1
+    assert corpus.ids() == []
+    assert embeddings.load_manifest()["files"][PDF]["chunk_ids"] == []
+
+
+def test_failed_cleanup_is_recorded_and_retried_next_run(corpus, upload_fails_after_first_batch, monkeypatch):
+    delete_chunks, attempts = embeddings.delete_chunks, []
+
+    def flaky_delete_chunks(chunk_ids):
+        attempts.append(chunk_ids)
+        if len(attempts) == 1:
+            raise ConnectionError("search unavailable")
+        delete_chunks(chunk_ids)
+
+    monkeypatch.setattr(embeddings, "delete_chunks", flaky_delete_chunks)
+    ingest_in_small_batches()
+    leftover = corpus.ids()
+    # Recorded ids include the batch whose upload failed: it may have partly landed
+    assert leftover and set(leftover) <= set(embeddings.load_manifest()["files"][PDF]["chunk_ids"])
+
+    # The file is deleted before the next run: its leftover chunks are purged with it
+    os.remove(os.path.join(embeddings.data_dir, PDF))
+    summary = embeddings.upload_chunks_to_search()
+    assert summary["deleted"] == [PDF] and corpus.ids() == []
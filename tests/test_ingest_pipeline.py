@@ -0,0 +1,52 @@
+# test_ingest_pipeline.py
+# Runs the real PDF parsing on data/ with the offline HashEmbedder and a fake upload stage.
+import os
+
+import pytest
+
+import models.embeddings as embeddings
+import models.ingest_pipeline as ingest_pipeline
+from models.embedder import HashEmbedder, get_embedder, set_embedder
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+PDFS = sorted(os.path.join(DATA_DIR, name) for name in os.listdir(DATA_DIR) if name.endswith(".pdf"))
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    uploads, events = [], []
+
+    def upload_documents_in_batches(docs):
+        uploads.append(list(docs))
+        events.extend(("upload", doc["source"]) for doc in docs)
+        return len(docs)
+
+    monkeypatch.setattr(embeddings, "upload_documents_in_batches", upload_documents_in_batches)
+    previous = get_embedder()
+    set_embedder(HashEmbedder(dimensions=8))
+    yield uploads, events
+    set_embedder(previous)
+
+
+@pytest.mark.parametrize("workers, pool_min_files", [(1, 8), (2, 1)])
+def test_files_stream_in_batches_and_checkpoint_after_their_last_batch(offline, monkeypatch, workers, pool_min_files):
+    uploads, events = offline
+    monkeypatch.setattr(ingest_pipeline, "INGEST_POOL_MIN_FILES", pool_min_files)
+    done = {}
+
+    def on_file_done(filename, ids):
+        done[filename] = ids
+        events.append(("done", filename))
+
+    result = ingest_pipeline.IngestPipeline(on_file_done, workers=workers, batch_size=4).run(PDFS)
+
+    assert result["failed"] == {} and sorted(result["ingested"]) == sorted(map(os.path.basename, PDFS))
+    assert all(0 < len(batch) <= 4 for batch in uploads)
+    for path in PDFS:
+        filename = os.path.basename(path)
+        expected = [doc["id"] for batch in ingest_pipeline.parse_pdf_batches(path, 4) for doc in batch]
+        assert done[filename] == expected
+        assert [doc["id"] for batch in uploads for doc in batch if doc["source"] == filename] == expected
+        last_upload = max(i for i, event in enumerate(events) if event == ("upload", filename))
+        assert events.index(("done", filename)) > last_upload
+    assert all(len(doc["content_vector"]) == 8 for batch in uploads for doc in batch)
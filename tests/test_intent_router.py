@@ -0,0 +1,68 @@
+# test_intent_router.py
+# Routing against a small FAQ set; precomputed answers come from a faked knowledge base.
+import json
+
+import pytest
+
+import models.embeddings as embeddings
+import utils.rag_tool as rag_tool
+from models.llm import failure_reply
+from utils.intent_router import ACKNOWLEDGMENT_REPLY, IntentRouter
+
+FAQS = [
+    {"id": "policy_list", "source": "policy_list", "questions": ["list all policies", "what policies do you offer"]},
+    {"id": "entry_age", "questions": ["what is the entry age for health protect"]},
+    {"id": "claims", "questions": ["how do i make a claim"], "chat_modes": ["insurance", "general"],
+     "answer": "Submit the claim form within 30 days."},
+    {"id": "waiting_period", "questions": ["what is the waiting period for accident guard"]},
+]
+MANIFEST = {"files": {"Health Protect.pdf": {"sha256": "a"}, "Accident Guard.pdf": {"sha256": "b"}}}
+
+
+@pytest.fixture
+def router(tmp_path):
+    faq_path = tmp_path / "faq.json"
+    faq_path.write_text(json.dumps(FAQS), encoding="utf-8")
+    answers = {"entry_age": {"concise": "18 to 65."}, "claims": {"concise": "Submit the claim form within 30 days."}}
+    answers_path = tmp_path / "faq_answers.json"
+    answers_path.write_text(json.dumps({"corpus_version": "v1", "answers": answers}), encoding="utf-8")
+    return IntentRouter(faq_path=str(faq_path), answers_path=str(answers_path), embedding_tier=False)
+
+
+def test_acknowledgments_get_the_canned_reply(router):
+    route = router.route("  Thanks ", "insurance")
+    assert route["intent"] == "acknowledgment" and route["reply"] == ACKNOWLEDGMENT_REPLY
+    assert router.route("thanks, but what is the waiting period?", "insurance") is None
+
+
+def test_faqs_match_reordered_wording_when_an_answer_is_ready(router):
+    route = router.route("For Health Protect, what is the entry age?", "insurance", llm_calls_saved=2)
+    assert (route["intent"], route["reply"], route["source"]) == ("faq:entry_age", "18 to 65.", "FAQ")
+
+    assert router.route("What is the entry age for Health Protect?", "insurance", mode="detailed") is None
+    assert router.route("What is the waiting period for Accident Guard?", "insurance") is None  # no answer yet
+    assert router.route("What is the entry age for Health Protect?", "general") is None
+    assert router.route("How do I make a claim", "general")["intent"] == "faq:claims"
+    assert router.stats == {"routed": 5, "acknowledgment_hits": 0, "faq_hits": 2, "embedding_hits": 0,
+                            "misses": 3, "llm_calls_avoided": 3}
+
+
+def test_precompute_keeps_only_usable_answers(router, monkeypatch):
+    replies = {"what is the entry age for health protect": "18 to 65.",
+               "what is the waiting period for accident guard": failure_reply(RuntimeError("timed out"), "Error during RAG answering: ")}
+    monkeypatch.setattr(embeddings, "load_manifest", lambda: MANIFEST)
+    monkeypatch.setattr(rag_tool, "answer_with_knowledge_base", lambda question, mode: replies[question])
+
+    answers = router.precompute_answers()
+    assert answers["policy_list"]["concise"] == \
+        "These are the policies I can help you with:\n\n- Accident Guard\n- Health Protect"
+    assert answers["claims"]["detailed"] == "Submit the claim form within 30 days."
+    assert answers["entry_age"] == {"concise": "18 to 65.", "detailed": "18 to 65."}
+    assert "waiting_period" not in answers
+    assert router.corpus_version == embeddings.corpus_version(MANIFEST)
+    assert json.loads(open(router.answers_path, encoding="utf-8").read())["answers"] == answers
+
+
+def test_batch_classification_matches_route(router):
+    queries = ["hello!", "What policies do you offer?", "how much is the premium for my car"]
+    assert [intent for intent, _ in router.classify_many(queries)] == ["acknowledgment", "faq:policy_list", None]
@@ -0,0 +1,148 @@
+# test_llm_scheduler.py
+# The scheduler against the stub Azure OpenAI's injected 429s (benchmarks/stubs.py).
+
+import time
+import asyncio
+import threading
+
+import pytest
+from openai import AzureOpenAI
+
+import utils.llm_scheduler as llm_scheduler
+from benchmarks.stubs import StubServer, ServiceProfile
+from models.llm import stream_chat_completion
+from utils.llm_scheduler import LLMScheduler, LLMBusyError, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+DEPLOYMENT = "gpt-4o"
+MESSAGES = [{"role": "user", "content": "What is the entry age?"}]
+
+
+@pytest.fixture
+def stub():
+    with StubServer({"llm": ServiceProfile()}) as server:
+        yield server
+
+
+def make_client(stub):
+    return AzureOpenAI(azure_endpoint=stub.url, api_key="stub", api_version="2024-06-01", max_retries=0)
+
+
+def complete(client):
+    return lambda: client.chat.completions.create(model=DEPLOYMENT, messages=MESSAGES)
+
+
+def test_429_pauses_the_deployment_for_its_retry_after(stub):
+    profile = stub.state.profiles["llm"]
+    profile.error_rate, profile.retry_after = 1.0, 0.3
+    client = make_client(stub)
+    scheduler = LLMScheduler(quotas={})
+
+    def first_call_throttled():
+        profile.error_rate = 0.0 if stub.state.requests["llm"] else 1.0
+        return complete(client)()
+
+    started = time.monotonic()
+    result = scheduler.call(DEPLOYMENT, first_call_throttled, deadline=5)
+    assert result.choices[0].message.content
+    assert time.monotonic() - started >= 0.3
+    assert stub.state.errors["llm"] == 1 and stub.state.requests["llm"] == 2
+    assert scheduler.stats["throttled"] == 1 and scheduler.stats["retries"] == 1
+
+    # Every caller on the deployment waits out the cooldown, not just the one that was throttled
+    scheduler.budget(DEPLOYMENT).cooldown_until = time.monotonic() + 0.3
+    started = time.monotonic()
+    scheduler.call(DEPLOYMENT, complete(client), deadline=5)
+    assert time.monotonic() - started >= 0.25
+
+
+def test_higher_priority_is_admitted_first_after_a_cooldown(stub):
+    client = make_client(stub)
+    scheduler = LLMScheduler(quotas={})
+    scheduler.budget(DEPLOYMENT).cooldown_until = time.monotonic() + 0.3
+    order = []
+
+    def ask(name, priority):
+        def fn():
+            order.append(name)
+            return complete(client)()
+        scheduler.call(DEPLOYMENT, fn, priority=priority, deadline=5)
+
+    background = threading.Thread(target=ask, args=("background", PRIORITY_BACKGROUND))
+    background.start()
+    time.sleep(0.05)  # queued first
+    interactive = threading.Thread(target=ask, args=("interactive", PRIORITY_INTERACTIVE))
+    interactive.start()
+    background.join(5)
+    interactive.join(5)
+    assert order == ["interactive", "background"]
+
+
+def test_retry_after_beyond_the_deadline_is_rejected(stub):
+    profile = stub.state.profiles["llm"]
+    profile.error_rate, profile.retry_after = 1.0, 5
+    scheduler = LLMScheduler(quotas={})
+
+    started = time.monotonic()
+    with pytest.raises(LLMBusyError) as excinfo:
+        scheduler.call(DEPLOYMENT, complete(make_client(stub)), deadline=1)
+    assert time.monotonic() - started < 1
+    assert excinfo.value.retry_after == pytest.approx(5)
+    assert getattr(excinfo.value.__cause__, "status_code", None) == 429
+    assert stub.state.requests["llm"] == 1 and scheduler.stats["rejected"] == 1
+
+
+def test_exhausted_budget_is_rejected_without_waiting(stub):
+    client = make_client(stub)
+    scheduler = LLMScheduler(quotas={DEPLOYMENT: {"rpm": 1}})
+    scheduler.call(DEPLOYMENT, complete(client))
+
+    started = time.monotonic()
+    with pytest.raises(LLMBusyError) as excinfo:
+        scheduler.call(DEPLOYMENT, complete(client), deadline=2)
+    assert time.monotonic() - started < 0.5
+    assert excinfo.value.retry_after > 2
+    assert stub.state.requests["llm"] == 1
+
+
+def test_429_after_the_last_retry_is_a_busy_error(stub):
+    profile = stub.state.profiles["llm"]
+    profile.error_rate, profile.retry_after = 1.0, 0.05
+    scheduler = LLMScheduler(quotas={})
+
+    with pytest.raises(LLMBusyError) as excinfo:
+        scheduler.call(DEPLOYMENT, complete(make_client(stub)), deadline=5, max_retries=1)
+    assert excinfo.value.retry_after == pytest.approx(0.05)
+    assert getattr(excinfo.value.__cause__, "status_code", None) == 429
+    assert stub.state.requests["llm"] == 2
+
+
+def test_cancelled_call_gives_its_reservation_back():
+    scheduler = LLMScheduler(quotas={DEPLOYMENT: {"tpm": 10000}})
+
+    async def slow_request():
+        await asyncio.sleep(10)
+
+    async def scenario():
+        task = asyncio.create_task(scheduler.acall(DEPLOYMENT, slow_request, tokens=4000))
+        await asyncio.sleep(0.05)
+        assert scheduler.budget(DEPLOYMENT).window_tokens == 4000
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert scheduler.budget(DEPLOYMENT).window_tokens == 0
+    assert scheduler.stats["requests"] == 1
+
+
+def test_streamed_completion_latency_includes_generation(stub, monkeypatch):
+    stub.state.profiles["llm"].token_delay = 0.02
+    scheduler = LLMScheduler(quotas={})
+    monkeypatch.setattr(llm_scheduler, "_scheduler", scheduler)
+    client = make_client(stub)
+
+    deltas = list(stream_chat_completion("kb_answer", "concise", MESSAGES, lambda: client))
+    assert len(deltas) > 5
+    (deployment, budget), = scheduler.budgets.items()
+    (finished_at, seconds), = budget.latencies
+    assert seconds >= 0.02 * len(deltas) * 0.8
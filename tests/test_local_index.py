@@ -0,0 +1,39 @@
+# test_local_index.py
+import numpy as np
+
+from utils.local_index import LocalRetriever
+
+
+def doc(i, dimensions=8, label="general"):
+    vector = np.zeros(dimensions, dtype=np.float32)
+    vector[i % dimensions] = 1.0
+    vector[(i + 1) % dimensions] = 0.1 * (i // dimensions + 1)
+    return {"id": f"c{i}", "content": f"clause {i} about cover", "chunk_type": label, "content_vector": vector.tolist()}
+
+
+def test_batched_upserts_grow_in_place_and_search_every_row(tmp_path):
+    retriever = LocalRetriever(index_dir=str(tmp_path))
+    buffers = set()
+    for start in range(0, 500, 10):
+        retriever.upsert([doc(i) for i in range(start, start + 10)])
+        buffers.add(id(retriever._buffer))
+    assert retriever.vectors.shape == (500, 8)
+    assert len(buffers) < 10  # geometric growth, not one copy per batch
+    top = retriever.vector_search(doc(123)["content_vector"], k=1)
+    assert top[0]["id"] == "c123"
+
+
+def test_updates_replace_rows_and_survive_a_flush_and_mmap_reload(tmp_path):
+    retriever = LocalRetriever(index_dir=str(tmp_path))
+    retriever.upsert([doc(i) for i in range(20)])
+    retriever.upsert([{**doc(3), "content_vector": doc(5)["content_vector"], "chunk_type": "premium"}])
+    assert retriever.vectors.shape == (20, 8)
+    retriever.flush()
+
+    reloaded = LocalRetriever(index_dir=str(tmp_path), mmap=True)
+    assert reloaded.vectors.shape == (20, 8)
+    assert reloaded.vector_search(doc(5)["content_vector"], k=1, filters={"chunk_type": "premium"})[0]["id"] == "c3"
+    reloaded.upsert([doc(20)])  # leaves the read-only memory map before writing
+    assert reloaded.vector_search(doc(20)["content_vector"], k=1)[0]["id"] == "c20"
+    reloaded.delete(["c0"])
+    assert reloaded.vectors.shape == (20, 8) and "c0" not in reloaded.positions
@@ -0,0 +1,182 @@
+# test_orchestrator.py
+import asyncio
+
+import pytest
+
+import utils.orchestrator as orchestrator
+import utils.rag_tool as rag_tool
+import utils.tracing as tracing
+import utils.web_search_tool as web_search_tool
+from utils.answer_cache import AnswerCache
+from utils.llm_scheduler import LLMBusyError
+
+CHUNKS = [{"id": "1", "content": "Adults aged 18 to 65 can join MediShield Health Protect.", "label": "eligibility",
+           "policy": "MediShield Health Protect", "page": 1, "score": 1.0}]
+
+
+def fail_retrieval(*args, **kwargs):
+    raise ConnectionError("search unavailable")
+
+
+async def afail_retrieval(*args, **kwargs):
+    fail_retrieval()
+
+
+def quota_exhausted(*args, **kwargs):
+    raise LLMBusyError("Azure OpenAI quota for gpt-4o is exhausted", retry_after=12.3)
+
+
+class Router:
+    """Answers "hello" locally, like the acknowledgment tier; nothing else."""
+
+    def route(self, query, chat_mode, mode="concise", llm_calls_saved=1):
+        if query == "hello":
+            return {"intent": "acknowledgment", "reply": "Welcome!", "source": "System", "score": 100.0,
+                    "tier": "acknowledgment"}
+        return None
+
+
+class Conversation:
+    """Rewrites "and for children?" to a standalone question, like ConversationState with a model."""
+
+    def __init__(self):
+        self.turns = []
+
+    def standalone_query(self, question):
+        return "What is the entry age for children?" if question == "and for children?" else question
+
+    def add_turn(self, question, answer):
+        self.turns.append((question, answer))
+
+
+@pytest.fixture
+def answer_flow(monkeypatch, tmp_path):
+    """answer_question with a local router, a fresh on-disk cache and a counting web path."""
+    generated = []
+
+    def answer_with_web_search(query, mode, search_response=None):
+        generated.append(query)
+        return f"web answer to {query}"
+
+    async def aanswer_with_web_search(query, mode, search_response=None):
+        return answer_with_web_search(query, mode)
+
+    cache = AnswerCache(path=str(tmp_path / "answers.json"), semantic=False)
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", False)
+    monkeypatch.setattr(orchestrator, "get_intent_router", Router)
+    monkeypatch.setattr(orchestrator, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(orchestrator, "get_single_flight", lambda: None)
+    monkeypatch.setattr(orchestrator, "answer_with_web_search", answer_with_web_search)
+    monkeypatch.setattr(orchestrator, "aanswer_with_web_search", aanswer_with_web_search)
+    return generated
+
+
+@pytest.fixture
+def search_down(monkeypatch):
+    monkeypatch.setattr(orchestrator, "SINGLE_PASS_RAG", True)
+    monkeypatch.setattr(orchestrator, "get_relevant_chunks", fail_retrieval)
+    monkeypatch.setattr(orchestrator, "aget_relevant_chunks", afail_retrieval)
+    monkeypatch.setattr(orchestrator, "start_speculative_web_search", lambda query: None)
+    monkeypatch.setattr(orchestrator, "astart_speculative_web_search", lambda query: None)
+
+
+def test_retrieval_failure_falls_back_to_web_for_insurance_questions(search_down, monkeypatch):
+    async def aweb(query, mode, search_response=None):
+        return "web answer"
+
+    monkeypatch.setattr(orchestrator, "answer_with_web_search", lambda query, mode, search_response=None: "web answer")
+    monkeypatch.setattr(orchestrator, "aanswer_with_web_search", aweb)
+    monkeypatch.setattr(orchestrator, "stream_answer_with_web_search",
+                        lambda query, mode, search_response=None: iter(["web ", "answer"]))
+    question = "What is the entry age for the health insurance policy?"
+
+    assert orchestrator.answer_insurance_query(question, "concise") == ("web answer", "Web Search")
+    assert asyncio.run(orchestrator.aanswer_insurance_query(question, "concise")) == ("web answer", "Web Search")
+    assert list(orchestrator.stream_insurance_answer(question, "concise")) == ["Web Search", "web ", "answer"]
+
+
+def test_retrieval_failure_returns_error_reply_for_unrelated_questions(search_down):
+    question = "Tell me a joke about penguins"
+
+    reply, source = orchestrator.answer_insurance_query(question, "concise")
+    assert reply.startswith("Error during RAG answering") and source == "Knowledge Base"
+    stream = list(orchestrator.stream_insurance_answer(question, "concise"))
+    assert stream[0] == "Knowledge Base" and stream[1].startswith("Error during RAG answering")
+
+
+def test_quota_errors_become_a_busy_reply_that_is_never_cached(monkeypatch):
+    monkeypatch.setattr(rag_tool, "chat_completion", quota_exhausted)
+    monkeypatch.setattr(web_search_tool, "chat_completion", quota_exhausted)
+    question = "Tell me a joke about penguins"
+
+    result = rag_tool.answer_with_knowledge_base(question, chunks=CHUNKS, with_classification=True)
+    assert result["answer"] == "The assistant is busy right now. Please try again in 13 seconds."
+    assert result["response_class"] == "negative"
+    search_response = {"results": [{"title": "Penguins", "url": "https://example.com", "content": "Penguin jokes."}]}
+    web = web_search_tool.answer_with_web_search(question, "detailed", search_response=search_response)
+    assert web == result["answer"]
+
+    class Cache:
+        puts = []
+
+        def put(self, *args):
+            self.puts.append(args)
+
+    monkeypatch.setattr(orchestrator, "get_answer_cache", Cache)
+    resolved = {"query": question, "generated": True}
+    orchestrator.record_answer(question, resolved, "insurance", "concise", web, "Web Search")
+    assert Cache.puts == []
+    orchestrator.record_answer(question, resolved, "insurance", "concise", "A real answer.", "Web Search")
+    assert len(Cache.puts) == 1
+
+
+def test_busy_knowledge_base_falls_back_to_the_web_for_insurance_questions(monkeypatch):
+    monkeypatch.setattr(orchestrator, "SINGLE_PASS_RAG", True)
+    monkeypatch.setattr(orchestrator, "get_relevant_chunks", lambda query, k=5: CHUNKS)
+    monkeypatch.setattr(orchestrator, "start_speculative_web_search", lambda query: None)
+    monkeypatch.setattr(rag_tool, "chat_completion", quota_exhausted)
+    monkeypatch.setattr(orchestrator, "answer_with_web_search", lambda query, mode, search_response=None: "web answer")
+
+    reply = orchestrator.answer_insurance_query("What is the entry age for MediShield Health Protect?", "concise")
+    assert reply == ("web answer", "Web Search")
+
+
+def test_generated_answers_are_cached_under_the_standalone_query(answer_flow):
+    conversation = Conversation()
+    first = orchestrator.answer_question("and for children?", "general", conversation=conversation)
+    assert first["query"] == "What is the entry age for children?" and first["ok"]
+    assert first["answer"] == "web answer to What is the entry age for children?"
+
+    again = orchestrator.answer_question("What is the entry age for children", "general")
+    assert (again["answer"], again["source"]) == (first["answer"], "Web Search")
+    assert answer_flow == ["What is the entry age for children?"]  # the second answer came from the cache
+    assert conversation.turns == [("and for children?", first["answer"])]
+
+
+def test_routed_replies_skip_generation_the_cache_and_the_conversation(answer_flow):
+    conversation = Conversation()
+    resolved = orchestrator.resolve_answer("hello", "general", "concise", conversation)
+    assert resolved == {"answer": "Welcome!", "source": "System", "query": "hello", "generated": False}
+
+    result = asyncio.run(orchestrator.aanswer_question("hello", "general", conversation=conversation))
+    assert (result["answer"], result["source"]) == ("Welcome!", "System")
+    assert answer_flow == [] and conversation.turns == []
+    assert orchestrator.resolve_answer("hello there", "general", "concise")["answer"] is None
+
+
+def test_async_answers_share_the_cache_with_sync_ones(answer_flow):
+    result = asyncio.run(orchestrator.aanswer_question("Is travel cover worth it?", "general", mode="detailed"))
+    assert result["answer"] == "web answer to Is travel cover worth it?"
+    assert orchestrator.answer_question("is travel cover worth it", "general", mode="detailed")["answer"] == \
+        result["answer"]
+    assert answer_flow == ["Is travel cover worth it?"]
+    orchestrator.answer_question("is travel cover worth it", "general", mode="concise")
+    assert len(answer_flow) == 2  # each response mode has its own entry
+
+
+def test_unknown_modes_are_rejected_before_any_work(answer_flow):
+    with pytest.raises(ValueError, match="chat_mode"):
+        orchestrator.answer_question("What is covered?", "travel")
+    with pytest.raises(ValueError, match="mode"):
+        asyncio.run(orchestrator.aanswer_question("What is covered?", "general", mode="verbose"))
+    assert answer_flow == []
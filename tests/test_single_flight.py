@@ -0,0 +1,56 @@
+# test_single_flight.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.single_flight import SingleFlight
+
+
+def slow_answer(calls):
+    def answer():
+        calls.append("do")
+        time.sleep(0.2)
+        return "answer", "Knowledge Base"
+    return answer
+
+
+def slow_stream(calls):
+    def stream():
+        calls.append("stream")
+        yield "Knowledge Base"
+        time.sleep(0.2)
+        yield "answer"
+    return stream
+
+
+def test_concurrent_callers_share_one_computation():
+    flights, calls = SingleFlight(timeout=5), []
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(lambda _: flights.do("key", slow_answer(calls)), range(10)))
+    assert calls == ["do"]
+    assert results == [("answer", "Knowledge Base")] * 10
+
+
+def test_returning_and_streaming_callers_do_not_join_each_other():
+    flights, calls = SingleFlight(timeout=5), []
+    started = threading.Event()
+
+    def stream_leader():
+        stream = flights.stream("key", slow_stream(calls))
+        first = next(stream)
+        started.set()
+        return [first, *stream]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        streamed = pool.submit(stream_leader)
+        started.wait(2)
+        returned = pool.submit(flights.do, "key", slow_answer(calls))
+        assert returned.result() == ("answer", "Knowledge Base")
+        assert streamed.result() == ["Knowledge Base", "answer"]
+
+    started.clear()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        returned = pool.submit(flights.do, "key", slow_answer(calls))
+        time.sleep(0.05)
+        assert list(flights.stream("key", slow_stream(calls))) == ["Knowledge Base", "answer"]
+        assert returned.result() == ("answer", "Knowledge Base")
@@ -0,0 +1,54 @@
+# test_speculative.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import utils.speculative as speculative
+
+
+def test_async_speculative_search_updates_shared_stats(monkeypatch):
+    async def asearch_web(query):
+        await asyncio.sleep(0.01)
+        return {"results": [query]}
+
+    monkeypatch.setattr(speculative, "SPECULATIVE_WEB_SEARCH", True)
+    monkeypatch.setattr(speculative, "asearch_web", asearch_web)
+    before = speculative.get_speculation_stats()
+
+    async def scenario():
+        used = speculative.astart_speculative_web_search("entry age")
+        assert await used.result() == {"results": ["entry age"]}
+        used.discard()  # settled: no double counting
+
+        cancelled = speculative.astart_speculative_web_search("never sent")
+        cancelled.discard()  # before the task's first step
+
+        wasted = speculative.astart_speculative_web_search("sent then dropped")
+        await asyncio.sleep(0)
+        wasted.discard()
+
+    asyncio.run(scenario())
+    after = speculative.get_speculation_stats()
+    assert {name: after[name] - before[name] for name in after} == \
+        {"started": 3, "used": 1, "cancelled": 1, "wasted": 1}
+
+
+def test_concurrent_prefetches_of_the_same_query_start_one_retrieval(monkeypatch):
+    calls, gate = [], threading.Event()
+
+    def get_relevant_chunks(query, k=5):
+        calls.append(query)
+        gate.wait(1)
+        return [{"id": "c1"}]
+
+    monkeypatch.setattr(speculative, "get_relevant_chunks", get_relevant_chunks)
+    before = speculative.get_prefetch_stats()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        entries = list(pool.map(speculative.prefetch_chunks, ["Entry age?", "entry age"] * 8))
+    gate.set()
+
+    assert len({id(entry) for entry in entries}) == 1
+    assert speculative.claim_prefetch("entry age").result() == [{"id": "c1"}]
+    after = speculative.get_prefetch_stats()
+    assert calls == ["Entry age?"]
+    assert after["started"] - before["started"] == 1 and after["pending"] == 0
@@ -0,0 +1,73 @@
+# test_speech.py
+# Voice input through the file-based LocalTranscriber; retrieval is faked, no network.
+import pytest
+
+import utils.orchestrator as orchestrator
+import utils.speculative as speculative
+from utils.conversation import ConversationState
+from utils.speech import LocalTranscriber, Transcriber, Transcription, transcribe_voice_query
+
+QUESTION = "What is the entry age for MediShield Health Protect?"
+
+
+@pytest.fixture
+def retrievals(monkeypatch):
+    calls = []
+
+    def get_relevant_chunks(query, k=5):
+        calls.append(query)
+        return [{"id": "c1", "content": "Adults aged 18 to 65.", "policy": "Health Protect"}]
+
+    monkeypatch.setattr(speculative, "get_relevant_chunks", get_relevant_chunks)
+    monkeypatch.setattr(orchestrator, "get_relevant_chunks", get_relevant_chunks)
+    return calls
+
+
+def test_backends_must_implement_the_interface():
+    class Incomplete(Transcription):
+        def write(self, data):
+            pass
+
+    with pytest.raises(TypeError):
+        Transcriber()
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_local_transcriber_streams_partials_over_a_push_stream():
+    partials = []
+    transcription = LocalTranscriber().start(on_partial=partials.append)
+    data = QUESTION.encode("utf-8")
+    for offset in range(0, len(data), 5):  # chunks split words
+        transcription.write(data[offset:offset + 5])
+    assert transcription.close() == QUESTION
+    assert partials[0] == "What" and partials[-1] == QUESTION
+    assert len(partials) == len(QUESTION.split())
+
+
+def test_transcribe_file_reads_the_sibling_transcript(tmp_path):
+    (tmp_path / "question.wav").write_bytes(b"RIFF....")
+    (tmp_path / "question.txt").write_text(QUESTION, encoding="utf-8")
+    assert LocalTranscriber().transcribe_file(tmp_path / "question.wav") == QUESTION
+
+
+def test_stable_partial_prefetch_is_claimed_by_the_answer_path(retrievals):
+    before = speculative.get_prefetch_stats()
+    # The trailing silence outlasts SPEECH_STABLE_SECONDS, like a recognizer waiting for end of speech
+    transcriber = LocalTranscriber(word_seconds=0.01, end_silence_seconds=0.5)
+    text = transcribe_voice_query(QUESTION.encode("utf-8"), transcriber=transcriber, prefetch=True)
+
+    assert orchestrator.retrieve_chunks(text)[0]["id"] == "c1"
+    after = speculative.get_prefetch_stats()
+    assert retrievals == [QUESTION]  # retrieved once, during the silence
+    assert after["used"] - before["used"] == 1 and after["pending"] == 0
+
+
+def test_follow_ups_the_conversation_rewrites_are_not_prefetched(retrievals):
+    conversation = ConversationState()
+    conversation.add_turn(QUESTION, "Adults aged 18 to 65.")
+    transcriber = LocalTranscriber(word_seconds=0.01, end_silence_seconds=0.5)
+    text = transcribe_voice_query(b"and what about for children?", transcriber=transcriber,
+                                  prefetch=True, conversation=conversation)
+    assert conversation.will_rewrite(text)
+    assert retrievals == [] and speculative.get_prefetch_stats()["pending"] == 0
@@ -0,0 +1,14 @@
+# test_tracing.py
+import os
+
+from utils.tracing import Trace, write_trace, TRACE_LOG_BACKUPS
+
+
+def test_trace_log_rotates_at_max_size_and_keeps_bounded_backups(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    for _ in range(200):
+        write_trace(Trace("chat_message", chat_mode="insurance"), path=path, max_bytes=2000)
+
+    files = sorted(name for name in os.listdir(tmp_path))
+    assert files == ["traces.jsonl"] + [f"traces.jsonl.{i}" for i in range(1, TRACE_LOG_BACKUPS + 1)]
+    assert all(os.path.getsize(tmp_path / name) <= 2000 for name in files)
@@ -0,0 +1,233 @@
+# answer_cache.py
+
+import os
+import json
+import time
+import base64
+import atexit
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(".cache", "answer_cache.json"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.93"))
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_SAVE_INTERVAL = float(os.getenv("ANSWER_CACHE_SAVE_INTERVAL", "5"))
+
+# Chat modes whose answers depend on the ingested documents
+CORPUS_CHAT_MODES = ("insurance",)
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.strip().lower().rstrip("?!.").split())
+
+
+def _encode_vector(vector):
+    import numpy as np
+
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data):
+    import numpy as np
+
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+class AnswerCache:
+    """
+    Process-wide answer cache keyed on (normalized query, response mode, chat mode).
+
+    Lookups try an exact match first, then (optionally) the most similar cached query
+    embedding above a threshold. Entries are evicted LRU-first and after a TTL, answers
+    built from the documents are dropped when the corpus version changes, and the cache
+    is persisted to disk so a restart does not begin cold.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS, similarity=ANSWER_CACHE_SIMILARITY,
+                 semantic=ANSWER_CACHE_SEMANTIC, embed_fn=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.semantic = semantic
+        self.embed_fn = embed_fn
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.corpus_version = None
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._last_save = 0.0
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def make_key(query, mode, chat_mode):
+        return f"{chat_mode}|{mode}|{normalize_query(query)}"
+
+    def _embed(self, query):
+        import numpy as np
+
+        if self.embed_fn is None:
+            from config.config import get_embeddings_vector
+            self.embed_fn = get_embeddings_vector
+        # Same text hybrid retrieval embeds, so a miss reuses this vector from the embedding memo
+        return np.asarray(self.embed_fn(query), dtype=np.float32)
+
+    def _expired(self, entry, now):
+        if now - entry["created"] > self.ttl_seconds:
+            return True
+        return entry["chat_mode"] in CORPUS_CHAT_MODES and entry.get("corpus_version") != self.corpus_version
+
+    def get(self, query, mode, chat_mode):
+        """Returns the cached entry dict ({"answer", "source", ...}) or None."""
+        key = self.make_key(query, mode, chat_mode)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._expired(entry, now):
+                    del self.entries[key]
+                    self._dirty = True
+                else:
+                    self.entries.move_to_end(key)
+                    self.stats["exact_hits"] += 1
+                    return entry
+            if not self.semantic:
+                self.stats["misses"] += 1
+                return None
+            candidates = [(k, e) for k, e in self.entries.items()
+                          if e["mode"] == mode and e["chat_mode"] == chat_mode
+                          and e.get("vector") is not None and not self._expired(e, now)]
+        if not candidates:
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+
+        try:
+            query_vector = self._embed(query)
+        except Exception as e:
+            print(f"Answer cache embedding failed: {e}")
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        import numpy as np
+
+        matrix = np.vstack([entry["vector"] for _, entry in candidates])
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        norms[norms == 0] = 1.0
+        scores = (matrix @ query_vector) / norms
+        best = int(np.argmax(scores))
+        with self.lock:
+            if scores[best] >= self.similarity and candidates[best][0] in self.entries:
+                self.entries.move_to_end(candidates[best][0])
+                self.stats["semantic_hits"] += 1
+                return candidates[best][1]
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, query, mode, chat_mode, answer, source):
+        vector = None
+        if self.semantic:
+            try:
+                vector = self._embed(query)
+            except Exception as e:
+                print(f"Answer cache embedding failed: {e}")
+        entry = {
+            "query": normalize_query(query),
+            "mode": mode,
+            "chat_mode": chat_mode,
+            "answer": answer,
+            "source": source,
+            "created": time.time(),
+            "corpus_version": self.corpus_version,
+            "vector": vector,
+        }
+        with self.lock:
+            key = self.make_key(query, mode, chat_mode)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._dirty = True
+        self.save(force=False)
+
+    def set_corpus_version(self, version):
+        """Called by ingestion; drops document-based answers built from an older corpus."""
+        with self.lock:
+            if version == self.corpus_version:
+                return
+            self.corpus_version = version
+            stale = [k for k, e in self.entries.items()
+                     if e["chat_mode"] in CORPUS_CHAT_MODES and e.get("corpus_version") != version]
+            for key in stale:
+                del self.entries[key]
+            if stale:
+                print(f"Answer cache: invalidated {len(stale)} entries after corpus change")
+            self._dirty = True
+        self.save(force=True)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self._dirty = True
+        self.save(force=True)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self.lock:
+            self.corpus_version = data.get("corpus_version")
+            for key, entry in data.get("entries", []):
+                if entry.get("vector") is not None:
+                    entry["vector"] = _decode_vector(entry["vector"])
+                if not self._expired(entry, now):
+                    self.entries[key] = entry
+
+    def save(self, force=True):
+        """Persist to disk; unforced saves are throttled to ANSWER_CACHE_SAVE_INTERVAL."""
+        with self.lock:
+            if not self._dirty or (not force and time.time() - self._last_save < ANSWER_CACHE_SAVE_INTERVAL):
+                return
+            entries = []
+            for key, entry in self.entries.items():
+                serialized = dict(entry)
+                if serialized.get("vector") is not None:
+                    serialized["vector"] = _encode_vector(serialized["vector"])
+                entries.append([key, serialized])
+            data = {"corpus_version": self.corpus_version, "entries": entries}
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Answer cache could not be saved: {e}")
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    """Process-wide cache, shared by every Streamlit session."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+            atexit.register(_answer_cache.save)
+            from utils.tracing import register_collector
+
+            register_collector(lambda: {f"chatbot_answer_cache_{name}": value
+                                        for name, value in {**_answer_cache.stats,
+                                                            "entries": len(_answer_cache.entries)}.items()})
+        return _answer_cache
@@ -1,11 +1,10 @@
-import azure.cognitiveservices.speech as speechsdk
-
 def transcribe_speech_from_mic(subscription_key: str, region: str) -> str:
-    # Set up the speech configuration
-    speech_config = speechsdk.SpeechConfig(subscription=subscription_key, region=region)
+    # The Speech SDK is heavy; only load it when speech is actually used
+    import azure.cognitiveservices.speech as speechsdk
+    from utils.speech import get_speech_config
 
-    # Set the language, optional
-    speech_config.speech_recognition_language = "en-US"
+    # Shared speech configuration (built once per key/region; see utils/speech.py for streaming input)
+    speech_config = get_speech_config(subscription_key, region)
 
     # Create a recognizer with the default microphone
     speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config)
@@ -0,0 +1,125 @@
+# chat_history.py
+# Bounded per-session chat history: recent turns stay in memory, older ones are spilled to a
+# compact JSON-lines file and read back only when the user pages to them.
+
+import os
+import json
+import time
+import uuid
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+CHAT_HISTORY_DIR = os.getenv("CHAT_HISTORY_DIR", os.path.join(".cache", "chat_history"))
+CHAT_HISTORY_MAX_IN_MEMORY = int(os.getenv("CHAT_HISTORY_MAX_IN_MEMORY", "200"))  # messages
+CHAT_HISTORY_SPILL_TTL_SECONDS = float(os.getenv("CHAT_HISTORY_SPILL_TTL_SECONDS", str(7 * 24 * 3600)))
+
+_prune_lock = threading.Lock()
+_pruned = False
+
+
+def prune_spill_files(directory=CHAT_HISTORY_DIR, ttl_seconds=CHAT_HISTORY_SPILL_TTL_SECONDS):
+    """Delete spill files of sessions idle for longer than the TTL (sessions have no end hook)."""
+    cutoff = time.time() - ttl_seconds
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ChatHistory:
+    """
+    Append-only message list for one chat session. Every message gets a stable "id".
+
+    Only the newest `max_in_memory` messages are kept in memory; older ones are written to
+    `<directory>/<session_id>.jsonl` and located by byte offset, so paging back reads just
+    the lines it needs.
+    """
+
+    def __init__(self, session_id=None, directory=CHAT_HISTORY_DIR, max_in_memory=CHAT_HISTORY_MAX_IN_MEMORY):
+        global _pruned
+        self.session_id = session_id or uuid.uuid4().hex
+        self.directory = directory
+        self.max_in_memory = max(1, max_in_memory)
+        self.recent = []        # newest messages, oldest first
+        self.offsets = []       # byte offset of every spilled message, oldest first
+        self.next_id = 0
+        self.lock = threading.Lock()
+        with _prune_lock:
+            if not _pruned:
+                _pruned = True
+                prune_spill_files(directory)
+
+    @property
+    def spill_path(self):
+        return os.path.join(self.directory, f"{self.session_id}.jsonl")
+
+    def __len__(self):
+        return len(self.offsets) + len(self.recent)
+
+    def append(self, message):
+        """Add a message (dict) and return it with its id set."""
+        with self.lock:
+            message = {**message, "id": self.next_id}
+            self.next_id += 1
+            self.recent.append(message)
+            if len(self.recent) > self.max_in_memory and self._spill(self.recent[:-self.max_in_memory]):
+                self.recent = self.recent[-self.max_in_memory:]
+            return message
+
+    def _spill(self, messages):
+        offsets = []
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.spill_path, "ab") as f:
+                for message in messages:
+                    offsets.append(f.tell())
+                    f.write(json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n")
+        except OSError as e:
+            # Keep the messages in memory rather than lose them
+            print(f"Chat history could not be spilled to disk: {e}")
+            return False
+        self.offsets.extend(offsets)
+        return True
+
+    def _read_spilled(self, start, stop):
+        if start >= stop:
+            return []
+        try:
+            with open(self.spill_path, "rb") as f:
+                f.seek(self.offsets[start])
+                return [json.loads(f.readline()) for _ in range(stop - start)]
+        except (OSError, ValueError) as e:
+            print(f"Chat history could not be read back: {e}")
+            return []
+
+    def window(self, count):
+        """The newest `count` messages (oldest first), reading spilled ones from disk if needed."""
+        with self.lock:
+            total = len(self)
+            start = max(0, total - count)
+            spilled = len(self.offsets)
+            older = self._read_spilled(start, spilled) if start < spilled else []
+            return older + self.recent[max(0, start - spilled):]
+
+    def last(self, role=None):
+        with self.lock:
+            for message in reversed(self.recent):
+                if role is None or message["role"] == role:
+                    return message
+        return None
+
+    def clear(self):
+        with self.lock:
+            self.recent, self.offsets = [], []
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
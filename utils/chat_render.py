@@ -0,0 +1,26 @@
+# chat_render.py
+# Chat bubble HTML. Lives outside app.py because Streamlit re-executes the main script in a
+# fresh namespace on every rerun, which would throw away a memo defined there.
+
+from functools import lru_cache
+import markdown
+
+
+def chat_bubble_html(msg):
+    role_class = 'user' if msg["role"] == "user" else 'bot'
+    icon = "🧑‍💻" if msg["role"] == "user" else "🤖"
+    rendered_text = markdown.markdown(msg["text"]) if msg["role"] == "bot" else msg["text"]
+    return f"""
+        <div class="chat-bubble {role_class}">
+            <b>{icon} {msg["role"].capitalize()} <span style="color:#1cb3e0;font-weight:500;">({msg['source']})</span></b><br>
+            <div>{rendered_text}</div>
+        </div>
+    """
+
+@lru_cache(maxsize=4096)
+def _cached_bubble_html(msg_id, role, text, source):
+    return chat_bubble_html({"role": role, "text": text, "source": source})
+
+def cached_bubble_html(msg):
+    """Rendered bubble HTML, computed once per message id and content (shared across reruns and sessions)."""
+    return _cached_bubble_html(msg.get("id"), msg["role"], msg["text"], msg["source"])
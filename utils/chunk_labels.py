@@ -0,0 +1,62 @@
+# chunk_labels.py
+# Chunk metadata computed once at ingestion (chunk type, policy name, page) and the
+# query-intent check that turns into a retrieval filter on those fields.
+
+import os
+import re
+
+# Whole words only: "age" must not match "coverage", "percentage" or "manage".
+# Behavior change from the original trigger list: "policy" is no longer a term. Nearly every
+# question names a policy, so it sent premium, claim and exclusion questions to eligibility
+# chunks only. ELIGIBILITY_QUERY_EXTRA_TERMS="policy" restores the old behavior.
+ELIGIBILITY_QUERY_TERMS = frozenset((
+    "age", "ages", "aged", "eligible", "eligibility", "avail", "available", "availability",
+    "child", "children", "adult", "adults", "senior", "seniors",
+)) | frozenset(os.getenv("ELIGIBILITY_QUERY_EXTRA_TERMS", "").lower().split())
+
+
+def label_chunk_type(text: str) -> str:
+    """Label the chunk based on its likely content."""
+    text = text.lower()
+    if "who can avail" in text or "eligibility" in text or "available for" in text or "age between" in text or "coverage" in text:
+        return "eligibility"
+    elif "premium" in text or "monthly premium" in text:
+        return "premium"
+    return "general"
+
+
+def policy_name_from_filename(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def chunk_metadata(filename: str, text: str, page=None) -> dict:
+    """Filterable / facetable index fields for one chunk (page is 1-based, 0 when unknown)."""
+    return {
+        "chunk_type": label_chunk_type(text),
+        "policy_name": policy_name_from_filename(filename),
+        "page": page + 1 if isinstance(page, int) else 0,
+    }
+
+
+def query_chunk_filter(query: str):
+    """Retrieval filter implied by the query's intent, e.g. {"chunk_type": "eligibility"}, or None."""
+    if ELIGIBILITY_QUERY_TERMS.intersection(re.findall(r"[a-z]+", query.lower())):
+        return {"chunk_type": "eligibility"}
+    return None
+
+
+def to_odata_filter(filters):
+    """{"field": "value", ...} -> "field eq 'value' and ..." for Azure Search (None when empty)."""
+    if not filters:
+        return None
+    clauses = []
+    for field, value in filters.items():
+        if isinstance(value, str):
+            clauses.append(f"{field} eq '{value.replace(chr(39), chr(39) * 2)}'")
+        else:
+            clauses.append(f"{field} eq {value}")
+    return " and ".join(clauses)
+
+
+def matches_filter(doc: dict, filters) -> bool:
+    return not filters or all(doc.get(field) == value for field, value in filters.items())
@@ -0,0 +1,163 @@
+# context_packer.py
+# Packs retrieved chunks into the RAG context under a token budget: overlapping neighbours
+# from the same policy are merged, near-duplicates dropped and each policy gets one header.
+
+import os
+import re
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.85"))
+CONTEXT_MIN_OVERLAP_CHARS = 20
+CONTEXT_MAX_OVERLAP_CHARS = 200  # the splitter overlaps chunks by 50 chars; leave headroom
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o
+
+# Chunk ids are "<file>_<position>_<content hash>" (see models.embeddings.make_chunk_id)
+CHUNK_POSITION_PATTERN = re.compile(r"_(\d+)_[0-9a-f]{16}$")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        # tiktoken missing or its encoding file could not be fetched: estimate instead
+        print(f"Tokenizer unavailable ({e}); estimating tokens as chars / 4")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def chunk_position(chunk: dict):
+    match = CHUNK_POSITION_PATTERN.search(chunk.get("id") or "")
+    return int(match.group(1)) if match else None
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _similarity(a: set, b: set) -> float:
+    """Overlap coefficient, so a passage contained in a longer one counts as a duplicate."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right` (0 if too short to trust)."""
+    longest = min(len(left), len(right), CONTEXT_MAX_OVERLAP_CHARS)
+    for size in range(longest, CONTEXT_MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_policy_chunks(chunks: list) -> list:
+    """Merge chunks of one policy that are adjacent in the document and share their overlap."""
+    positioned = sorted((c for c in chunks if c["position"] is not None), key=lambda c: c["position"])
+    merged = [c for c in chunks if c["position"] is None]
+    for chunk in positioned:
+        previous = merged[-1] if merged and merged[-1]["position"] is not None else None
+        if previous is not None and chunk["position"] - previous["last_position"] == 1:
+            overlap = overlap_length(previous["content"], chunk["content"])
+            if overlap:
+                previous["content"] += chunk["content"][overlap:]
+            else:
+                previous["content"] += " " + chunk["content"]
+            previous["last_position"] = chunk["position"]
+            previous["score"] = max(previous["score"], chunk["score"])
+            previous["merged"] += 1
+            continue
+        merged.append(chunk)
+    return merged
+
+
+def naive_context(chunks: list) -> str:
+    """The unpacked format: every chunk verbatim with its own header."""
+    return "".join(f"Policy: {c['policy']}\nContent: {c['content']}\n\n" for c in chunks)
+
+
+def _render(passages: list) -> str:
+    """One block per policy, policies in the order of their first passage."""
+    groups = {}
+    for passage in passages:
+        groups.setdefault(passage["policy"], []).append(passage["content"])
+    return "".join(f"Policy: {policy}\nContent:\n" + "\n\n".join(contents) + "\n\n"
+                   for policy, contents in groups.items())
+
+
+def pack_context(chunks: list, budget: int = CONTEXT_TOKEN_BUDGET) -> tuple:
+    """
+    Returns (context, stats). Chunks are taken by relevance until `budget` tokens are used.
+    stats keeps the two reductions apart: prompt_tokens_saved is what merging, de-duplication
+    and shared headers removed (same chunks, fewer tokens); prompt_tokens_truncated is what
+    the budget cut (content the model never sees).
+    """
+    passages = []
+    for rank, chunk in enumerate(chunks):
+        content = " ".join(chunk["content"].split())
+        if content:
+            passages.append({"policy": chunk["policy"], "content": content, "score": chunk.get("score") or 0.0,
+                             "rank": rank, "position": chunk_position(chunk), "merged": 1})
+    for passage in passages:
+        passage["last_position"] = passage["position"]
+    # Baseline for the savings: the naive format of the same whitespace-collapsed chunks
+    naive_tokens = count_tokens(naive_context(passages))
+
+    # Adjacent chunks of the same policy become one passage
+    by_policy = {}
+    for passage in passages:
+        by_policy.setdefault(passage["policy"], []).append(passage)
+    passages = [merged for group in by_policy.values() for merged in _merge_policy_chunks(group)]
+
+    # Most relevant first; near-duplicates are only dropped within a policy, so a clause
+    # shared by two policies is still attributed to both
+    passages.sort(key=lambda p: (-p["score"], p["rank"]))
+    kept, kept_shingles, duplicates = [], [], 0
+    for passage in passages:
+        shingles = _shingles(passage["content"])
+        if any(policy == passage["policy"] and _similarity(shingles, other) >= CONTEXT_DEDUP_SIMILARITY
+               for policy, other in kept_shingles):
+            duplicates += 1
+            continue
+        kept.append(passage)
+        kept_shingles.append((passage["policy"], shingles))
+
+    # Fill the budget greedily; a policy header is paid for once, by its first passage
+    used_tokens, selected, headed = 0, [], set()
+    for passage in kept:
+        cost = count_tokens(passage["content"]) + 2
+        if passage["policy"] not in headed:
+            cost += count_tokens(f"Policy: {passage['policy']}\nContent:\n")
+        if used_tokens + cost > budget:
+            continue
+        used_tokens += cost
+        selected.append(passage)
+        headed.add(passage["policy"])
+
+    # One block per policy, policies ordered by their best passage
+    context = _render(selected)
+
+    packed_tokens = count_tokens(context)
+    unbudgeted_tokens = packed_tokens if len(selected) == len(kept) else count_tokens(_render(kept))
+    stats = {
+        "chunks_in": len(chunks),
+        "chunks_used": sum(p["merged"] for p in selected),
+        "duplicates_dropped": duplicates,
+        "chunks_truncated": sum(p["merged"] for p in kept) - sum(p["merged"] for p in selected),
+        "context_tokens": packed_tokens,
+        "prompt_tokens_saved": max(0, naive_tokens - unbudgeted_tokens),
+        "prompt_tokens_truncated": max(0, unbudgeted_tokens - packed_tokens),
+    }
+    return context, stats
@@ -0,0 +1,161 @@
+# conversation.py
+# Per-session conversation state with a constant-size context: a rolling summary of older
+# turns plus the last few turns, used to rewrite follow-up questions into standalone queries.
+
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from config.clients import get_openai_client
+from utils.context_packer import count_tokens
+from utils.tracing import span, record_usage, traced
+from utils.model_tiers import select_model
+from utils.llm_scheduler import get_llm_scheduler, estimate_tokens, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+load_dotenv()
+CONVERSATION_RECENT_TURNS = int(os.getenv("CONVERSATION_RECENT_TURNS", "3"))
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "400"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "150"))
+CONVERSATION_TURN_TOKENS = int(os.getenv("CONVERSATION_TURN_TOKENS", "80"))  # per message in the recent window
+CONVERSATION_REWRITE = os.getenv("CONVERSATION_REWRITE", "true").lower() in ("1", "true", "yes")
+
+FOLLOW_UP_STARTS = ("what about", "how about", "and ", "also", "but ", "what if", "for ", "same ", "then ")
+FOLLOW_UP_WORDS = {"it", "its", "it's", "that", "this", "these", "those", "they", "them", "their", "there",
+                   "same", "above", "previous", "one", "ones", "former", "latter"}
+# Short messages made only of these words have no subject of their own ("why?", "tell me more")
+ELLIPSIS_WORDS = {"why", "how", "what", "which", "when", "where", "who", "much", "many", "more", "else", "again",
+                  "details", "detail", "explain", "elaborate", "example", "examples", "really", "so", "tell", "me",
+                  "please", "go", "on", "ok", "okay", "is", "are", "the", "a", "an"}
+
+# Summaries are folded off the request path
+_summary_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="conversation-summary")
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    text = " ".join(text.split())
+    if count_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rsplit(" ", 1)[0] + " …"
+
+
+def _chat(messages, max_tokens, task, priority=PRIORITY_INTERACTIVE):
+    deployment = select_model("conversation")["deployment"]
+    with span("llm_completion", task=task, model=deployment) as record:
+        completion = get_llm_scheduler().call(deployment, lambda: get_openai_client().chat.completions.create(
+            model=deployment,
+            messages=messages,
+            temperature=0,
+            max_tokens=max_tokens,
+        ), tokens=estimate_tokens(messages, max_tokens=max_tokens), priority=priority)
+        record_usage(record, completion)
+    return completion.choices[0].message.content.strip()
+
+
+class ConversationState:
+    """
+    Rolling context for one chat session. Turns beyond the last CONVERSATION_RECENT_TURNS are
+    folded into a short summary in the background, so context_text() stays within
+    CONVERSATION_TOKEN_BUDGET however long the chat runs.
+    """
+
+    def __init__(self, recent_turns=CONVERSATION_RECENT_TURNS, token_budget=CONVERSATION_TOKEN_BUDGET):
+        self.recent = deque()  # (user, bot) turns, oldest first
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary = ""
+        self.pending = []      # evicted turns not folded into the summary yet
+        self.turns = 0
+        self.rewrites = {}     # (turn count, query) -> standalone query
+        self.lock = threading.Lock()
+        self._folding = None
+
+    # --- state updates ---
+    def add_turn(self, user_text: str, bot_text: str):
+        with self.lock:
+            self.recent.append((user_text, bot_text))
+            self.turns += 1
+            self.rewrites.clear()
+            while len(self.recent) > self.recent_turns:
+                self.pending.append(self.recent.popleft())
+            if self.pending and (self._folding is None or self._folding.done()):
+                self._folding = _summary_pool.submit(traced(self._fold_pending))
+
+    def _fold_pending(self):
+        """Fold evicted turns into the summary (one small LLM call; extractive on failure)."""
+        with self.lock:
+            turns, summary = list(self.pending), self.summary
+        if not turns:
+            return
+        transcript = "\n".join(f"User: {truncate_tokens(u, 60)}\nAssistant: {truncate_tokens(b, 120)}" for u, b in turns)
+        try:
+            new_summary = _chat([
+                {"role": "system", "content": "You maintain a running summary of an insurance chat. "
+                                              "Keep the user's situation, the policies discussed and key facts."},
+                {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{transcript}\n\n"
+                                            f"Write the updated summary in at most {CONVERSATION_SUMMARY_TOKENS} "
+                                            f"tokens."},
+            ], CONVERSATION_SUMMARY_TOKENS, "conversation_summary", PRIORITY_BACKGROUND)
+        except Exception as e:
+            print(f"Conversation summary failed, keeping user questions only: {e}")
+            new_summary = " ".join(filter(None, [summary] + [f"User asked: {truncate_tokens(u, 30)}" for u, _ in turns]))
+        with self.lock:
+            self.summary = truncate_tokens(new_summary, CONVERSATION_SUMMARY_TOKENS)
+            del self.pending[:len(turns)]
+            if self.pending:
+                self._folding = _summary_pool.submit(traced(self._fold_pending))
+
+    # --- context ---
+    def context_text(self) -> str:
+        """Summary + recent turns, trimmed (oldest recent turns first) to the token budget."""
+        with self.lock:
+            summary = self.summary
+            turns = list(self.pending) + list(self.recent)  # unfolded turns stay visible until summarized
+        lines = [f"User: {truncate_tokens(u, CONVERSATION_TURN_TOKENS)}\nAssistant: {truncate_tokens(b, CONVERSATION_TURN_TOKENS)}"
+                 for u, b in turns]
+        header = f"Summary of earlier conversation: {summary}\n" if summary else ""
+        while lines and count_tokens(header + "\n".join(lines)) > self.token_budget:
+            lines.pop(0)
+        return header + "\n".join(lines)
+
+    # --- follow-up rewriting ---
+    def is_follow_up(self, query: str) -> bool:
+        if not self.turns:
+            return False
+        text = query.strip().lower()
+        words = set(re.findall(r"[a-z']+", text))
+        # Short standalone questions ("maternity cover?") are not rewritten: only a pronoun, an
+        # elliptical opener or a message with no subject of its own marks a follow-up
+        elliptical = len(words) <= 3 and words <= ELLIPSIS_WORDS
+        return text.startswith(FOLLOW_UP_STARTS) or bool(words & FOLLOW_UP_WORDS) or elliptical
+
+    def will_rewrite(self, query: str) -> bool:
+        """Whether standalone_query would rewrite this query (i.e. retrieval uses a different text)."""
+        return CONVERSATION_REWRITE and self.is_follow_up(query)
+
+    def standalone_query(self, query: str) -> str:
+        """The query rewritten to stand on its own (unchanged when it is not a follow-up)."""
+        if not self.will_rewrite(query):
+            return query
+        key = (self.turns, query.strip().lower())
+        with self.lock:
+            if key in self.rewrites:
+                return self.rewrites[key]
+        with span("query_rewrite") as record:
+            try:
+                rewritten = _chat([
+                    {"role": "system", "content": "Rewrite the user's latest message as a standalone question that "
+                                                  "can be understood without the conversation. Keep policy names. "
+                                                  "Reply with the question only."},
+                    {"role": "user", "content": f"Conversation:\n{self.context_text()}\n\nLatest message: {query}"},
+                ], 60, "query_rewrite").strip().strip('"')
+            except Exception as e:
+                print(f"Query rewrite failed: {e}")
+                rewritten = ""
+            if not rewritten:
+                rewritten = query
+            record["rewritten"] = rewritten != query
+        with self.lock:
+            self.rewrites[key] = rewritten
+        return rewritten
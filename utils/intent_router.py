@@ -0,0 +1,251 @@
+# intent_router.py
+# Local intent router: small talk and a configurable FAQ set are matched against a precompiled
+# phrase table (rapidfuzz) and answered instantly; everything else takes the normal path.
+#
+#   python -m utils.intent_router --precompute     # (re)build FAQ answers from the ingested documents
+
+import os
+import json
+import threading
+from dotenv import load_dotenv
+from rapidfuzz import process, fuzz
+from utils.tracing import span, register_collector
+
+load_dotenv()
+FAQ_PATH = os.getenv("FAQ_PATH", os.path.join("config", "faq.json"))
+FAQ_ANSWERS_PATH = os.getenv("FAQ_ANSWERS_PATH", os.path.join(".cache", "faq_answers.json"))
+ROUTER_ACK_CUTOFF = float(os.getenv("ROUTER_ACK_CUTOFF", "85"))
+ROUTER_FAQ_CUTOFF = float(os.getenv("ROUTER_FAQ_CUTOFF", "90"))
+# Optional nearest-neighbour tier over FAQ question embeddings (reuses the query embedding memo)
+ROUTER_EMBEDDING_TIER = os.getenv("ROUTER_EMBEDDING_TIER", "false").lower() in ("1", "true", "yes")
+ROUTER_EMBEDDING_THRESHOLD = float(os.getenv("ROUTER_EMBEDDING_THRESHOLD", "0.9"))
+FAQ_RESPONSE_MODES = ("concise", "detailed")
+
+ACKNOWLEDGMENTS = [
+    "thank you", "thanks", "got it", "ok", "okay", "sure", "noted", "understood",
+    "cool", "great", "awesome", "hi", "hello", "hey", "hi there", "hello there",
+    "hi!", "hello!", "hey!", "hi there!", "hello there!"
+]
+ACKNOWLEDGMENT_REPLY = "Welcome! 😊 I'm your assistant. Feel free to ask your question."
+
+
+def preprocess(text):
+    return " ".join(text.strip().lower().split())
+
+
+class IntentRouter:
+    """
+    Two phrase tables, each compiled once: acknowledgments (fuzz.ratio, like the old
+    per-phrase loop) and FAQ questions (fuzz.token_sort_ratio). FAQ answers are either
+    built from the manifest ("source": "policy_list") or precomputed once per corpus
+    version with the knowledge-base pipeline; an FAQ without a ready answer never matches.
+    """
+
+    def __init__(self, faq_path=FAQ_PATH, answers_path=FAQ_ANSWERS_PATH, embedding_tier=ROUTER_EMBEDDING_TIER):
+        self.faq_path = faq_path
+        self.answers_path = answers_path
+        self.embedding_tier = embedding_tier
+        self.lock = threading.Lock()
+        self.ack_phrases = [preprocess(phrase) for phrase in ACKNOWLEDGMENTS]
+        self.faqs = self._load_faqs()
+        self.faq_phrases, self.faq_phrase_ids = [], []
+        for faq in self.faqs.values():
+            for question in faq["questions"]:
+                self.faq_phrases.append(preprocess(question))
+                self.faq_phrase_ids.append(faq["id"])
+        self.faq_chat_modes = {chat_mode for faq in self.faqs.values() for chat_mode in faq["chat_modes"]}
+        self.answers = {}  # faq id -> {response mode: answer}
+        self.corpus_version = None
+        self._faq_vectors = None
+        self._precompute_thread = None
+        self.stats = {"routed": 0, "acknowledgment_hits": 0, "faq_hits": 0, "embedding_hits": 0,
+                      "misses": 0, "llm_calls_avoided": 0}
+        self._load_answers()
+
+    # --- configuration and precomputed answers ---
+    def _load_faqs(self):
+        try:
+            with open(self.faq_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"FAQ set not loaded from {self.faq_path}: {e}")
+            return {}
+        return {entry["id"]: {"chat_modes": ["insurance"], **entry} for entry in entries}
+
+    def _load_answers(self):
+        try:
+            with open(self.answers_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.corpus_version = data.get("corpus_version")
+        self.answers = data.get("answers", {})
+
+    def _save_answers(self):
+        try:
+            os.makedirs(os.path.dirname(self.answers_path) or ".", exist_ok=True)
+            tmp_path = self.answers_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"corpus_version": self.corpus_version, "answers": self.answers}, f, indent=2)
+            os.replace(tmp_path, self.answers_path)
+        except OSError as e:
+            print(f"FAQ answers could not be saved: {e}")
+
+    @staticmethod
+    def _policy_list_answer(manifest):
+        from utils.chunk_labels import policy_name_from_filename
+
+        names = sorted(policy_name_from_filename(filename) for filename in manifest["files"])
+        if not names:
+            return None
+        return "These are the policies I can help you with:\n\n" + "\n".join(f"- {name}" for name in names)
+
+    def precompute_answers(self):
+        """Build every FAQ answer for the current corpus (one KB answer per FAQ and response mode)."""
+        from models.embeddings import load_manifest, corpus_version
+        from utils.rag_tool import answer_with_knowledge_base
+        from models.llm import is_failed_reply
+        from utils.llm_scheduler import llm_priority, PRIORITY_BACKGROUND
+
+        manifest = load_manifest()
+        version = corpus_version(manifest)
+        answers = {}
+        for faq in self.faqs.values():
+            if faq.get("answer"):
+                answers[faq["id"]] = {mode: faq["answer"] for mode in FAQ_RESPONSE_MODES}
+            elif faq.get("source") == "policy_list":
+                answer = self._policy_list_answer(manifest)
+                if answer:
+                    answers[faq["id"]] = {mode: answer for mode in FAQ_RESPONSE_MODES}
+            else:
+                question = faq.get("canonical") or faq["questions"][0]
+                for mode in FAQ_RESPONSE_MODES:
+                    with llm_priority(PRIORITY_BACKGROUND):  # never competes with live chat for quota
+                        answer = answer_with_knowledge_base(question, mode=mode)
+                    if answer and not is_failed_reply(answer) and "I don't know" not in answer:
+                        answers.setdefault(faq["id"], {})[mode] = answer
+        with self.lock:
+            self.answers, self.corpus_version = answers, version
+        self._save_answers()
+        print(f"FAQ answers ready for {len(answers)}/{len(self.faqs)} entries")
+        return answers
+
+    def ensure_answers(self, background=True):
+        """Precompute FAQ answers if they are missing or were built from an older corpus."""
+        from models.embeddings import load_manifest, corpus_version
+
+        if not self.faqs or self.corpus_version == corpus_version(load_manifest()):
+            return
+        if not background:
+            self.precompute_answers()
+            return
+        with self.lock:
+            if self._precompute_thread is not None and self._precompute_thread.is_alive():
+                return
+            # Stale answers are not served while new ones are built
+            self.answers = {}
+            self._precompute_thread = threading.Thread(target=self.precompute_answers, name="faq-precompute",
+                                                       daemon=True)
+            self._precompute_thread.start()
+
+    # --- routing ---
+    def _faq_embedding_match(self, query):
+        import numpy as np
+        from config.config import get_embeddings_vector
+
+        if self._faq_vectors is None:
+            self._faq_vectors = np.asarray([get_embeddings_vector(p) for p in self.faq_phrases], dtype=np.float32)
+            self._faq_vectors /= np.linalg.norm(self._faq_vectors, axis=1, keepdims=True) + 1e-12
+        vector = np.asarray(get_embeddings_vector(query), dtype=np.float32)
+        scores = self._faq_vectors @ (vector / (np.linalg.norm(vector) + 1e-12))
+        best = int(np.argmax(scores))
+        if scores[best] >= ROUTER_EMBEDDING_THRESHOLD:
+            return self.faq_phrase_ids[best], float(scores[best])
+        return None
+
+    def route(self, query, chat_mode, mode="concise", llm_calls_saved=1):
+        """
+        Returns {"intent", "reply", "source", "score", "tier"} for an instant answer, or None.
+        `llm_calls_saved` is what the normal path would have spent, for the avoided-calls metric.
+        """
+        clean = preprocess(query)
+        with span("intent_router") as record:
+            route = None
+            match = process.extractOne(clean, self.ack_phrases, scorer=fuzz.ratio, score_cutoff=ROUTER_ACK_CUTOFF)
+            if match and match[1] > ROUTER_ACK_CUTOFF:
+                route = {"intent": "acknowledgment", "reply": ACKNOWLEDGMENT_REPLY, "source": "System",
+                         "score": match[1], "tier": "acknowledgment"}
+            elif self.faq_phrases and chat_mode in self.faq_chat_modes:
+                match = process.extractOne(clean, self.faq_phrases, scorer=fuzz.token_sort_ratio,
+                                           score_cutoff=ROUTER_FAQ_CUTOFF)
+                faq_match = (self.faq_phrase_ids[match[2]], match[1], "faq") if match else None
+                if faq_match is None and self.embedding_tier:
+                    try:
+                        embedded = self._faq_embedding_match(clean)
+                        faq_match = (*embedded, "embedding") if embedded else None
+                    except Exception as e:
+                        print(f"Intent router embedding tier failed: {e}")
+                if faq_match:
+                    faq_id, score, tier = faq_match
+                    answer = self.answers.get(faq_id, {}).get(mode)
+                    if answer and chat_mode in self.faqs[faq_id]["chat_modes"]:
+                        route = {"intent": f"faq:{faq_id}", "reply": answer, "source": "FAQ",
+                                 "score": score, "tier": tier}
+            record["intent"] = route["intent"] if route else None
+        with self.lock:
+            self.stats["routed"] += 1
+            if route is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats[f"{route['tier']}_hits"] += 1
+                self.stats["llm_calls_avoided"] += llm_calls_saved
+        return route
+
+    def classify_many(self, queries):
+        """Batch scoring for evaluation: [(intent or None, score)] using one cdist per phrase table."""
+        import numpy as np
+
+        cleaned = [preprocess(q) for q in queries]
+        ack_best = process.cdist(cleaned, self.ack_phrases, scorer=fuzz.ratio).max(axis=1)
+        if self.faq_phrases:
+            faq_scores = process.cdist(cleaned, self.faq_phrases, scorer=fuzz.token_sort_ratio)
+            faq_index, faq_best = faq_scores.argmax(axis=1), faq_scores.max(axis=1)
+        else:
+            faq_index = faq_best = np.zeros(len(cleaned))
+        routes = []
+        for i in range(len(cleaned)):
+            if ack_best[i] > ROUTER_ACK_CUTOFF:
+                routes.append(("acknowledgment", float(ack_best[i])))
+            elif self.faq_phrases and faq_best[i] >= ROUTER_FAQ_CUTOFF:
+                routes.append((f"faq:{self.faq_phrase_ids[int(faq_index[i])]}", float(faq_best[i])))
+            else:
+                routes.append((None, float(max(ack_best[i], faq_best[i]))))
+        return routes
+
+    def hit_rate(self):
+        with self.lock:
+            return (self.stats["routed"] - self.stats["misses"]) / self.stats["routed"] if self.stats["routed"] else 0.0
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_intent_router() -> IntentRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = IntentRouter()
+            register_collector(lambda: {**{f"chatbot_router_{name}": value for name, value in _router.stats.items()},
+                                        "chatbot_router_hit_rate": round(_router.hit_rate(), 4)})
+        return _router
+
+
+if __name__ == "__main__":
+    import sys
+
+    router = get_intent_router()
+    if "--precompute" in sys.argv:
+        router.precompute_answers()
+    for query in sys.argv[1:]:
+        if not query.startswith("--"):
+            print(query, "->", router.classify_many([query])[0])
@@ -0,0 +1,401 @@
+# llm_scheduler.py
+# Central admission control for Azure OpenAI calls (chat, classification, embeddings): per-deployment
+# tokens-per-minute / requests-per-minute budgets, priorities, per-request deadlines and
+# Retry-After-aware retries, so bursts queue briefly instead of turning into 429 errors.
+#
+#   LLM_QUOTAS='{"gpt-4o": {"tpm": 30000, "rpm": 180}, "text-embedding-3-large": {"tpm": 350000}}'
+#
+# Deployments without a configured quota are only tracked; a 429 still pauses them for its Retry-After.
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from utils.tracing import observe, inc_counter, register_collector
+
+load_dotenv()
+LLM_QUOTAS = json.loads(os.getenv("LLM_QUOTAS") or "{}")
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "0"))  # 0 = not enforced
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "400"))
+WINDOW_SECONDS = 60.0
+LATENCY_WINDOW_SECONDS = float(os.getenv("LLM_LATENCY_WINDOW_SECONDS", "120"))  # horizon for observed p95
+
+PRIORITY_INTERACTIVE = 0     # answers a user is waiting for
+PRIORITY_CLASSIFICATION = 1  # second-pass answer classification
+PRIORITY_BACKGROUND = 2      # conversation summaries, FAQ precompute
+PRIORITY_INGESTION = 3       # document embeddings
+PRIORITY_NAMES = {0: "interactive", 1: "classification", 2: "background", 3: "ingestion"}
+# Share of each budget a priority may fill, so lower priorities leave headroom for chat answers
+PRIORITY_SHARES = {0: 1.0, 1: 0.9, 2: 0.75, 3: 0.6}
+# Seconds a request may spend queued and retrying before it is rejected
+PRIORITY_DEADLINES = {
+    0: float(os.getenv("LLM_INTERACTIVE_DEADLINE", "30")),
+    1: float(os.getenv("LLM_CLASSIFICATION_DEADLINE", "15")),
+    2: float(os.getenv("LLM_BACKGROUND_DEADLINE", "120")),
+    3: float(os.getenv("LLM_INGESTION_DEADLINE", "600")),
+}
+
+_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+class LLMBusyError(RuntimeError):
+    """The call could not be admitted (or retried) before its deadline."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def llm_priority(level):
+    """Default priority for LLM calls made in this context (threads need utils.tracing.traced)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# --- Retry helpers ---
+def retry_after_seconds(exc):
+    """Read Retry-After / retry-after-ms from a rate-limit response, if there is one."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def status_code(exc):
+    return getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+
+def is_retryable(exc):
+    status = status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError")
+
+def backoff_delay(exc, attempt, base_delay=1.0, max_delay=30.0):
+    delay = retry_after_seconds(exc)
+    if delay is None:
+        delay = min(max_delay, base_delay * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+    return delay
+
+
+# --- Token accounting ---
+def estimate_tokens(messages=None, texts=None, max_tokens=None):
+    """Prompt tokens plus the expected completion, for reserving budget before the call."""
+    from utils.context_packer import count_tokens
+
+    if texts is not None:
+        return sum(count_tokens(text) for text in texts)
+    prompt = sum(count_tokens(str(message.get("content", ""))) + 4 for message in messages or [])
+    return prompt + (max_tokens or LLM_COMPLETION_TOKENS_ESTIMATE)
+
+def usage_tokens(result):
+    """Total tokens reported by an OpenAI completion / embedding or a LangChain message, else None."""
+    usage = getattr(result, "usage", None)
+    if usage is not None:
+        return getattr(usage, "total_tokens", None)
+    metadata = getattr(result, "usage_metadata", None)
+    if metadata:
+        return metadata.get("total_tokens")
+    return None
+
+
+class DeploymentBudget:
+    """Sliding one-minute window of admitted requests and their tokens for one deployment."""
+
+    def __init__(self, name, tpm=0, rpm=0):
+        self.name = name
+        self.tpm = tpm
+        self.rpm = rpm
+        self.events = deque()  # [admitted_at, tokens], oldest first
+        self.window_tokens = 0
+        self.cooldown_until = 0.0
+        self.waiters = []      # (priority, seq) of queued requests
+        self.latencies = deque()  # (finished_at, seconds) of successful calls
+
+    def _expire(self, now):
+        while self.events and self.events[0][0] + WINDOW_SECONDS <= now:
+            self.window_tokens -= self.events.popleft()[1]
+
+    def wait_time(self, tokens, priority, now):
+        """Seconds until a request of `tokens` at `priority` fits the budget (0 = now)."""
+        self._expire(now)
+        wait = max(0.0, self.cooldown_until - now)
+        share = PRIORITY_SHARES.get(priority, 1.0)
+        if self.rpm:
+            allowed = max(1, int(self.rpm * share))
+            excess = len(self.events) + 1 - allowed
+            if excess > 0:
+                wait = max(wait, self.events[excess - 1][0] + WINDOW_SECONDS - now)
+        if self.tpm:
+            # A request bigger than the share is admitted once the window has room for it alone
+            allowed = max(self.tpm * share, min(tokens, self.tpm))
+            over, released = self.window_tokens + tokens - allowed, 0
+            for admitted_at, event_tokens in self.events:
+                if released >= over:
+                    break
+                released += event_tokens
+                wait = max(wait, admitted_at + WINDOW_SECONDS - now)
+        return wait
+
+    def record_latency(self, seconds, now):
+        self.latencies.append((now, seconds))
+        while self.latencies and self.latencies[0][0] + LATENCY_WINDOW_SECONDS <= now:
+            self.latencies.popleft()
+
+    def p95_latency(self, now, min_samples=5):
+        """p95 of recent successful call durations, or None with too few samples."""
+        samples = sorted(seconds for finished_at, seconds in self.latencies
+                         if finished_at + LATENCY_WINDOW_SECONDS > now)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+
+    def utilization(self, now):
+        """Share of the TPM/RPM budget used in the current window (1.0 while a 429 cooldown lasts)."""
+        self._expire(now)
+        if self.cooldown_until > now:
+            return 1.0
+        usage = 0.0
+        if self.tpm:
+            usage = max(usage, self.window_tokens / self.tpm)
+        if self.rpm:
+            usage = max(usage, len(self.events) / self.rpm)
+        return usage
+
+    def admit(self, tokens, now):
+        entry = [now, tokens]
+        self.events.append(entry)
+        self.window_tokens += tokens
+        return entry
+
+    def settle(self, entry, tokens, now):
+        """Replace a reservation's estimate with the tokens actually used."""
+        self._expire(now)
+        if tokens is not None and entry[0] + WINDOW_SECONDS > now:
+            self.window_tokens += tokens - entry[1]
+            entry[1] = tokens
+
+
+class LLMScheduler:
+    """
+    Every Azure OpenAI call goes through call() / acall(). A request waits until its
+    deployment's budget has room and no higher-priority request is queued ahead of it; if that
+    cannot happen before its deadline it is rejected at once with LLMBusyError. 429s pause the
+    whole deployment for their Retry-After, and retries are jittered and deadline-bounded.
+    """
+
+    def __init__(self, quotas=None):
+        self.quotas = LLM_QUOTAS if quotas is None else quotas
+        self.condition = threading.Condition()
+        self.budgets = {}
+        self.seq = 0
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "rejected": 0}
+
+    def budget(self, deployment):
+        budget = self.budgets.get(deployment)
+        if budget is None:
+            quota = self.quotas.get(deployment, {})
+            budget = self.budgets[deployment] = DeploymentBudget(
+                deployment, int(quota.get("tpm", LLM_DEFAULT_TPM)), int(quota.get("rpm", LLM_DEFAULT_RPM)))
+        return budget
+
+    def _count(self, stat, deployment):
+        with self.condition:
+            self.stats[stat] += 1
+        inc_counter(f"chatbot_llm_{stat}_total", deployment)
+
+    # --- admission ---
+    def _poll(self, budget, waiter, tokens, deadline_at):
+        """Under self.condition: an admitted entry, or the seconds to wait before polling again."""
+        now = time.monotonic()
+        wait = budget.wait_time(tokens, waiter[0], now)
+        if wait == 0 and min(budget.waiters) == waiter:
+            return budget.admit(tokens, now), 0
+        if now + wait > deadline_at:
+            self._count("rejected", budget.name)
+            raise LLMBusyError(f"Azure OpenAI quota for {budget.name} is exhausted; "
+                               f"retry in {max(wait, 1):.0f}s", retry_after=wait)
+        return None, min(wait or 0.05, deadline_at - now)
+
+    def _enqueue(self, budget, priority):
+        self.seq += 1
+        waiter = (priority, self.seq)
+        budget.waiters.append(waiter)
+        return waiter
+
+    def _dequeue(self, budget, waiter):
+        budget.waiters.remove(waiter)
+        self.condition.notify_all()
+
+    def acquire(self, deployment, tokens, priority, deadline_at):
+        started = time.monotonic()
+        with self.condition:
+            budget = self.budget(deployment)
+            waiter = self._enqueue(budget, priority)
+            try:
+                while True:
+                    entry, wait = self._poll(budget, waiter, tokens, deadline_at)
+                    if entry is not None:
+                        break
+                    self.condition.wait(wait)
+            finally:
+                self._dequeue(budget, waiter)
+        observe("chatbot_llm_queue_seconds", PRIORITY_NAMES.get(priority, priority), time.monotonic() - started)
+        return entry
+
+    async def aacquire(self, deployment, tokens, priority, deadline_at):
+        started = time.monotonic()
+        with self.condition:
+            budget = self.budget(deployment)
+            waiter = self._enqueue(budget, priority)
+        try:
+            while True:
+                with self.condition:
+                    entry, wait = self._poll(budget, waiter, tokens, deadline_at)
+                if entry is not None:
+                    break
+                await asyncio.sleep(min(wait, 0.05))  # sync waiters are notified; async ones poll
+        finally:
+            with self.condition:
+                self._dequeue(budget, waiter)
+        observe("chatbot_llm_queue_seconds", PRIORITY_NAMES.get(priority, priority), time.monotonic() - started)
+        return entry
+
+    def release(self, deployment, entry, result=None, failed=False, seconds=None):
+        with self.condition:
+            budget = self.budget(deployment)
+            if seconds is not None and not failed:
+                budget.record_latency(seconds, time.monotonic())
+            # Failed requests give their tokens back; the request itself still counts towards RPM
+            budget.settle(entry, 0 if failed else usage_tokens(result), time.monotonic())
+            self.stats["requests"] += 1
+            self.condition.notify_all()
+
+    # --- retries ---
+    def _after_failure(self, deployment, exc, attempt, max_retries, deadline_at):
+        """Seconds to sleep before retrying (0 after a 429: admission waits out the cooldown)."""
+        if attempt == max_retries or not is_retryable(exc):
+            if status_code(exc) == 429:
+                # Still throttled after every retry: callers get the same busy error as a rejection
+                self._count("rejected", deployment)
+                raise LLMBusyError(f"Azure OpenAI {deployment} is rate limited", retry_after=retry_after_seconds(exc)) from exc
+            raise exc
+        delay = backoff_delay(exc, attempt)
+        if time.monotonic() + delay > deadline_at:
+            self._count("rejected", deployment)
+            raise LLMBusyError(f"Azure OpenAI {deployment} is rate limited; retry in {max(delay, 1):.0f}s",
+                               retry_after=delay) from exc
+        self._count("retries", deployment)
+        print(f"LLM call to {deployment} failed ({exc.__class__.__name__}), retrying in {delay:.1f}s")
+        if status_code(exc) == 429:
+            self._count("throttled", deployment)
+            with self.condition:
+                budget = self.budget(deployment)
+                budget.cooldown_until = max(budget.cooldown_until, time.monotonic() + delay)
+            return 0
+        return delay
+
+    def _deadline(self, priority, deadline):
+        return time.monotonic() + (deadline if deadline is not None else PRIORITY_DEADLINES.get(priority, 30.0))
+
+    def call(self, deployment, fn, tokens=0, priority=None, deadline=None, max_retries=LLM_MAX_RETRIES, stream=False):
+        """
+        Run fn() (one API request) under the deployment's budget; returns its result. With
+        stream=True fn() only opens the stream: its latency is left to record_latency().
+        """
+        priority = _priority.get() if priority is None else priority
+        deadline_at = self._deadline(priority, deadline)
+        for attempt in range(max_retries + 1):
+            entry = self.acquire(deployment, tokens, priority, deadline_at)
+            started, failed, result = time.monotonic(), True, None
+            try:
+                result = fn()
+                failed = False
+            except Exception as e:
+                error = e
+            finally:
+                # Also on cancellation / KeyboardInterrupt, so the reservation never outlives the call
+                self.release(deployment, entry, result, failed, self._latency(started, failed, stream))
+            if not failed:
+                return result
+            delay = self._after_failure(deployment, error, attempt, max_retries, deadline_at)
+            if delay:
+                time.sleep(delay)
+
+    async def acall(self, deployment, fn, tokens=0, priority=None, deadline=None, max_retries=LLM_MAX_RETRIES,
+                    stream=False):
+        """Coroutine version of call(); fn returns an awaitable."""
+        priority = _priority.get() if priority is None else priority
+        deadline_at = self._deadline(priority, deadline)
+        for attempt in range(max_retries + 1):
+            entry = await self.aacquire(deployment, tokens, priority, deadline_at)
+            started, failed, result = time.monotonic(), True, None
+            try:
+                result = await fn()
+                failed = False
+            except Exception as e:
+                error = e
+            finally:
+                self.release(deployment, entry, result, failed, self._latency(started, failed, stream))
+            if not failed:
+                return result
+            delay = self._after_failure(deployment, error, attempt, max_retries, deadline_at)
+            if delay:
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _latency(started, failed, stream):
+        return None if failed or stream else time.monotonic() - started
+
+    def record_latency(self, deployment, seconds):
+        """Latency measured by the caller, e.g. a streamed completion read to its last token."""
+        with self.condition:
+            self.budget(deployment).record_latency(seconds, time.monotonic())
+
+    def health(self, deployment):
+        """(p95 latency in seconds or None, budget utilization) for a deployment."""
+        with self.condition:
+            budget = self.budget(deployment)
+            now = time.monotonic()
+            return budget.p95_latency(now), budget.utilization(now)
+
+    def snapshot(self):
+        with self.condition:
+            now = time.monotonic()
+            for budget in self.budgets.values():
+                budget._expire(now)
+            return {
+                **self.stats,
+                "queued": sum(len(budget.waiters) for budget in self.budgets.values()),
+                "window_tokens": sum(budget.window_tokens for budget in self.budgets.values()),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+            register_collector(lambda: {f"chatbot_llm_scheduler_{name}": value
+                                        for name, value in _scheduler.snapshot().items()})
+        return _scheduler
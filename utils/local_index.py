@@ -0,0 +1,200 @@
+# local_index.py
+
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+import numpy as np
+from dotenv import load_dotenv
+from utils.chunk_labels import matches_filter
+
+load_dotenv()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(".cache", "local_index"))
+LOCAL_INDEX_MMAP = os.getenv("LOCAL_INDEX_MMAP", "false").lower() in ("1", "true", "yes")
+
+
+def tokenize(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class BM25Index:
+    """Small in-memory Okapi BM25 index over a list of texts."""
+
+    def __init__(self, texts: list, k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.postings = {}
+        self.doc_lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((position, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def search(self, query: str, k: int, allowed: set = None) -> list:
+        """Returns [(position, score)] best-first, restricted to `allowed` positions if given."""
+        total = len(self.doc_lengths)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, tf in postings:
+                if allowed is not None and position not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / (self.avg_length or 1.0))
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class LocalRetriever:
+    """
+    In-process retriever: chunk embeddings live in one contiguous float32 matrix
+    (optionally memory-mapped from disk) and top-k is a single matrix-vector product.
+    Keyword search uses an in-memory BM25 index.
+    """
+
+    name = "local"
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR, mmap: bool = LOCAL_INDEX_MMAP):
+        self.index_dir = index_dir
+        self.mmap = mmap
+        self.lock = threading.RLock()
+        self.docs = []  # chunk fields without the vector, row-aligned with self.vectors
+        # Rows [0, size) of a buffer with spare capacity, so appends are amortized O(rows added)
+        self._buffer = np.zeros((0, 0), dtype=np.float32)
+        self._size = 0
+        self.positions = {}
+        self._bm25 = None
+        self.load()
+
+    @property
+    def vectors(self):
+        return self._buffer[:self._size]
+
+    @vectors.setter
+    def vectors(self, matrix):
+        self._buffer, self._size = matrix, matrix.shape[0]
+
+    def _reserve(self, rows, dimensions):
+        """Make room for `rows` more vectors, growing geometrically (and leaving any read-only mmap)."""
+        needed = self._size + rows
+        if self._buffer.flags.writeable and self._buffer.shape[0] >= needed and self._buffer.shape[1] == dimensions:
+            return
+        capacity = max(needed, 2 * self._buffer.shape[0], 64)
+        buffer = np.empty((capacity, dimensions), dtype=np.float32)
+        if self._size:
+            buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = buffer
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.index_dir, "vectors.npy")
+
+    @property
+    def docs_path(self):
+        return os.path.join(self.index_dir, "chunks.json")
+
+    def load(self):
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.docs_path)):
+            return
+        with open(self.docs_path, "r", encoding="utf-8") as f:
+            self.docs = json.load(f)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r" if self.mmap else None)
+        self.positions = {doc["id"]: i for i, doc in enumerate(self.docs)}
+        self._bm25 = None
+
+    def flush(self):
+        """Persist the index so later processes can load (or memory-map) it."""
+        with self.lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            np.save(self.vectors_path + ".tmp.npy", np.ascontiguousarray(self.vectors, dtype=np.float32))
+            os.replace(self.vectors_path + ".tmp.npy", self.vectors_path)
+            with open(self.docs_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.docs, f)
+            os.replace(self.docs_path + ".tmp", self.docs_path)
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def upsert(self, docs: list) -> int:
+        with self.lock:
+            vectors = np.asarray([doc["content_vector"] for doc in docs], dtype=np.float32)
+            vectors = self._normalize(vectors)
+            self._reserve(len(docs), vectors.shape[1])
+            for doc, vector in zip(docs, vectors):
+                fields = {key: value for key, value in doc.items() if key != "content_vector"}
+                position = self.positions.get(doc["id"])
+                if position is None:
+                    position = self.positions[doc["id"]] = len(self.docs)
+                    self.docs.append(fields)
+                    self._size += 1
+                else:
+                    self.docs[position] = fields
+                self._buffer[position] = vector
+            self._bm25 = None
+            return len(docs)
+
+    def delete(self, ids: list):
+        with self.lock:
+            drop = {self.positions[doc_id] for doc_id in ids if doc_id in self.positions}
+            if not drop:
+                return
+            keep = [i for i in range(len(self.docs)) if i not in drop]
+            self.docs = [self.docs[i] for i in keep]
+            self.vectors = np.ascontiguousarray(np.asarray(self.vectors)[keep], dtype=np.float32)
+            self.positions = {doc["id"]: i for i, doc in enumerate(self.docs)}
+            self._bm25 = None
+
+    def ids(self) -> list:
+        with self.lock:
+            return [doc["id"] for doc in self.docs]
+
+    def _result(self, position, score):
+        return {**self.docs[position], "@search.score": float(score)}
+
+    def _allowed_positions(self, filters):
+        """Positions matching an equality filter (applied before top-k), or None for no filter."""
+        if not filters:
+            return None
+        return {i for i, doc in enumerate(self.docs) if matches_filter(doc, filters)}
+
+    def keyword_search(self, query: str, k: int, filters: dict = None) -> list:
+        with self.lock:
+            if self._bm25 is None:
+                self._bm25 = BM25Index([doc["content"] for doc in self.docs])
+            allowed = self._allowed_positions(filters)
+            return [self._result(position, score) for position, score in self._bm25.search(query, k, allowed)]
+
+    def vector_search(self, vector: list, k: int, filters: dict = None) -> list:
+        with self.lock:
+            if not self.docs:
+                return []
+            query = self._normalize(np.asarray(vector, dtype=np.float32))
+            scores = self.vectors @ query
+            allowed = self._allowed_positions(filters)
+            if allowed is not None:
+                if not allowed:
+                    return []
+                positions = np.fromiter(allowed, dtype=np.int64)
+                masked = np.full(scores.shape, -np.inf, dtype=np.float32)
+                masked[positions] = scores[positions]
+                scores = masked
+                k = min(k, len(positions))
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [self._result(position, scores[position]) for position in top]
+
+    # In-process searches are CPU-bound and sub-millisecond; the async API just delegates
+    async def akeyword_search(self, query: str, k: int, filters: dict = None) -> list:
+        return self.keyword_search(query, k, filters)
+
+    async def avector_search(self, vector: list, k: int, filters: dict = None) -> list:
+        return self.vector_search(vector, k, filters)
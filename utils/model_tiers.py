@@ -0,0 +1,105 @@
+# model_tiers.py
+# Which deployment answers what: a (task, response mode) -> tier policy with per-mode max-token
+# caps, and an automatic downgrade from the quality tier to the fast one while the quality
+# deployment is slow (observed p95) or close to its quota.
+#
+# The split is opt-in: both tiers use AZURE_OPENAI_DEPLOYMENT_NAME (default gpt-4o) until a
+# cheaper deployment exists and is named in MODEL_FAST_DEPLOYMENT, e.g. MODEL_FAST_DEPLOYMENT=gpt-35-turbo.
+# MODEL_QUALITY_DEPLOYMENT overrides the quality tier.
+#
+#   MODEL_POLICY='{"kb_answer": {"detailed": "quality"}, "classification": {"*": "quality"}}'
+
+import os
+import json
+import threading
+from dotenv import load_dotenv
+from utils.tracing import register_collector
+
+load_dotenv()
+_QUALITY_DEPLOYMENT = os.getenv("MODEL_QUALITY_DEPLOYMENT") or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME") or "gpt-4o"
+MODEL_TIERS = {
+    "fast": os.getenv("MODEL_FAST_DEPLOYMENT") or _QUALITY_DEPLOYMENT,
+    "quality": _QUALITY_DEPLOYMENT,
+}
+DEFAULT_POLICY = {
+    "kb_answer": {"concise": "fast", "detailed": "quality"},
+    "web_answer": {"concise": "fast", "detailed": "quality"},
+    "classification": {"*": "fast"},
+    "conversation": {"*": "fast"},
+}
+MAX_TOKENS = {
+    "concise": int(os.getenv("MAX_TOKENS_CONCISE", "350")),
+    "detailed": int(os.getenv("MAX_TOKENS_DETAILED", "1200")),
+    "classification": int(os.getenv("MAX_TOKENS_CLASSIFICATION", "60")),
+}
+# Downgrade quality -> fast while the quality deployment's p95 or budget use is above these
+MODEL_DOWNGRADE_P95_SECONDS = float(os.getenv("MODEL_DOWNGRADE_P95_SECONDS", "8"))
+MODEL_DOWNGRADE_UTILIZATION = float(os.getenv("MODEL_DOWNGRADE_UTILIZATION", "0.85"))
+
+
+def load_policy():
+    policy = {task: dict(modes) for task, modes in DEFAULT_POLICY.items()}
+    try:
+        overrides = json.loads(os.getenv("MODEL_POLICY") or "{}")
+    except ValueError as e:
+        print(f"MODEL_POLICY ignored: {e}")
+        overrides = {}
+    for task, modes in overrides.items():
+        policy.setdefault(task, {}).update(modes)
+    return policy
+
+
+class ModelRouter:
+    """
+    select(task, mode) returns {"deployment", "tier", "max_tokens", "downgraded"}. A downgrade
+    lasts only while the condition holds: latency samples age out of the scheduler's window,
+    so the quality tier is tried again once it has been quiet.
+    """
+
+    def __init__(self, policy=None, tiers=None):
+        self.policy = policy or load_policy()
+        self.tiers = tiers or MODEL_TIERS
+        self.lock = threading.Lock()
+        self.stats = {"fast": 0, "quality": 0, "downgrades": 0}
+
+    def tier_for(self, task, mode):
+        modes = self.policy.get(task, {})
+        return modes.get(mode) or modes.get("*") or "quality"
+
+    def should_downgrade(self, deployment):
+        from utils.llm_scheduler import get_llm_scheduler
+
+        p95, utilization = get_llm_scheduler().health(deployment)
+        return (p95 is not None and p95 > MODEL_DOWNGRADE_P95_SECONDS) or utilization > MODEL_DOWNGRADE_UTILIZATION
+
+    def select(self, task, mode="concise"):
+        tier = self.tier_for(task, mode)
+        downgraded = False
+        if tier != "fast" and self.tiers.get("fast") != self.tiers.get(tier) and self.should_downgrade(self.tiers[tier]):
+            tier, downgraded = "fast", True
+        with self.lock:
+            self.stats[tier] = self.stats.get(tier, 0) + 1
+            self.stats["downgrades"] += downgraded
+        return {
+            "deployment": self.tiers[tier],
+            "tier": tier,
+            "max_tokens": MAX_TOKENS.get(task, MAX_TOKENS.get(mode)),
+            "downgraded": downgraded,
+        }
+
+
+_model_router = None
+_model_router_lock = threading.Lock()
+
+def get_model_router() -> ModelRouter:
+    global _model_router
+    with _model_router_lock:
+        if _model_router is None:
+            _model_router = ModelRouter()
+            register_collector(lambda: {f"chatbot_model_tier_{name}": value
+                                        for name, value in _model_router.stats.items()})
+        return _model_router
+
+
+def select_model(task, mode="concise"):
+    return get_model_router().select(task, mode)
@@ -0,0 +1,279 @@
+# orchestrator.py
+# The question-answering flow shared by the Streamlit app, the HTTP API (api.py) and the batch
+# CLI (batch.py): local intent routing, follow-up rewriting, the answer cache, single-flight
+# coalescing, and the insurance (knowledge base with web fallback) and general (web) paths.
+
+import os
+import asyncio
+from dotenv import load_dotenv
+from utils.rag_tool import (answer_with_knowledge_base, aanswer_with_knowledge_base, stream_answer_with_knowledge_base,
+                            get_relevant_chunks, aget_relevant_chunks, kb_failed)
+from utils.web_search_tool import answer_with_web_search, aanswer_with_web_search, stream_answer_with_web_search
+from models.llm import classify_response_and_relevance, aclassify_response_and_relevance, precheck_route, is_failed_reply
+from utils.answer_cache import get_answer_cache
+from utils.speculative import start_speculative_web_search, astart_speculative_web_search, claim_prefetch
+from utils.single_flight import get_single_flight, flight_key
+from utils.intent_router import get_intent_router
+from utils.tracing import start_trace, span
+
+load_dotenv()
+# Single pass: the RAG call classifies its own answer and a local pre-check picks KB vs web
+SINGLE_PASS_RAG = os.getenv("SINGLE_PASS_RAG", "true").lower() in ("1", "true", "yes")
+CHAT_MODES = ("insurance", "general")
+RESPONSE_MODES = ("concise", "detailed")
+INSURANCE_FALLBACK = "Sorry, couldn't find anything in policy documents or web."
+GENERAL_FALLBACK = "Sorry, couldn't find information on the web."
+
+
+# --- Insurance mode: knowledge base, falling back to the web ---
+def retrieve_chunks(user_input, k=5):
+    """KB retrieval, reusing one already started from a voice transcript (see utils/speech.py)."""
+    prefetched = claim_prefetch(user_input, k)
+    chunks = prefetched.result() if prefetched else None
+    return chunks if chunks is not None else get_relevant_chunks(user_input, k=k)
+
+async def aretrieve_chunks(user_input, k=5):
+    prefetched = claim_prefetch(user_input, k)
+    chunks = await prefetched.aresult() if prefetched else None
+    return chunks if chunks is not None else await aget_relevant_chunks(user_input, k=k)
+
+def retrieval_failed(user_input, error):
+    """A failed retrieval is treated like a failed KB answer: the web if the question is relevant, else the error."""
+    print(f"Retrieval failed: {error}")
+    return kb_failed(error, user_input)
+
+def answer_insurance_query(user_input, mode):
+    """Returns (reply, source) for insurance mode, falling back to the web when the KB can't answer."""
+    # Opt-in: the Tavily search runs while the KB path works, so a fallback costs max(KB, web)
+    speculative_search = start_speculative_web_search(user_input)
+
+    def web_answer():
+        search_response = speculative_search.result() if speculative_search else None
+        return answer_with_web_search(user_input, mode=mode, search_response=search_response) or INSURANCE_FALLBACK, "Web Search"
+
+    try:
+        if SINGLE_PASS_RAG:
+            try:
+                chunks = retrieve_chunks(user_input)
+            except Exception as e:
+                classification = retrieval_failed(user_input, e)
+            else:
+                if precheck_route(user_input, chunks) == "web":
+                    return web_answer()
+                classification = answer_with_knowledge_base(user_input, mode=mode, chunks=chunks,
+                                                            with_classification=True)
+            kb_response = classification["answer"]
+        else:
+            kb_result = answer_with_knowledge_base(user_input, mode=mode)
+            kb_response = kb_result if isinstance(kb_result, str) else str(kb_result)
+            classification = classify_response_and_relevance(kb_response, user_input)
+
+        if classification["response_class"] == "negative" and classification["is_relevant"] == "yes":
+            return web_answer()
+        return kb_response, "Knowledge Base"
+    finally:
+        if speculative_search:
+            speculative_search.discard()
+
+async def aanswer_insurance_query(user_input, mode):
+    """Coroutine version of answer_insurance_query, using the shared async clients."""
+    speculative_search = astart_speculative_web_search(user_input)
+
+    async def web_answer():
+        search_response = await speculative_search.result() if speculative_search else None
+        return await aanswer_with_web_search(user_input, mode=mode, search_response=search_response) or INSURANCE_FALLBACK, "Web Search"
+
+    try:
+        if SINGLE_PASS_RAG:
+            try:
+                chunks = await aretrieve_chunks(user_input)
+            except Exception as e:
+                classification = retrieval_failed(user_input, e)
+            else:
+                if precheck_route(user_input, chunks) == "web":
+                    return await web_answer()
+                classification = await aanswer_with_knowledge_base(user_input, mode=mode, chunks=chunks,
+                                                                   with_classification=True)
+            kb_response = classification["answer"]
+        else:
+            kb_result = await aanswer_with_knowledge_base(user_input, mode=mode)
+            kb_response = kb_result if isinstance(kb_result, str) else str(kb_result)
+            classification = await aclassify_response_and_relevance(kb_response, user_input)
+
+        if classification["response_class"] == "negative" and classification["is_relevant"] == "yes":
+            return await web_answer()
+        return kb_response, "Knowledge Base"
+    finally:
+        if speculative_search:
+            speculative_search.discard()
+
+def stream_insurance_answer(user_input, mode):
+    """Streaming answer_insurance_query: yields the response source first, then text deltas."""
+    speculative_search = start_speculative_web_search(user_input)
+
+    def web_stream():
+        search_response = speculative_search.result() if speculative_search else None
+        yield "Web Search"
+        empty = True
+        for delta in stream_answer_with_web_search(user_input, mode=mode, search_response=search_response):
+            empty = False
+            yield delta
+        if empty:
+            yield INSURANCE_FALLBACK
+
+    try:
+        if not SINGLE_PASS_RAG:
+            # The two-call flow has to see the whole KB answer before it can pick a source
+            reply, source = answer_insurance_query(user_input, mode)
+            yield source
+            yield reply
+            return
+
+        try:
+            chunks = retrieve_chunks(user_input)
+        except Exception as e:
+            failure = retrieval_failed(user_input, e)
+            kb_stream = (item for item in (failure, failure["answer"]))
+        else:
+            if precheck_route(user_input, chunks) == "web":
+                yield from web_stream()
+                return
+            kb_stream = stream_answer_with_knowledge_base(user_input, mode=mode, chunks=chunks,
+                                                          with_classification=True)
+        classification = next(kb_stream)
+        if classification["response_class"] == "negative" and classification["is_relevant"] == "yes":
+            kb_stream.close()
+            yield from web_stream()
+            return
+        yield "Knowledge Base"
+        yield from kb_stream
+    finally:
+        if speculative_search:
+            speculative_search.discard()
+
+
+# --- General mode: web only ---
+def answer_general_query(user_input, mode):
+    return answer_with_web_search(user_input, mode=mode) or GENERAL_FALLBACK, "Web Search"
+
+async def aanswer_general_query(user_input, mode):
+    return await aanswer_with_web_search(user_input, mode=mode) or GENERAL_FALLBACK, "Web Search"
+
+def stream_general_answer(user_input, mode):
+    yield "Web Search"
+    empty = True
+    for delta in stream_answer_with_web_search(user_input, mode=mode):
+        empty = False
+        yield delta
+    if empty:
+        yield GENERAL_FALLBACK
+
+
+# --- Shared steps ---
+def prepare_corpus():
+    """Sync the embedding index (skips unchanged PDFs) and rebuild stale FAQ answers in the background."""
+    from models.embeddings import ensure_corpus_ingested
+
+    ensure_corpus_ingested()
+    get_intent_router().ensure_answers(background=True)
+
+def cached_answer(answer_cache, user_input, mode, chat_mode):
+    with span("answer_cache") as record:
+        cached = answer_cache.get(user_input, mode, chat_mode)
+        record["cache_hit"] = cached is not None
+    return cached
+
+def resolve_answer(question, chat_mode, mode, conversation=None):
+    """
+    Everything before generation. Returns {"answer", "source", "query", "generated": False} when
+    the intent router or the answer cache can answer, else {"answer": None, "query": ...}, where
+    "query" is the question rewritten to stand alone (when a conversation is given).
+    """
+    # Small talk and FAQs are answered locally; the estimate feeds the llm_calls_avoided metric
+    llm_calls = 1 if chat_mode == "general" or SINGLE_PASS_RAG else 2
+    if routed := get_intent_router().route(question, chat_mode, mode, llm_calls_saved=llm_calls):
+        return {"answer": routed["reply"], "source": routed["source"], "query": question, "generated": False}
+    query = conversation.standalone_query(question) if conversation is not None else question
+    if cached := cached_answer(get_answer_cache(), query, mode, chat_mode):
+        return {"answer": cached["answer"], "source": cached["source"], "query": query, "generated": False}
+    return {"answer": None, "source": None, "query": query, "generated": True}
+
+def coalesced(key, fn):
+    """Concurrent identical questions across sessions share one computation (see utils/single_flight.py)."""
+    single_flight = get_single_flight()
+    return single_flight.do(key, fn) if single_flight else fn()
+
+def coalesced_stream(key, make_stream):
+    single_flight = get_single_flight()
+    return single_flight.stream(key, make_stream) if single_flight else make_stream()
+
+async def acoalesced(key, make_coro):
+    single_flight = get_single_flight()
+    return await single_flight.ado(key, make_coro) if single_flight else await make_coro()
+
+def generate_answer(query, chat_mode, mode):
+    """Returns (reply, source) from the insurance or general path (coalesced)."""
+    if chat_mode == "general":
+        return coalesced(flight_key(query, mode, chat_mode), lambda: answer_general_query(query, mode))
+    return coalesced(flight_key(query, mode, chat_mode), lambda: answer_insurance_query(query, mode))
+
+async def agenerate_answer(query, chat_mode, mode):
+    if chat_mode == "general":
+        return await acoalesced(flight_key(query, mode, chat_mode), lambda: aanswer_general_query(query, mode))
+    return await acoalesced(flight_key(query, mode, chat_mode), lambda: aanswer_insurance_query(query, mode))
+
+def stream_answer(query, chat_mode, mode):
+    """Streaming generate_answer: yields the source first, then text deltas."""
+    if chat_mode == "general":
+        return coalesced_stream(flight_key(query, mode, chat_mode), lambda: stream_general_answer(query, mode))
+    return coalesced_stream(flight_key(query, mode, chat_mode), lambda: stream_insurance_answer(query, mode))
+
+def record_answer(question, resolved, chat_mode, mode, answer, source, conversation=None):
+    """Cache a freshly generated answer and add the turn to the conversation (not error or busy replies)."""
+    if is_failed_reply(answer):
+        return
+    if resolved["generated"]:
+        get_answer_cache().put(resolved["query"], mode, chat_mode, answer, source)
+    if conversation is not None and source != "System":
+        conversation.add_turn(question, answer)
+
+
+# --- One-call entry points (API and batch) ---
+def _result(trace, question, resolved, answer, source):
+    return {
+        "question": question,
+        "query": resolved["query"],
+        "answer": answer,
+        "source": source,
+        "ok": not is_failed_reply(answer),
+        "timings": trace.breakdown(),
+        "total_seconds": trace.duration,
+    }
+
+def _check_modes(chat_mode, mode):
+    if chat_mode not in CHAT_MODES:
+        raise ValueError(f"chat_mode must be one of {CHAT_MODES}, got {chat_mode!r}")
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"mode must be one of {RESPONSE_MODES}, got {mode!r}")
+
+def answer_question(question, chat_mode="insurance", mode="concise", conversation=None):
+    """Answer one question end to end; returns {"question", "query", "answer", "source", "ok", "timings", "total_seconds"}."""
+    _check_modes(chat_mode, mode)
+    with start_trace("chat_message", chat_mode=chat_mode, response_mode=mode) as trace:
+        resolved = resolve_answer(question, chat_mode, mode, conversation)
+        answer, source = resolved["answer"], resolved["source"]
+        if answer is None:
+            answer, source = generate_answer(resolved["query"], chat_mode, mode)
+        record_answer(question, resolved, chat_mode, mode, answer, source, conversation)
+    return _result(trace, question, resolved, answer, source)
+
+async def aanswer_question(question, chat_mode="insurance", mode="concise", conversation=None):
+    """Coroutine version of answer_question; cache and rewrite steps run in worker threads."""
+    _check_modes(chat_mode, mode)
+    with start_trace("chat_message", chat_mode=chat_mode, response_mode=mode) as trace:
+        resolved = await asyncio.to_thread(resolve_answer, question, chat_mode, mode, conversation)
+        answer, source = resolved["answer"], resolved["source"]
+        if answer is None:
+            answer, source = await agenerate_answer(resolved["query"], chat_mode, mode)
+        await asyncio.to_thread(record_answer, question, resolved, chat_mode, mode, answer, source, conversation)
+    return _result(trace, question, resolved, answer, source)
@@ -1,123 +1,344 @@
 # rag_tool.py
 
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from openai import AzureOpenAI
-from langchain.prompts import PromptTemplate
+from functools import lru_cache
+from config.config import get_embeddings_vector, aget_embeddings_vector
+from config.clients import get_rag_openai_client, get_async_rag_openai_client
+from utils.retrievers import get_retriever
+from models.llm import (STATUS_LINE_INSTRUCTIONS, split_status_line, heuristic_classification,
+                        chat_completion, achat_completion, stream_chat_completion, failure_reply)
+from utils.tracing import span, traced
+from utils.context_packer import pack_context
+from utils.chunk_labels import label_chunk_type, query_chunk_filter, matches_filter
 
 # Load environment variables
 load_dotenv()
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
-AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
-INDEX_NAME = "index_field_1"
-
-# Azure Search client
-search_client = SearchClient(
-    endpoint=AZURE_SEARCH_ENDPOINT,
-    index_name=INDEX_NAME,
-    credential=AzureKeyCredential(AZURE_SEARCH_KEY)
-)
-
-# Azure OpenAI client
-llm_client = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version="2024-02-15-preview",
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-)
-TEMPLATES = {
-    "concise": PromptTemplate.from_template("""
+
+# Retrieval settings: "keyword" (BM25 only) or "hybrid" (BM25 + k-NN fused with RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RRF_K = int(os.getenv("RRF_K", "60"))
+RRF_KEYWORD_WEIGHT = float(os.getenv("RRF_KEYWORD_WEIGHT", "1.0"))
+RRF_VECTOR_WEIGHT = float(os.getenv("RRF_VECTOR_WEIGHT", "1.0"))
+RETRIEVAL_CANDIDATES_FACTOR = int(os.getenv("RETRIEVAL_CANDIDATES_FACTOR", "3"))
+# Eligibility-style questions prefer chunks labelled "eligibility" at ingestion
+RETRIEVAL_INTENT_FILTER = os.getenv("RETRIEVAL_INTENT_FILTER", "true").lower() in ("1", "true", "yes")
+# With an intent, this many times k candidates are fetched once and filtered locally
+RETRIEVAL_FILTER_CANDIDATES_FACTOR = int(os.getenv("RETRIEVAL_FILTER_CANDIDATES_FACTOR", "4"))
+
+# Shared pool so the query embedding runs alongside the keyword search
+_retrieval_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
+# Prompt templates; langchain is only imported when the first prompt is built
+TEMPLATE_TEXTS = {
+    "concise": """
 You are a helpful AI assistant. Always include the policy names. Using only the following context, answer the user's question briefly and clearly.
 
 Context:
 {context}
 
 Question: {question}
-Answer (concise):"""),
-    "detailed": PromptTemplate.from_template("""
+Answer (concise):""",
+    "detailed": """
 You are a helpful AI assistant. Always include the policy names. Using only the following context, answer the user's question in a detailed and informative manner.
 
 Context:
 {context}
 
 Question: {question}
-Answer (detailed):""")
+Answer (detailed):"""
 }
 
-def get_relevant_chunks(query: str, k: int = 5) -> list:
-    """Search Azure Cognitive Search for top-k relevant documents with the policy names."""
-    results = search_client.search(
-        search_text=query,
-        top=k,
-        include_total_count=False
+
+@lru_cache(maxsize=None)
+def get_template(mode: str):
+    from langchain.prompts import PromptTemplate
+
+    return PromptTemplate.from_template(TEMPLATE_TEXTS[mode])
+
+def keyword_search(query: str, k: int, filters: dict = None) -> list:
+    """BM25 full-text search on the configured backend (RETRIEVER_BACKEND)."""
+    return get_retriever().keyword_search(query, k, filters)
+
+
+def vector_search(vector: list, k: int, filters: dict = None) -> list:
+    """k-NN search over chunk embeddings on the configured backend (RETRIEVER_BACKEND)."""
+    return get_retriever().vector_search(vector, k, filters)
+
+
+def reciprocal_rank_fusion(ranked_lists: list, weights: list, k: int = RRF_K) -> list:
+    """Fuse ranked result lists: score(d) = sum(weight / (k + rank)). Returns docs best-first."""
+    scores, docs = {}, {}
+    for results, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(results, start=1):
+            doc_id = doc["id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+            docs.setdefault(doc_id, doc)
+    fused = []
+    for doc_id in sorted(scores, key=scores.get, reverse=True):
+        fused.append({**docs[doc_id], "@search.score": scores[doc_id]})
+    return fused
+
+
+def hybrid_search(query: str, k: int, filters: dict = None) -> list:
+    """Keyword + vector search fused with RRF. The query embedding overlaps the keyword call."""
+    candidates = k * RETRIEVAL_CANDIDATES_FACTOR
+    vector_future = _retrieval_pool.submit(traced(get_embeddings_vector), query)
+    keyword_results = keyword_search(query, candidates, filters)
+    try:
+        vector_results = vector_search(vector_future.result(), candidates, filters)
+    except Exception as e:
+        print(f"Vector search failed, using keyword results only: {e}")
+        return keyword_results[:k]
+    fused = reciprocal_rank_fusion(
+        [keyword_results, vector_results],
+        [RRF_KEYWORD_WEIGHT, RRF_VECTOR_WEIGHT],
+    )
+    return fused[:k]
+
+
+async def ahybrid_search(query: str, k: int, filters: dict = None) -> list:
+    """Async hybrid_search: embedding and keyword search run concurrently on the event loop."""
+    retriever = get_retriever()
+    candidates = k * RETRIEVAL_CANDIDATES_FACTOR
+    vector, keyword_results = await asyncio.gather(
+        aget_embeddings_vector(query), retriever.akeyword_search(query, candidates, filters), return_exceptions=True
     )
+    if isinstance(keyword_results, Exception):
+        raise keyword_results
+    try:
+        if isinstance(vector, Exception):
+            raise vector
+        vector_results = await retriever.avector_search(vector, candidates, filters)
+    except Exception as e:
+        print(f"Vector search failed, using keyword results only: {e}")
+        return keyword_results[:k]
+    fused = reciprocal_rank_fusion(
+        [keyword_results, vector_results],
+        [RRF_KEYWORD_WEIGHT, RRF_VECTOR_WEIGHT],
+    )
+    return fused[:k]
+
+
+def intent_filters(query: str):
+    return query_chunk_filter(query) if RETRIEVAL_INTENT_FILTER else None
+
+
+def top_up(results: list, fallback: list, k: int) -> list:
+    """Filtered results first, then unfiltered ones not already included, up to k."""
+    seen = {doc.get("id") or doc["content"] for doc in results}
+    return results + [doc for doc in fallback if (doc.get("id") or doc["content"]) not in seen][:k - len(results)]
+
+
+def matches_intent(doc: dict, filters: dict) -> bool:
+    # Older index entries have no chunk_type field; they are labelled here, as in to_chunks
+    return matches_filter({**doc, "chunk_type": doc.get("chunk_type") or label_chunk_type(doc["content"])}, filters)
+
+
+def prefer_intent(candidates: list, filters: dict, k: int) -> tuple:
+    """(top k with matching chunks first, whether fewer than k matched) from one candidate list."""
+    matching = [doc for doc in candidates if matches_intent(doc, filters)][:k]
+    return top_up(matching, candidates, k), len(matching) < k
 
+
+def get_relevant_chunks(query: str, k: int = 5, mode: str = None) -> list:
+    """
+    Search the configured retriever backend for top-k relevant documents with the policy names.
+    When the query has an intent (see utils.chunk_labels), one search fetches k x
+    RETRIEVAL_FILTER_CANDIDATES_FACTOR candidates; chunks matching the intent come first and the
+    rest of the k are filled from the same candidates, so a sparse label costs no extra round trip.
+    """
+    mode = (mode or RETRIEVAL_MODE).lower()
+    filters = intent_filters(query)
+    with span("retrieval", mode=mode, k=k, filters=filters) as record:
+        search = hybrid_search if mode == "hybrid" else keyword_search
+        if filters:
+            results, record["filter_fallback"] = prefer_intent(
+                search(query, k * RETRIEVAL_FILTER_CANDIDATES_FACTOR), filters, k)
+        else:
+            results = search(query, k)
+        record["results"] = len(results)
+    return to_chunks(results)
+
+
+async def aget_relevant_chunks(query: str, k: int = 5, mode: str = None) -> list:
+    """Coroutine version of get_relevant_chunks."""
+    mode = (mode or RETRIEVAL_MODE).lower()
+    filters = intent_filters(query)
+    with span("retrieval", mode=mode, k=k, filters=filters) as record:
+        search = ahybrid_search if mode == "hybrid" else get_retriever().akeyword_search
+        if filters:
+            results, record["filter_fallback"] = prefer_intent(
+                await search(query, k * RETRIEVAL_FILTER_CANDIDATES_FACTOR), filters, k)
+        else:
+            results = await search(query, k)
+        record["results"] = len(results)
+    return to_chunks(results)
+
+
+def to_chunks(results: list) -> list:
     matched_chunks = []
     for doc in results:
         content = doc["content"]
-        label = label_chunk_type(content)
-        policy_name = doc["source"] if "source" in doc else "Unnamed Policy"
+        # Labels are precomputed at ingestion; older index entries are labelled here
+        label = doc.get("chunk_type") or label_chunk_type(content)
+        policy_name = doc.get("policy_name") or doc.get("source") or "Unnamed Policy"
         matched_chunks.append({
+            "id": doc.get("id"),
             "content": content,
             "label": label,
-            "policy": policy_name
+            "policy": policy_name,
+            "page": doc.get("page"),
+            "score": doc.get("@search.score", 0.0)
         })
     return matched_chunks
 
 
-def label_chunk_type(text: str) -> str:
-    """Label the chunk based on its likely content."""
-    text = text.lower()
-    if "who can avail" in text or "eligibility" in text or "available for" in text or "age between" in text or "coverage" in text:
-        return "eligibility"
-    elif "premium" in text or "monthly premium" in text:
-        return "premium"
-    return "general"
+def build_kb_prompt(query: str, mode: str, chunks: list, with_classification: bool = False) -> str:
+    """Pick the chunks to use and format the RAG prompt."""
+    with span("prompt_build", chunks=len(chunks)) as record:
+        prompt, packing = _format_kb_prompt(query, mode, chunks, with_classification)
+        record["prompt_chars"] = len(prompt)
+        record.update(packing)
+    return prompt
+
+
+def _format_kb_prompt(query: str, mode: str, chunks: list, with_classification: bool) -> tuple:
+    # Retrieval normally applied this filter already; it still matters for chunks passed in by callers
+    filters = query_chunk_filter(query)
+    eligible_chunks = [c for c in chunks if c["label"] == filters["chunk_type"]] if filters else []
+    chunks_to_use = eligible_chunks or chunks
+
+    # Merged, de-duplicated and grouped per policy within CONTEXT_TOKEN_BUDGET
+    context, packing = pack_context(chunks_to_use[:5])
+    prompt = get_template(mode).format(context=context, question=query)
+    if with_classification:
+        prompt += "\n" + STATUS_LINE_INSTRUCTIONS
+    return prompt, packing
+
+
+def kb_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+# --- Answering ---
+# The sync, async and streaming variants share everything but the transport: the prompt
+# (kb_messages/build_kb_prompt), the reply shape (kb_result/kb_reply) and the error mapping (kb_failed).
+NO_KB_ANSWER = "I don't know based on the knowledge base."
 
 
+def kb_result(answer: str, query: str, with_classification: bool, classification: dict = None):
+    """The answer as returned to callers: text, or with classification a dict with "answer" added."""
+    if not with_classification:
+        return answer
+    return {"answer": answer, **(classification or heuristic_classification(answer, query))}
 
 
-def answer_with_knowledge_base(query: str, mode: str = "concise") -> str:
-    """Answer a query using the vector store (Azure Cognitive Search) and Azure OpenAI."""
+def kb_reply(content: str, query: str, with_classification: bool):
+    """Turn completion text into a kb_result, splitting off the status line when it was asked for."""
+    if not with_classification:
+        return content
+    classification, answer = split_status_line(content, query)
+    return kb_result(answer, query, True, classification)
 
+
+def kb_failed(error, query: str) -> dict:
+    """
+    A failed KB answer, classified negative so relevant questions still fall back to the web
+    (which may answer without an LLM call when the quota is exhausted).
+    """
+    return {"answer": failure_reply(error, "Error during RAG answering: "), "response_class": "negative",
+            "is_relevant": heuristic_classification("", query)["is_relevant"]}
+
+
+def kb_request(query: str, mode: str, chunks: list, with_classification: bool) -> list:
+    return kb_messages(build_kb_prompt(query, mode, chunks, with_classification))
+
+
+def answer_with_knowledge_base(query: str, mode: str = "concise", chunks: list = None,
+                               with_classification: bool = False):
+    """
+    Answer a query using the configured retriever and Azure OpenAI.
+
+    Pass already retrieved `chunks` to skip retrieval. With `with_classification=True` the
+    same completion also classifies the answer, and a dict with "answer", "response_class"
+    and "is_relevant" is returned instead of a string.
+    """
     try:
-        chunks = get_relevant_chunks(query, k=5)
+        if chunks is None:
+            chunks = get_relevant_chunks(query, k=5)
         if not chunks:
-            return "I don't know based on the knowledge base."
+            return kb_result(NO_KB_ANSWER, query, with_classification)
+        messages = kb_request(query, mode, chunks, with_classification)
+        return kb_reply(chat_completion("kb_answer", mode, messages, get_rag_openai_client), query, with_classification)
+    except Exception as e:
+        failure = kb_failed(e, query)
+        return failure if with_classification else failure["answer"]
 
 
-        if any(word in query.lower() for word in ["age", "eligible", "avail","policy", "child", "adult", "senior"]):
-            eligible_chunks = [c for c in chunks if c["label"] == "eligibility"]
-            if eligible_chunks:
-                chunks_to_use = eligible_chunks
-            else:
-                chunks_to_use = chunks
-        else:
-            chunks_to_use = chunks
+async def aanswer_with_knowledge_base(query: str, mode: str = "concise", chunks: list = None,
+                                      with_classification: bool = False):
+    """Coroutine version of answer_with_knowledge_base, using the shared async clients."""
+    try:
+        if chunks is None:
+            chunks = await aget_relevant_chunks(query, k=5)
+        if not chunks:
+            return kb_result(NO_KB_ANSWER, query, with_classification)
+        messages = kb_request(query, mode, chunks, with_classification)
+        content = await achat_completion("kb_answer", mode, messages, get_async_rag_openai_client)
+        return kb_reply(content, query, with_classification)
+    except Exception as e:
+        failure = kb_failed(e, query)
+        return failure if with_classification else failure["answer"]
 
-        #context = "\n\n".join(chunks[:5])
 
-        context = ""
-        used_policies = set()
+def stream_answer_with_knowledge_base(query: str, mode: str = "concise", chunks: list = None,
+                                      with_classification: bool = False):
+    """
+    Streaming variant of answer_with_knowledge_base; yields answer text deltas.
+
+    With `with_classification=True` the first item yielded is the classification dict
+    ({"response_class", "is_relevant"}), parsed from the status line before any answer
+    text is released; the caller can close() the generator if it wants to fall back.
+    """
+    classified = not with_classification
+    try:
+        if chunks is None:
+            chunks = get_relevant_chunks(query, k=5)
+        if not chunks:
+            if with_classification:
+                classified = True
+                yield heuristic_classification(NO_KB_ANSWER, query)
+            yield NO_KB_ANSWER
+            return
 
-        for c in chunks_to_use[:5]:
-            context += f"Policy: {c['policy']}\nContent: {c['content']}\n\n"
-            used_policies.add(c['policy'])
-        prompt = TEMPLATES[mode].format(context=context, question=query)
+        messages = kb_request(query, mode, chunks, with_classification)
+        deltas = stream_chat_completion("kb_answer", mode, messages, get_rag_openai_client)
+        if not with_classification:
+            yield from deltas
+            return
 
-        completion = llm_client.chat.completions.create(
-            model=AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-        )
-        return completion.choices[0].message.content.strip()
+        # Hold text back until the status line (first non-empty line) is complete
+        buffered = ""
+        for delta in deltas:
+            buffered += delta
+            if "\n" in buffered.lstrip() or len(buffered) > 200:
+                break
+        classification, answer = split_status_line(buffered, query)
+        classified = True
+        yield classification
+        if answer:
+            # split_status_line strips the text; keep trailing whitespace so the next delta joins correctly
+            yield answer + buffered[len(buffered.rstrip()):]
+        yield from deltas
 
     except Exception as e:
-        return f"Error during RAG answering: {e}"
+        failure = kb_failed(e, query)
+        if not classified:
+            yield {"response_class": failure["response_class"], "is_relevant": failure["is_relevant"]}
+        yield failure["answer"]
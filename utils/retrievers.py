@@ -0,0 +1,97 @@
+# retrievers.py
+
+import os
+import threading
+from dotenv import load_dotenv
+from utils.chunk_labels import to_odata_filter
+
+load_dotenv()
+INDEX_NAME = "index_field_1"
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "azure").lower()  # "azure" or "local"
+SEARCH_FIELDS = ["id", "content", "source", "chunk_type", "policy_name", "page"]
+# Filterable / facetable fields precomputed at ingestion (see utils.chunk_labels.chunk_metadata)
+FILTER_FIELDS = ("chunk_type", "policy_name", "page")
+
+
+class AzureSearchRetriever:
+    """
+    Retriever backed by the Azure Cognitive Search index. `filters` ({field: value}) become an
+    OData filter evaluated by the service before top-k (pre-filtering for vector queries).
+    """
+
+    name = "azure"
+
+    @property
+    def search_client(self):
+        from config.clients import get_search_client
+
+        return get_search_client(INDEX_NAME)
+
+    @staticmethod
+    def _filter_kwargs(filters):
+        odata = to_odata_filter(filters)
+        return {"filter": odata} if odata else {}
+
+    def keyword_search(self, query: str, k: int, filters: dict = None) -> list:
+        results = self.search_client.search(search_text=query, top=k, select=SEARCH_FIELDS, include_total_count=False,
+                                            **self._filter_kwargs(filters))
+        return [dict(doc) for doc in results]
+
+    def vector_search(self, vector: list, k: int, filters: dict = None) -> list:
+        from azure.search.documents.models import VectorizedQuery
+
+        vector_query = VectorizedQuery(vector=vector, k_nearest_neighbors=k, fields="content_vector")
+        results = self.search_client.search(search_text=None, vector_queries=[vector_query], top=k, select=SEARCH_FIELDS,
+                                            vector_filter_mode="preFilter", **self._filter_kwargs(filters))
+        return [dict(doc) for doc in results]
+
+    async def akeyword_search(self, query: str, k: int, filters: dict = None) -> list:
+        from config.clients import get_async_search_client
+
+        results = await get_async_search_client(INDEX_NAME).search(
+            search_text=query, top=k, select=SEARCH_FIELDS, include_total_count=False, **self._filter_kwargs(filters)
+        )
+        return [dict(doc) async for doc in results]
+
+    async def avector_search(self, vector: list, k: int, filters: dict = None) -> list:
+        from azure.search.documents.models import VectorizedQuery
+        from config.clients import get_async_search_client
+
+        vector_query = VectorizedQuery(vector=vector, k_nearest_neighbors=k, fields="content_vector")
+        results = await get_async_search_client(INDEX_NAME).search(
+            search_text=None, vector_queries=[vector_query], top=k, select=SEARCH_FIELDS,
+            vector_filter_mode="preFilter", **self._filter_kwargs(filters)
+        )
+        return [dict(doc) async for doc in results]
+
+    def upsert(self, docs: list) -> int:
+        return len(self.search_client.merge_or_upload_documents(documents=docs))
+
+    def delete(self, ids: list):
+        if ids:
+            self.search_client.delete_documents(documents=[{"id": doc_id} for doc_id in ids])
+
+    def ids(self) -> list:
+        """Every document id in the index (paged by the SDK)."""
+        return [doc["id"] for doc in self.search_client.search(search_text="*", select=["id"], include_total_count=False)]
+
+    def flush(self):
+        pass
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+def get_retriever():
+    """Process-wide retriever selected by RETRIEVER_BACKEND."""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            if RETRIEVER_BACKEND == "local":
+                # NumPy and the local index are only loaded when the local backend is used
+                from utils.local_index import LocalRetriever
+
+                _retriever = LocalRetriever()
+            else:
+                _retriever = AzureSearchRetriever()
+        return _retriever
@@ -0,0 +1,229 @@
+# single_flight.py
+# Process-wide request coalescing: concurrent identical questions (same normalized query, response
+# mode and chat mode) share one in-flight computation instead of each spending LLM/Tavily quota.
+
+import os
+import asyncio
+import threading
+from dotenv import load_dotenv
+from utils.answer_cache import normalize_query
+from utils.tracing import span, register_collector
+
+load_dotenv()
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "60"))  # follower wait before computing itself
+
+
+class FlightAbandoned(RuntimeError):
+    """The leader stopped before finishing (e.g. its Streamlit run was interrupted)."""
+
+
+class _Flight:
+    """One in-flight computation: streamed items so far, then a result or an error."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.items = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+    def publish(self, item):
+        with self.condition:
+            self.items.append(item)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result, self.error, self.done = result, error, True
+            self.condition.notify_all()
+
+    def wait(self, timeout):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.done, timeout)
+
+    def replay(self, timeout):
+        """Yield every item the leader publishes (earlier ones first); raises the leader's error."""
+        position = 0
+        while True:
+            with self.condition:
+                if not self.condition.wait_for(lambda: position < len(self.items) or self.done, timeout):
+                    raise TimeoutError("coalesced request timed out")
+                items, done = self.items[position:], self.done
+            position += len(items)
+            yield from items
+            if done and position == len(self.items):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+def flight_key(query, mode, chat_mode):
+    return f"{chat_mode}|{mode}|{normalize_query(query)}"
+
+
+class SingleFlight:
+    """
+    The first caller for a key becomes the leader and runs the work; callers arriving while it
+    runs wait for (or, when streaming, replay) its result. Nothing is kept once the leader
+    finishes, so this complements the answer cache rather than replacing it.
+    """
+
+    def __init__(self, timeout=SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "timeouts": 0, "abandoned": 0}
+
+    def _join(self, key, kind):
+        """
+        Returns (flight, is_leader). Result flights (do/ado) and stream flights are kept apart:
+        a streamed leader has no single return value and a returning one publishes no items.
+        """
+        key = (kind, key)
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = _Flight()
+                self.stats["leaders"] += 1
+                return flight, True
+            flight.followers += 1
+            self.stats["coalesced"] += 1
+            return flight, False
+
+    def _land(self, key, kind, flight):
+        key = (kind, key)
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def do(self, key, fn):
+        """Run fn() once per concurrent key; every caller gets the leader's return value (or error)."""
+        flight, leader = self._join(key, "result")
+        with span("single_flight", coalesced=not leader) as record:
+            if leader:
+                try:
+                    result = fn()
+                except Exception as e:
+                    flight.finish(error=e)
+                    raise
+                except BaseException:
+                    flight.finish(error=FlightAbandoned("leader was interrupted"))
+                    raise
+                else:
+                    flight.finish(result=result)
+                    return result
+                finally:
+                    self._land(key, "result", flight)
+                    record["followers"] = flight.followers
+            if not flight.wait(self.timeout):
+                self._count("timeouts")
+                record["timed_out"] = True
+                return fn()
+        if isinstance(flight.error, FlightAbandoned):
+            self._count("abandoned")
+            return fn()  # the leader was interrupted, not failed: compute independently
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    async def ado(self, key, make_coro):
+        """Coroutine version of do(); followers poll instead of blocking the event loop."""
+        flight, leader = self._join(key, "result")
+        with span("single_flight", coalesced=not leader) as record:
+            if leader:
+                try:
+                    result = await make_coro()
+                except Exception as e:
+                    flight.finish(error=e)
+                    raise
+                except BaseException:  # includes cancellation
+                    flight.finish(error=FlightAbandoned("leader was cancelled"))
+                    raise
+                else:
+                    flight.finish(result=result)
+                    return result
+                finally:
+                    self._land(key, "result", flight)
+                    record["followers"] = flight.followers
+            waited = 0.0
+            while not flight.done and waited < self.timeout:
+                await asyncio.sleep(0.01)
+                waited += 0.01
+            if not flight.done:
+                self._count("timeouts")
+                record["timed_out"] = True
+                return await make_coro()
+        if isinstance(flight.error, FlightAbandoned):
+            self._count("abandoned")
+            return await make_coro()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(self, key, make_stream):
+        """
+        Generator version of do(): the leader iterates make_stream() and publishes each item;
+        followers replay the same items as they arrive, so every session still streams.
+        """
+        flight, leader = self._join(key, "stream")
+        with span("single_flight", coalesced=not leader, stream=True):
+            pass  # marks the trace; the work itself is timed by the stream's own spans
+        if not leader:
+            yielded = False
+            try:
+                for item in flight.replay(self.timeout):
+                    yielded = True
+                    yield item
+                return
+            except (FlightAbandoned, TimeoutError) as e:
+                if isinstance(e, TimeoutError):
+                    self._count("timeouts")
+                if yielded:
+                    raise
+            yield from make_stream()
+            return
+
+        finished = False
+        try:
+            for item in make_stream():
+                flight.publish(item)
+                yield item
+            finished = True
+            flight.finish()
+        except Exception as e:
+            finished = True
+            flight.finish(error=e)
+            raise
+        finally:
+            if not finished:
+                # Closed early by the consumer: followers must not wait for items that never come
+                self._count("abandoned")
+                flight.finish(error=FlightAbandoned("leader stopped streaming"))
+            self._land(key, "stream", flight)
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.flights)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Process-wide SingleFlight, or None when SINGLE_FLIGHT_ENABLED is off."""
+    global _single_flight
+    if not SINGLE_FLIGHT_ENABLED:
+        return None
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+            register_collector(lambda: {f"chatbot_single_flight_{name}": value
+                                        for name, value in {**_single_flight.stats,
+                                                            "in_flight": _single_flight.in_flight()}.items()})
+        return _single_flight
@@ -0,0 +1,199 @@
+# speculative.py
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils.web_search_tool import search_web, asearch_web
+from utils.rag_tool import get_relevant_chunks
+from utils.answer_cache import normalize_query
+from utils.tracing import register_collector, traced, span
+
+load_dotenv()
+# Opt-in: start the Tavily search alongside KB retrieval/generation
+SPECULATIVE_WEB_SEARCH = os.getenv("SPECULATIVE_WEB_SEARCH", "false").lower() in ("1", "true", "yes")
+# Voice input: KB retrieval starts from a stable partial transcript, before the final one arrives
+SPEECH_PREFETCH = os.getenv("SPEECH_PREFETCH", "true").lower() in ("1", "true", "yes")
+SPEECH_PREFETCH_TTL = float(os.getenv("SPEECH_PREFETCH_TTL", "30"))  # unclaimed prefetches expire (s)
+
+_speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative-web")
+_stats_lock = threading.Lock()
+speculation_stats = {
+    "started": 0,    # speculative Tavily searches launched
+    "used": 0,       # results that were needed for the fallback
+    "cancelled": 0,  # cancelled before the request went out (no Tavily spend)
+    "wasted": 0,     # completed or in-flight searches whose results were discarded (extra Tavily spend)
+}
+
+
+def _count(stat):
+    with _stats_lock:
+        speculation_stats[stat] += 1
+
+
+class SpeculativeWebSearch:
+    """A Tavily search started ahead of time; either claimed with result() or discarded."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.settled = False
+        self.future = _speculation_pool.submit(traced(search_web), query)
+        _count("started")
+
+    def result(self):
+        """Block for the search response (None if the search itself failed)."""
+        self.settled = True
+        _count("used")
+        try:
+            return self.future.result()
+        except Exception as e:
+            print(f"Speculative web search failed: {e}")
+            return None
+
+    def discard(self):
+        if self.settled:
+            return
+        self.settled = True
+        _count("cancelled" if self.future.cancel() else "wasted")
+
+
+class AsyncSpeculativeWebSearch:
+    """SpeculativeWebSearch for coroutine callers: a task on the running loop, same accounting."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.settled = False
+        self.sent = False
+        self.task = asyncio.ensure_future(self._search())
+        _count("started")
+
+    async def _search(self):
+        self.sent = True
+        return await asearch_web(self.query)
+
+    async def result(self):
+        self.settled = True
+        _count("used")
+        try:
+            return await self.task
+        except Exception as e:
+            print(f"Speculative web search failed: {e}")
+            return None
+
+    def discard(self):
+        if self.settled:
+            return
+        self.settled = True
+        self.task.cancel()
+        # A task cancelled before its first step never sent the request
+        _count("wasted" if self.sent else "cancelled")
+
+
+def start_speculative_web_search(query: str):
+    """Returns a SpeculativeWebSearch when SPECULATIVE_WEB_SEARCH is on, else None."""
+    return SpeculativeWebSearch(query) if SPECULATIVE_WEB_SEARCH else None
+
+
+def astart_speculative_web_search(query: str):
+    """Returns an AsyncSpeculativeWebSearch (call from a coroutine) when SPECULATIVE_WEB_SEARCH is on, else None."""
+    return AsyncSpeculativeWebSearch(query) if SPECULATIVE_WEB_SEARCH else None
+
+
+def get_speculation_stats() -> dict:
+    with _stats_lock:
+        return dict(speculation_stats)
+
+
+register_collector(lambda: {f"chatbot_speculative_web_{name}": value for name, value in get_speculation_stats().items()})
+
+
+# --- Retrieval prefetch (voice input) ---
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-retrieval")
+_prefetched = {}  # (normalized query, k) -> SpeculativeRetrieval
+prefetch_stats = {
+    "started": 0,  # retrievals launched from a partial or final transcript
+    "used": 0,     # claimed by the answer path for the same query
+    "wasted": 0,   # discarded or expired (the final query differed)
+}
+
+
+def _count_prefetch(stat):
+    with _stats_lock:
+        prefetch_stats[stat] += 1
+
+
+class SpeculativeRetrieval:
+    """get_relevant_chunks started ahead of time; claimed by the answer path or discarded."""
+
+    def __init__(self, query: str, k: int):
+        self.query = query
+        self.started = time.monotonic()
+        self.future = _prefetch_pool.submit(traced(get_relevant_chunks), query, k)
+
+    def result(self):
+        """The chunks, or None if the prefetch failed (the caller then retrieves itself)."""
+        try:
+            return self.future.result()
+        except Exception as e:
+            print(f"Retrieval prefetch failed: {e}")
+            return None
+
+    async def aresult(self):
+        try:
+            return await asyncio.wrap_future(self.future)
+        except Exception as e:
+            print(f"Retrieval prefetch failed: {e}")
+            return None
+
+
+def _expire_prefetches(now):
+    for key in [key for key, entry in _prefetched.items() if now - entry.started > SPEECH_PREFETCH_TTL]:
+        _prefetched.pop(key).future.cancel()
+        _count_prefetch("wasted")
+
+
+def prefetch_chunks(query: str, k: int = 5):
+    """Start retrieval for query unless the same query is already prefetching; returns the entry."""
+    key = (normalize_query(query), k)
+    # Check and register under one lock so concurrent callers share a single retrieval;
+    # submit() only queues the work, so holding the lock for it is cheap
+    with _stats_lock:
+        _expire_prefetches(time.monotonic())
+        entry = _prefetched.get(key)
+        if entry is None:
+            entry = _prefetched[key] = SpeculativeRetrieval(query, k)
+            prefetch_stats["started"] += 1
+    return entry
+
+
+def discard_prefetch(query: str, k: int = 5):
+    with _stats_lock:
+        entry = _prefetched.pop((normalize_query(query), k), None)
+    if entry is not None:
+        entry.future.cancel()
+        _count_prefetch("wasted")
+
+
+def claim_prefetch(query: str, k: int = 5):
+    """The SpeculativeRetrieval started for this query (matched after normalization), or None."""
+    with _stats_lock:
+        if not _prefetched:
+            return None
+        entry = _prefetched.pop((normalize_query(query), k), None)
+    if entry is None:
+        return None
+    _count_prefetch("used")
+    with span("retrieval_prefetch", ready=entry.future.done(),
+              head_start=round(time.monotonic() - entry.started, 3)):
+        pass
+    return entry
+
+
+def get_prefetch_stats() -> dict:
+    with _stats_lock:
+        return {**prefetch_stats, "pending": len(_prefetched)}
+
+
+register_collector(lambda: {f"chatbot_retrieval_prefetch_{name}": value for name, value in get_prefetch_stats().items()})
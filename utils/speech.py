@@ -0,0 +1,308 @@
+# speech.py
+# Pluggable speech-to-text for voice questions. A Transcriber takes audio as uploaded bytes or
+# through a push stream and reports partial hypotheses as they arrive; once a partial has been
+# stable for a moment, KB retrieval for it starts (utils/speculative.py), so by the time the
+# final transcript lands the answer path usually finds its chunks ready.
+#
+#   SPEECH_BACKEND=azure  Azure Speech continuous recognition over a push stream (default)
+#   SPEECH_BACKEND=local  LocalTranscriber: UTF-8 text files stand in for recordings (tests, offline)
+
+import io
+import os
+import time
+import wave
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from dotenv import load_dotenv
+from utils.answer_cache import normalize_query
+from utils.speculative import SPEECH_PREFETCH, prefetch_chunks, discard_prefetch
+from utils.tracing import span
+
+load_dotenv()
+SPEECH_BACKEND = os.getenv("SPEECH_BACKEND", "azure").lower()
+SPEECH_LANGUAGE = os.getenv("SPEECH_LANGUAGE", "en-US")
+SPEECH_TIMEOUT = float(os.getenv("SPEECH_TIMEOUT", "30"))  # max wait for the final result after the audio ends
+# Silence that ends an utterance; lower means the final result arrives sooner after speech stops
+SPEECH_SEGMENTATION_SILENCE_MS = os.getenv("SPEECH_SEGMENTATION_SILENCE_MS", "500")
+SPEECH_CHUNK_BYTES = int(os.getenv("SPEECH_CHUNK_BYTES", "32000"))  # 1 s of 16 kHz 16-bit mono
+# A partial counts as stable once no new hypothesis arrived for this long
+SPEECH_STABLE_SECONDS = float(os.getenv("SPEECH_STABLE_SECONDS", "0.3"))
+SPEECH_PREFETCH_MIN_WORDS = int(os.getenv("SPEECH_PREFETCH_MIN_WORDS", "3"))
+# LocalTranscriber pacing: seconds per "spoken" word and trailing silence before the final result
+SPEECH_LOCAL_WORD_SECONDS = float(os.getenv("SPEECH_LOCAL_WORD_SECONDS", "0"))
+SPEECH_LOCAL_END_SILENCE_SECONDS = float(os.getenv("SPEECH_LOCAL_END_SILENCE_SECONDS", "0"))
+
+
+# --- Audio helpers ---
+def split_wav(audio: bytes):
+    """Returns ({"samples_per_second", "bits_per_sample", "channels"}, pcm) for WAV input, else (None, audio)."""
+    if not audio.startswith(b"RIFF"):
+        return None, audio
+    with wave.open(io.BytesIO(audio)) as wav:
+        audio_format = {"samples_per_second": wav.getframerate(), "bits_per_sample": wav.getsampwidth() * 8,
+                        "channels": wav.getnchannels()}
+        return audio_format, wav.readframes(wav.getnframes())
+
+
+# --- Interface ---
+class Transcription(ABC):
+    """One utterance being recognized: write() audio as it arrives, close() for the final text."""
+
+    def __init__(self, on_partial=None):
+        self.on_partial = on_partial
+        self.segments = []  # final text of each recognized phrase
+
+    def partial(self, hypothesis):
+        if self.on_partial and hypothesis:
+            self.on_partial(" ".join(self.segments + [hypothesis]))
+
+    def final(self, segment):
+        if segment:
+            self.segments.append(segment)
+
+    @property
+    def text(self):
+        return " ".join(self.segments)
+
+    @abstractmethod
+    def write(self, data: bytes):
+        """Feed the next chunk of audio."""
+
+    @abstractmethod
+    def close(self) -> str:
+        """End of audio: wait for the last phrase and return the full transcript."""
+
+
+class Transcriber(ABC):
+    """Speech-to-text backend. Subclasses implement start(); everything else is shared."""
+
+    @abstractmethod
+    def start(self, on_partial=None, audio_format=None) -> Transcription:
+        """Begin recognizing one utterance."""
+
+    def transcribe(self, audio: bytes, on_partial=None) -> str:
+        """Transcribe uploaded audio (WAV or raw 16 kHz 16-bit mono PCM)."""
+        audio_format, pcm = split_wav(audio)
+        transcription = self.start(on_partial, audio_format)
+        for offset in range(0, len(pcm), SPEECH_CHUNK_BYTES):
+            transcription.write(pcm[offset:offset + SPEECH_CHUNK_BYTES])
+        return transcription.close()
+
+    def transcribe_file(self, path, on_partial=None) -> str:
+        return self.transcribe(Path(path).read_bytes(), on_partial)
+
+
+# --- Azure Speech ---
+_speech_configs = {}
+_speech_config_lock = threading.Lock()
+
+def get_speech_config(subscription_key=None, region=None, language=SPEECH_LANGUAGE):
+    """One SpeechConfig per (key, region, language), reused by every recognizer."""
+    subscription_key = subscription_key or os.getenv("AZURE_SPEECH_KEY")
+    region = region or os.getenv("AZURE_REGION")
+    key = (subscription_key, region, language)
+    with _speech_config_lock:
+        if key not in _speech_configs:
+            # The Speech SDK is heavy; only load it when speech is actually used
+            import azure.cognitiveservices.speech as speechsdk
+
+            speech_config = speechsdk.SpeechConfig(subscription=subscription_key, region=region)
+            speech_config.speech_recognition_language = language
+            if SPEECH_SEGMENTATION_SILENCE_MS:
+                speech_config.set_property(speechsdk.PropertyId.Speech_SegmentationSilenceTimeoutMs,
+                                           SPEECH_SEGMENTATION_SILENCE_MS)
+            _speech_configs[key] = speech_config
+        return _speech_configs[key]
+
+
+class AzureTranscription(Transcription):
+    def __init__(self, speech_config, on_partial=None, audio_format=None):
+        import azure.cognitiveservices.speech as speechsdk
+
+        super().__init__(on_partial)
+        self.stopped = threading.Event()
+        self.error = None
+        stream_format = speechsdk.audio.AudioStreamFormat(**audio_format) if audio_format else None
+        self.stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        self.recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config,
+                                                     audio_config=speechsdk.audio.AudioConfig(stream=self.stream))
+        self.recognizer.recognizing.connect(lambda evt: self.partial(evt.result.text))
+        self.recognizer.recognized.connect(self._recognized)
+        self.recognizer.canceled.connect(self._canceled)
+        self.recognizer.session_stopped.connect(lambda evt: self.stopped.set())
+        self.recognizer.start_continuous_recognition_async().get()
+
+    def _recognized(self, evt):
+        import azure.cognitiveservices.speech as speechsdk
+
+        if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech:
+            self.final(evt.result.text)
+
+    def _canceled(self, evt):
+        import azure.cognitiveservices.speech as speechsdk
+
+        if evt.reason == speechsdk.CancellationReason.Error:
+            self.error = evt.error_details
+            print("Speech Recognition canceled:", evt.error_details)
+        self.stopped.set()
+
+    def write(self, data: bytes):
+        self.stream.write(data)
+
+    def close(self) -> str:
+        self.stream.close()  # end of audio: the recognizer flushes the last phrase and stops
+        if not self.stopped.wait(SPEECH_TIMEOUT):
+            print("Speech Recognition timed out waiting for the final result")
+        self.recognizer.stop_continuous_recognition_async().get()
+        return self.text
+
+
+class AzureTranscriber(Transcriber):
+    def __init__(self, subscription_key=None, region=None, language=SPEECH_LANGUAGE):
+        self.subscription_key, self.region, self.language = subscription_key, region, language
+
+    def start(self, on_partial=None, audio_format=None) -> Transcription:
+        speech_config = get_speech_config(self.subscription_key, self.region, self.language)
+        return AzureTranscription(speech_config, on_partial, audio_format)
+
+
+# --- Local stand-in ---
+class LocalTranscription(Transcription):
+    def __init__(self, on_partial=None, word_seconds=0.0, end_silence_seconds=0.0):
+        super().__init__(on_partial)
+        self.word_seconds, self.end_silence_seconds = word_seconds, end_silence_seconds
+        self.buffer = b""
+        self.words = []
+
+    def _hear(self, words):
+        for word in words:
+            time.sleep(self.word_seconds)
+            self.words.append(word)
+            self.partial(" ".join(self.words))
+
+    def write(self, data: bytes):
+        # Only whole words are "heard"; a trailing partial word waits for the next chunk
+        self.buffer += data
+        text = self.buffer.decode("utf-8", errors="ignore")
+        words = text.split()
+        if words and not text[-1].isspace():
+            self.buffer = words.pop().encode("utf-8")
+        else:
+            self.buffer = b""
+        self._hear(words)
+
+    def close(self) -> str:
+        self._hear(self.buffer.decode("utf-8", errors="ignore").split())
+        time.sleep(self.end_silence_seconds)
+        self.final(" ".join(self.words))
+        return self.text
+
+
+class LocalTranscriber(Transcriber):
+    """
+    File-based stand-in for tests and offline runs: the "audio" is UTF-8 text, heard one word
+    every word_seconds with end_silence_seconds before the final result (like a real recognizer).
+    transcribe_file() on a recording reads the transcript next to it (question.wav -> question.txt).
+    """
+
+    def __init__(self, word_seconds=SPEECH_LOCAL_WORD_SECONDS, end_silence_seconds=SPEECH_LOCAL_END_SILENCE_SECONDS):
+        self.word_seconds, self.end_silence_seconds = word_seconds, end_silence_seconds
+
+    def start(self, on_partial=None, audio_format=None) -> Transcription:
+        return LocalTranscription(on_partial, self.word_seconds, self.end_silence_seconds)
+
+    def transcribe_file(self, path, on_partial=None) -> str:
+        transcript = Path(path).with_suffix(".txt")
+        return super().transcribe_file(transcript if transcript.exists() else path, on_partial)
+
+
+_transcriber = None
+_transcriber_lock = threading.Lock()
+
+def get_transcriber() -> Transcriber:
+    """Process-wide transcriber; SPEECH_BACKEND=local selects the file-based stand-in."""
+    global _transcriber
+    with _transcriber_lock:
+        if _transcriber is None:
+            _transcriber = LocalTranscriber() if SPEECH_BACKEND == "local" else AzureTranscriber()
+        return _transcriber
+
+def set_transcriber(transcriber):
+    global _transcriber
+    with _transcriber_lock:
+        _transcriber = transcriber
+
+
+# --- Voice queries ---
+class PartialStabilizer:
+    """Calls on_stable(text) when a hypothesis of at least min_words has not changed for quiet_seconds."""
+
+    def __init__(self, on_stable, quiet_seconds=SPEECH_STABLE_SECONDS, min_words=SPEECH_PREFETCH_MIN_WORDS):
+        self.on_stable = on_stable
+        self.quiet_seconds, self.min_words = quiet_seconds, min_words
+        self.lock = threading.Lock()
+        self.timer = None
+        self.last_stable = None
+        self.closed = False
+
+    def update(self, hypothesis):
+        with self.lock:
+            if self.closed:
+                return
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.quiet_seconds, self._fire, (hypothesis,))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _fire(self, hypothesis):
+        with self.lock:
+            if self.closed or len(hypothesis.split()) < self.min_words or normalize_query(hypothesis) == self.last_stable:
+                return
+            self.last_stable = normalize_query(hypothesis)
+        self.on_stable(hypothesis)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.timer:
+                self.timer.cancel()
+
+
+def transcribe_voice_query(audio: bytes, transcriber=None, on_partial=None, prefetch=SPEECH_PREFETCH,
+                           conversation=None) -> str:
+    """
+    Transcribe a voice question. With prefetch on, KB retrieval starts from each stable partial
+    and from the final transcript; the answer path claims the one matching its query. Follow-ups
+    the conversation will rewrite are not prefetched: retrieval runs on the rewritten query.
+    """
+    prefetched = []
+
+    def wanted(hypothesis):
+        return not (conversation is not None and conversation.will_rewrite(hypothesis))
+
+    def stable(hypothesis):
+        if wanted(hypothesis):
+            prefetched.append(hypothesis)
+            prefetch_chunks(hypothesis)
+
+    stabilizer = PartialStabilizer(stable) if prefetch else None
+
+    def partial(hypothesis):
+        if stabilizer:
+            stabilizer.update(hypothesis)
+        if on_partial:
+            on_partial(hypothesis)
+
+    with span("transcription", prefetch=prefetch) as record:
+        text = (transcriber or get_transcriber()).transcribe(audio, on_partial=partial).strip()
+        record["words"] = len(text.split())
+    if stabilizer:
+        stabilizer.close()
+        if text and wanted(text):
+            prefetch_chunks(text)  # no-op when a stable partial already matched the final text
+        for hypothesis in prefetched:
+            if normalize_query(hypothesis) != normalize_query(text):
+                discard_prefetch(hypothesis)
+    return text
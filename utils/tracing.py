@@ -0,0 +1,266 @@
+# tracing.py
+# Lightweight per-request tracing: stage spans (wall time, tokens, cache hits) exported as
+# JSON lines and as Prometheus-style histograms on a local /metrics endpoint.
+
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", os.path.join(".cache", "traces.jsonl"))
+# The trace file is rotated at this size, keeping TRACE_LOG_BACKUPS old files (traces.jsonl.1, ...)
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_LOG_BACKUPS = int(os.getenv("TRACE_LOG_BACKUPS", "3"))
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables the /metrics endpoint
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_metrics_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+_histograms = {}  # (metric name, stage) -> Histogram
+_counters = {}    # (metric name, stage) -> float
+_collectors = []  # callables returning {metric name: value}
+
+
+def observe(metric, stage, value):
+    with _metrics_lock:
+        histogram = _histograms.get((metric, stage))
+        if histogram is None:
+            histogram = _histograms[(metric, stage)] = Histogram()
+        histogram.observe(value)
+
+
+def inc_counter(metric, stage, value=1):
+    with _metrics_lock:
+        _counters[(metric, stage)] = _counters.get((metric, stage), 0) + value
+
+
+def register_collector(collect):
+    """Register a callable returning {metric_name: number}; exported as gauges on /metrics."""
+    _collectors.append(collect)
+
+
+class Trace:
+    """One user request: a list of stage spans plus request-level attributes."""
+
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.spans = []
+        self.started = time.time()
+        self.duration = None
+        self.lock = threading.Lock()
+
+    def add_span(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def breakdown(self):
+        """Total seconds per stage, in first-seen order."""
+        totals = {}
+        with self.lock:
+            for span in self.spans:
+                totals[span["stage"]] = totals.get(span["stage"], 0.0) + span["duration"]
+        return totals
+
+    def total(self, key):
+        """Sum of a numeric span attribute (e.g. prompt_tokens) over the whole request."""
+        with self.lock:
+            return sum(span.get(key) or 0 for span in self.spans)
+
+    def to_dict(self):
+        with self.lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started": self.started,
+            "duration": self.duration,
+            **self.attrs,
+            "spans": spans,
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name, **attrs):
+    """Trace one request; every span() opened inside (same context) is attached to it."""
+    trace = Trace(name, **attrs)
+    token = _current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - started
+        _current_trace.reset(token)
+        if TRACING_ENABLED:
+            observe("chatbot_request_seconds", name, trace.duration)
+            write_trace(trace)
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Time one stage. The yielded dict can be updated with extra attributes such as
+    prompt_tokens, completion_tokens or cache_hit.
+    """
+    record = {"stage": stage, **attrs}
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = e.__class__.__name__
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - started
+        if TRACING_ENABLED:
+            observe("chatbot_stage_seconds", stage, record["duration"])
+            for key in ("prompt_tokens", "completion_tokens", "prompt_tokens_saved", "prompt_tokens_truncated"):
+                if record.get(key):
+                    inc_counter(f"chatbot_{key}_total", stage, record[key])
+            if "cache_hit" in record:
+                inc_counter("chatbot_cache_hits_total" if record["cache_hit"] else "chatbot_cache_misses_total", stage)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add_span(record)
+
+
+def record_usage(record, completion):
+    """Copy token usage from an OpenAI completion (if reported) into a span record."""
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        record["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+        record["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+
+def traced(fn):
+    """
+    Wrap fn so it runs in the caller's context (current trace) when submitted to a thread pool.
+    Each call gets its own copy: one Context can't be entered by two threads at once (pool.map).
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def rotate_log(path, backups=TRACE_LOG_BACKUPS):
+    """path -> path.1 -> ... -> path.<backups>; the oldest is dropped (no backups: just truncate)."""
+    for index in range(backups - 1, 0, -1):
+        if os.path.exists(f"{path}.{index}"):
+            os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+    if backups > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+
+def write_trace(trace, path=None, max_bytes=None):
+    path = path or TRACE_LOG_PATH
+    max_bytes = TRACE_LOG_MAX_BYTES if max_bytes is None else max_bytes
+    if not path:
+        return
+    try:
+        line = json.dumps(trace.to_dict(), default=str) + "\n"
+        with _log_lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if max_bytes and os.path.exists(path) and os.path.getsize(path) + len(line) > max_bytes:
+                rotate_log(path)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Could not write trace: {e}")
+
+
+# --- Prometheus exposition ---
+def render_prometheus():
+    lines = []
+    with _metrics_lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    seen = set()
+    for (metric, stage), histogram in histograms:
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} histogram")
+            seen.add(metric)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{metric}_sum{{stage="{stage}"}} {histogram.total:.6f}')
+        lines.append(f'{metric}_count{{stage="{stage}"}} {histogram.count}')
+    for (metric, stage), value in counters:
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f'{metric}{{stage="{stage}"}} {value}')
+    for collect in _collectors:
+        try:
+            for metric, value in collect().items():
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+_metrics_server = None
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on localhost:port from a daemon thread (idempotent; port 0 disables it)."""
+    global _metrics_server
+    if not port:
+        return None
+    with _metrics_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _metrics_server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Metrics available at http://127.0.0.1:{port}/metrics")
+        return _metrics_server
@@ -0,0 +1,110 @@
+# web_cache.py
+
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from utils.answer_cache import normalize_query
+
+load_dotenv()
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", os.path.join(".cache", "tavily_cache.json"))
+WEB_CACHE_TTL_SECONDS = float(os.getenv("WEB_CACHE_TTL_SECONDS", str(6 * 3600)))
+WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", "2000"))
+WEB_CACHE_SAVE_INTERVAL = float(os.getenv("WEB_CACHE_SAVE_INTERVAL", "5"))
+
+
+class WebSearchCache:
+    """
+    Tavily responses keyed on the normalized query, shared by every session. Entries expire
+    after a TTL (web results go stale), are evicted LRU-first and persisted to disk.
+    """
+
+    def __init__(self, path=WEB_CACHE_PATH, ttl_seconds=WEB_CACHE_TTL_SECONDS, max_entries=WEB_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> {"created", "response"}
+        self.stats = {"hits": 0, "misses": 0}
+        self._last_save = 0.0
+        self._dirty = False
+        self.load()
+
+    def get(self, query):
+        key = normalize_query(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry["created"] <= self.ttl_seconds:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry["response"]
+            if entry is not None:
+                del self.entries[key]
+                self._dirty = True
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, query, response):
+        if not isinstance(response, dict) or not response.get("results"):
+            return  # never cache empty or unexpected responses
+        with self.lock:
+            key = normalize_query(query)
+            self.entries[key] = {"created": time.time(), "response": response}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._dirty = True
+        self.save(force=False)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self.lock:
+            for key, entry in data.get("entries", []):
+                if now - entry["created"] <= self.ttl_seconds:
+                    self.entries[key] = entry
+
+    def save(self, force=True):
+        """Persist to disk; unforced saves are throttled to WEB_CACHE_SAVE_INTERVAL."""
+        with self.lock:
+            if not self._dirty or (not force and time.time() - self._last_save < WEB_CACHE_SAVE_INTERVAL):
+                return
+            data = {"entries": list(self.entries.items())}
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, default=str)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Web search cache could not be saved: {e}")
+
+
+_web_cache = None
+_web_cache_lock = threading.Lock()
+
+def get_web_cache():
+    """Process-wide Tavily cache, or None when WEB_CACHE_ENABLED is off."""
+    global _web_cache
+    if not WEB_CACHE_ENABLED:
+        return None
+    with _web_cache_lock:
+        if _web_cache is None:
+            _web_cache = WebSearchCache()
+            atexit.register(_web_cache.save)
+            from utils.tracing import register_collector
+
+            register_collector(lambda: {f"chatbot_web_cache_{name}": value
+                                        for name, value in {**_web_cache.stats,
+                                                            "entries": len(_web_cache.entries)}.items()})
+        return _web_cache
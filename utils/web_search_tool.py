@@ -1,13 +1,140 @@
-from config.config import client, openai_client  # Azure OpenAI client assumed configured here
-from langchain_core.tools import tool
+import os
+import re
+from dotenv import load_dotenv
+from config.clients import get_tavily_client, get_async_tavily_client, get_openai_client, get_async_openai_client
+from models.llm import chat_completion, achat_completion, stream_chat_completion, failure_reply
+from utils.tracing import span
+from utils.web_cache import get_web_cache
 
-def answer_with_web_search(query: str, mode: str) -> str:
+load_dotenv()
+# Concise answers use Tavily's own answer (no LLM call) when it is at least this long
+WEB_ANSWER_MIN_CHARS = int(os.getenv("WEB_ANSWER_MIN_CHARS", "80"))
+WEB_SYNTHESIS_RESULTS = int(os.getenv("WEB_SYNTHESIS_RESULTS", "4"))
+WEB_RESULT_MAX_CHARS = int(os.getenv("WEB_RESULT_MAX_CHARS", "1200"))
+
+def _field(item, name, default=None):
+    return item.get(name, default) if isinstance(item, dict) else getattr(item, name, default)
+
+def search_web(query: str):
+    """Runs the Tavily search on its own so it can be started ahead of (or alongside) other work."""
+    cache = get_web_cache()
+    with span("tavily_search") as record:
+        if cache is not None:
+            cached = cache.get(query)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+        response = get_tavily_client().search(
+            query=query,
+            search_depth="basic",
+            max_results=5,
+            include_answer=True
+        )
+    if cache is not None:
+        cache.put(query, response)
+    return response
+
+async def asearch_web(query: str):
+    cache = get_web_cache()
+    with span("tavily_search") as record:
+        if cache is not None:
+            cached = cache.get(query)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+        response = await get_async_tavily_client().search(
+            query=query,
+            search_depth="basic",
+            max_results=5,
+            include_answer=True
+        )
+    if cache is not None:
+        cache.put(query, response)
+    return response
+
+def _url_key(url: str) -> str:
+    url = re.sub(r"^https?://(www\.)?", "", (url or "").strip().lower())
+    return url.split("#")[0].rstrip("/")
+
+def top_results(response) -> list:
+    """Up to WEB_SYNTHESIS_RESULTS results with content, without repeated URLs or repeated text."""
+    results = _field(response, "results", []) or []
+    seen_urls, seen_texts, top = set(), set(), []
+    for result in results:
+        content = " ".join((_field(result, "content", "") or "").split())
+        url = _field(result, "url", "") or ""
+        text_key = content.lower()[:300]
+        if not content or (url and _url_key(url) in seen_urls) or text_key in seen_texts:
+            continue
+        seen_urls.add(_url_key(url))
+        seen_texts.add(text_key)
+        top.append({"title": _field(result, "title", "") or url, "url": url,
+                    "content": content[:WEB_RESULT_MAX_CHARS]})
+        if len(top) >= WEB_SYNTHESIS_RESULTS:
+            break
+    return top
+
+def format_sources(results: list) -> str:
+    links = [f"{i}. [{r['title']}]({r['url']})" for i, r in enumerate(results, start=1) if r["url"]]
+    return "\n\n**Sources:**\n\n" + "\n".join(links) if links else ""
+
+def shortcut_answer(response, mode: str):
+    """Tavily's own answer for concise mode, when present and long enough to stand alone."""
+    answer = (_field(response, "answer", "") or "").strip()
+    if mode.lower() == "concise" and len(answer) >= WEB_ANSWER_MIN_CHARS:
+        return answer
+    return None
+
+def build_web_prompt(response, mode: str, query: str = None) -> tuple:
+    """Returns (prompt, None), or (None, message) when the search gave nothing usable."""
+    if not (_field(response, "results", []) or []):
+        return None, "No results found from web search."
+    results = top_results(response)
+    if not results:
+        return None, "The search result did not return valid content."
+
+    # One synthesis call over the de-duplicated top results
+    context = "\n\n".join(f"[{i}] {r['title']} ({r['url']})\n{r['content']}" for i, r in enumerate(results, start=1))
+    if mode.lower() == "concise":
+        instruction = "Using only the numbered web results below, give a concise 2-3 sentence answer"
+    else:
+        instruction = ("Using only the numbered web results below, give a detailed answer, "
+                       "aiming for clarity and completeness")
+    question = f" to the question: {query}" if query else ""
+    prompt = f"{instruction}{question}\nCite the results you use as [n].\n\n{context}"
+    return prompt, None
+
+def prepare_web_answer(response, mode: str, query: str = None) -> tuple:
+    """
+    Returns (prompt, text, sources). Exactly one of prompt / text is set: text is a final
+    answer needing no LLM call (Tavily's answer, or a no-results message).
+    """
+    sources = format_sources(top_results(response))
+    shortcut = shortcut_answer(response, mode)
+    if shortcut is not None:
+        with span("web_answer_shortcut", chars=len(shortcut)):
+            return None, shortcut + sources, sources
+    prompt, message = build_web_prompt(response, mode, query)
+    return prompt, message, sources
+
+def web_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant that answers questions from web search results."},
+        {"role": "user", "content": prompt}
+    ]
+
+def web_failed(error) -> str:
+    print(f"⚠️ Error: {error}")
+    return failure_reply(error, "Error: ")
+
+def answer_with_web_search(query: str, mode: str, search_response=None) -> str:
     """
     Executes a web search using Tavily and returns a concise or detailed response using Azure OpenAI.
 
     Args:
         query (str): Search term.
         mode (str): 'concise' or 'detailed'.
+        search_response: Optional Tavily response already fetched (e.g. speculatively).
 
     Returns:
         str: Final formatted response.
@@ -17,41 +144,44 @@ def answer_with_web_search(query: str, mode: str) -> str:
         print(f"📌 Mode: {mode}")
 
         # Step 1: Tavily search
-        response = client.search(
-            query=query,
-            search_depth="basic",
-            max_results=5,
-            include_answer=True
-        )
-
-        # Get top result content
-        results = response.get("results", []) if isinstance(response, dict) else getattr(response, "results", [])
-        if not results:
-            return "No results found from web search."
-
-        content = results[0].get("content", "") if isinstance(results[0], dict) else getattr(results[0], "content", "")
-        if not content:
-            return "The search result did not return valid content."
-
-        # Step 2: Use Azure OpenAI to transform result
-        if mode.lower() == "concise":
-            prompt = f"Summarize the following content in a concise 2-3 sentence answer:\n\n{content}"
-        else:
-            prompt = f"Expand and elaborate the following content in more detail, aiming for clarity and completeness:\n\n{content}"
-
-        completion = openai_client.chat.completions.create(
-            model="gpt-35-turbo",  # Replace with your actual Azure deployment name
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that reformats web search content."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+        response = search_response if search_response is not None else search_web(query)
 
-        final_answer = completion.choices[0].message.content.strip()
+        # Step 2: Tavily's own answer, or one Azure OpenAI synthesis over the top results
+        prompt, text, sources = prepare_web_answer(response, mode, query)
+        if prompt is None:
+            return text
+        final_answer = chat_completion("web_answer", mode, web_messages(prompt), get_openai_client)
         print(f"✅ Transformed ({mode}) response generated.")
-        return final_answer
+        return final_answer + sources
+
+    except Exception as e:
+        return web_failed(e)
+
+async def aanswer_with_web_search(query: str, mode: str, search_response=None) -> str:
+    """Coroutine version of answer_with_web_search, using the shared async clients."""
+    try:
+        print(f"🔍 Query: {query}")
+        response = search_response if search_response is not None else await asearch_web(query)
+        prompt, text, sources = prepare_web_answer(response, mode, query)
+        if prompt is None:
+            return text
+        return await achat_completion("web_answer", mode, web_messages(prompt), get_async_openai_client) + sources
+
+    except Exception as e:
+        return web_failed(e)
+
+def stream_answer_with_web_search(query: str, mode: str, search_response=None):
+    """Streaming variant of answer_with_web_search; yields answer text deltas."""
+    try:
+        print(f"🔍 Query (streaming): {query}")
+        response = search_response if search_response is not None else search_web(query)
+        prompt, text, sources = prepare_web_answer(response, mode, query)
+        if prompt is None:
+            yield text
+            return
+        yield from stream_chat_completion("web_answer", mode, web_messages(prompt), get_openai_client)
+        if sources:
+            yield sources
 
     except Exception as e:
-        print(f"⚠️ Error: {e}")
-        return f"Error: {str(e)}"
+        yield web_failed(e)